@@ -0,0 +1,212 @@
+# File: batch.py
+
+import asyncio
+import os
+import re
+
+import file_handler
+import text_processor
+import translator
+import scheduler
+import job_journal
+
+BOOK_EXTENSIONS = (".epub", ".pdf")
+
+def find_source_books(source_dir):
+    """Returns the EPUB and PDF files in `source_dir`, sorted by name."""
+    if not os.path.isdir(source_dir):
+        return []
+    return sorted(
+        os.path.join(source_dir, name) for name in os.listdir(source_dir)
+        if name.lower().endswith(BOOK_EXTENSIONS) and os.path.isfile(os.path.join(source_dir, name))
+    )
+
+def batch_output_base(book_filepath, target_language_name):
+    """Output base filename for one (book, language) pair, e.g. 'The_Tale_of_Genji_Hindi_Translation'."""
+    stem = os.path.splitext(os.path.basename(book_filepath))[0]
+    stem = re.sub(r'\W+', '_', stem).strip('_') or "book"
+    return f"{stem}_{target_language_name}_Translation"
+
+def chunk_book_once(book_filepath, target_language_codes, max_input_tokens, max_output_tokens, workers=None,
+                    strip_repeated_lines=False, min_duplicate_paragraph_chars=None):
+    """
+    Extracts and chunks a book once for all of its target languages. The output budget
+    is sized for the most expansive of them, so every translation fits the output limit.
+    With `min_duplicate_paragraph_chars`, repeated paragraphs become chunks of their own
+    (see text_processor.RepeatedParagraphFilter).
+    """
+    chunking_code = max(target_language_codes, key=lambda code: text_processor.OUTPUT_EXPANSION_BY_LANGUAGE.get(code, text_processor.DEFAULT_OUTPUT_EXPANSION))
+    segments = file_handler.iter_book_text(book_filepath, workers=workers, strip_repeated_lines=strip_repeated_lines)
+    repeated_paragraphs = text_processor.RepeatedParagraphFilter(min_duplicate_paragraph_chars) if min_duplicate_paragraph_chars else None
+    return list(text_processor.iter_chunks_by_tokens(segments, max_input_tokens, max_output_tokens, chunking_code, repeated_paragraphs=repeated_paragraphs))
+
+class BatchJob:
+    """One (book, target language) pair of a batch and its outcome."""
+
+    def __init__(self, book_filepath, language, output_dir, output_format, priority=0):
+        self.book_filepath = book_filepath
+        self.language_name = language["name"]
+        self.language_code = language["code"]
+        self.priority = priority
+        self.output_base = batch_output_base(book_filepath, self.language_name)
+        self.output_filepath = os.path.join(output_dir, f"{self.output_base}.{output_format.lower()}")
+        self.journal_filepath = os.path.join(output_dir, f"{self.output_base}.journal.jsonl")
+        self.engine = None
+        self.prompt_tokens = None  # translator.PromptContext.token_report() once the job ran
+        self.requests_granted = 0  # Share of the batch's rate budget the job used
+        self.tokens_granted = 0
+        self.file_saved = False
+        self.error = ""
+
+    @property
+    def label(self):
+        return f"{os.path.basename(self.book_filepath)} -> {self.language_name}"
+
+class BatchTranslator:
+    """
+    Translates every book in a list into every target language, one output per pair.
+    Each book is extracted and chunked once; its language jobs then run concurrently and
+    share one FairShareRateLimiter, CircuitBreaker and cache, so together they stay inside
+    the API quota. Jobs are granted requests by priority and then fairly. At most
+    `max_books_in_memory` books are held as chunks at once; the next book is extracted
+    while earlier ones are still translating.
+    `config` uses the same keys as main.py's CONFIG, plus "batch_languages" (a list of
+    {"name", "code", "priority"} dicts) and optional "batch_book_priorities" (file name ->
+    priority) and "max_books_in_memory".
+    """
+
+    def __init__(self, model, config, cache=None, output_dir="translated_books", resume=False):
+        self.model = model
+        self.config = config
+        self.cache = cache
+        self.output_dir = output_dir
+        self.resume = resume
+        self.languages = config["batch_languages"]
+        self.rate_limiter = scheduler.FairShareRateLimiter(config["requests_per_minute"], config["tokens_per_minute"])
+        self.circuit_breaker = scheduler.CircuitBreaker()
+        self.jobs = []
+
+    def _job_fingerprint(self, job, prompt_context):
+        return job_journal.compute_job_fingerprint(job.book_filepath, {
+            "model": self.config["gemini_model_name"],
+            "target_language_code": job.language_code,
+            "chunking_language_codes": sorted(language["code"] for language in self.languages),
+            "max_input_tokens_per_chunk": self.config["max_input_tokens_per_chunk"],
+            "max_output_tokens_per_chunk": self.config["max_output_tokens_per_chunk"],
+            "prompt_version": prompt_context.prompt_version,
+            "strip_pdf_headers_footers": self.config.get("strip_pdf_headers_footers", False),
+            "min_duplicate_paragraph_chars": self._min_duplicate_paragraph_chars(),
+        })
+
+    def _min_duplicate_paragraph_chars(self):
+        return self.config.get("min_duplicate_paragraph_chars", 40) if self.config.get("deduplicate_paragraphs") else None
+
+    async def _run_job(self, job, chunks):
+        """Translates one book's chunks into one language and writes the output file."""
+        prompt_context = translator.PromptContext(job.language_name, job.language_code, self.config.get("glossary"), self.config.get("style_notes", ""))
+        journal = job_journal.open_job_journal(job.journal_filepath, self._job_fingerprint(job, prompt_context), resume=self.resume)
+        if not journal:
+            job.error = "journal belongs to a different job"
+            return
+        if self.config.get("use_context_cache"):
+            prompt_context.register(self.model, self.config["context_cache_ttl_seconds"], self.config["context_cache_min_prefix_tokens"])
+        limiter = self.rate_limiter.for_job(job.label, priority=job.priority)
+        job.engine = scheduler.TranslationEngine(
+            self.model,
+            job.language_name,
+            job.language_code,
+            limiter,
+            max_concurrency=self.config["max_concurrent_requests"],
+            cache=self.cache,
+            model_name=self.config["gemini_model_name"],
+            pack_chunk_tokens=self.config["pack_small_chunks_below_tokens"],
+            max_pack_tokens=self.config["max_tokens_per_packed_request"],
+            max_output_tokens=self.config["max_output_tokens_per_chunk"],
+            max_attempts=self.config["max_attempts_per_chunk"],
+            circuit_breaker=self.circuit_breaker,
+            verbose=self.config.get("verbose_chunk_logs", False),
+            prompt_context=prompt_context,
+            deduplicate_chunks=self.config.get("deduplicate_paragraphs", True)
+        )
+        book_title = job.output_base.replace('_', ' ')
+        writer = file_handler.open_book_writer(self.config["output_format"], job.output_filepath, job.language_code, book_title, self.config["author_name"],
+                                                 self.config.get("pdf_font_path"), self.config.get("pdf_bold_font_path"))
+        if not writer:
+            journal.close()
+            limiter.close()
+            prompt_context.release()
+            job.error = "cannot create the output file"
+            return
+
+        def record_chunk(index, result):
+            journal.record_result(index, chunks[index], result)
+        def plan_chunk(index, chunk):
+            journal.record_planned_chunk(index, chunk)
+            return journal.completed_translation(index, chunk)
+
+        print(f"  ▶️ Started: {job.label} ({len(chunks)} chunk(s), priority {job.priority})")
+        try:
+            async for index, result in job.engine.translate_stream(chunks, on_result=record_chunk, completed_lookup=plan_chunk, max_buffered_chunks=len(chunks)):
+                writer.write_part(result.output_text(chunks[index]))
+            job.file_saved = writer.close()
+        except Exception as e:
+            job.error = f"{type(e).__name__} - {e}"
+            writer.abort()
+        finally:
+            journal.close()
+            limiter.close()
+            prompt_context.release()
+            job.prompt_tokens = prompt_context.token_report()
+            job.requests_granted = limiter.requests_granted
+            job.tokens_granted = limiter.tokens_granted
+        status = "✅ Finished" if job.file_saved else "❌ Failed"
+        failed = f", {job.engine.failed_chunks} failed chunk(s)" if job.engine.failed_chunks else ""
+        print(f"  {status}: {job.label} ({job.engine.requests_sent} request(s){failed}){' - ' + job.error if job.error else ''}")
+
+    async def run(self, book_filepaths):
+        """Runs every (book, language) job and returns the list of BatchJobs."""
+        loop = asyncio.get_running_loop()
+        language_codes = [language["code"] for language in self.languages]
+        book_priorities = self.config.get("batch_book_priorities", {})
+        book_slots = asyncio.Semaphore(max(1, self.config.get("max_books_in_memory", 2)))
+        running = []
+
+        async def run_book_jobs(book_jobs, chunks):
+            try:
+                await asyncio.gather(*(self._run_job(job, chunks) for job in book_jobs))
+            finally:
+                book_slots.release()
+
+        for book_filepath in book_filepaths:
+            book_name = os.path.basename(book_filepath)
+            book_jobs = [
+                BatchJob(book_filepath, language, self.output_dir, self.config["output_format"],
+                         priority=language.get("priority", 0) + book_priorities.get(book_name, 0))
+                for language in self.languages
+            ]
+            self.jobs.extend(book_jobs)
+            await book_slots.acquire()
+            print(f"📖 Extracting and chunking {book_name} once for {len(book_jobs)} language(s)...")
+            try:
+                chunks = await loop.run_in_executor(None, lambda: chunk_book_once(
+                    book_filepath, language_codes,
+                    self.config["max_input_tokens_per_chunk"], self.config["max_output_tokens_per_chunk"],
+                    self.config["extraction_workers"],
+                    strip_repeated_lines=self.config.get("strip_pdf_headers_footers", False),
+                    min_duplicate_paragraph_chars=self._min_duplicate_paragraph_chars()
+                ))
+                error = "no text chunks were created"
+            except Exception as e:
+                chunks = []
+                error = f"extraction failed: {type(e).__name__} - {e}"
+                print(f"❌ ERROR: Could not extract {book_name}: {type(e).__name__} - {e}")
+            if not chunks:
+                for job in book_jobs:
+                    job.error = error
+                book_slots.release()
+                continue
+            running.append(asyncio.create_task(run_book_jobs(book_jobs, chunks)))
+            del chunks
+
+        await asyncio.gather(*running)
+        return self.jobs
@@ -0,0 +1,217 @@
+# File: benchmark.py
+
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import textwrap
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import file_handler
+import text_processor
+import scheduler
+import fake_gemini
+
+_WORDS = (
+    "the of and to in was he that it his her with as had for she not but at on him be by which "
+    "have this from all they were so or one been would their said there when we what could an "
+    "prince lady court night moon autumn letter poem garden palace river heart sleeve robe"
+).split()
+
+def generate_book_text(size_mb, seed=0, line_width=None):
+    """
+    Generates a synthetic book of roughly `size_mb` megabytes of text with '## ' chapter
+    headings and paragraphs of varying length. With `line_width`, paragraphs are hard-wrapped
+    like the extracted text of a typical PDF.
+    """
+    rng = random.Random(seed)
+    target_chars = int(size_mb * 1024 * 1024)
+    parts, total_chars, chapter = [], 0, 0
+    while total_chars < target_chars:
+        chapter += 1
+        parts.append(f"## Chapter {chapter}")
+        for _ in range(rng.randint(20, 60)):
+            sentences = []
+            for _ in range(rng.randint(1, 8)):
+                words = [rng.choice(_WORDS) for _ in range(rng.randint(5, 25))]
+                sentences.append(" ".join(words).capitalize() + rng.choice(".?!"))
+            paragraph = " ".join(sentences)
+            if line_width:
+                paragraph = "\n".join(textwrap.wrap(paragraph, line_width))
+            parts.append(paragraph)
+            total_chars += len(paragraph) + 2
+    return "\n\n".join(parts)
+
+def write_source_book(text, book_format, output_filepath):
+    """Writes synthetic text as an EPUB or PDF source book using the regular writers."""
+    if book_format == "epub":
+        writer = file_handler.EpubBookWriter(output_filepath, "en", "Benchmark Book", "Benchmark")
+    else:
+        writer = file_handler.PdfBookWriter(output_filepath)
+    writer.write_part(text)
+    return writer.close()
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    self_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(self_peak, 1), round(children_peak, 1)
+
+@contextlib.contextmanager
+def _timed_phase(phases, name, quiet=True):
+    """
+    Times one phase with the pipeline's console output silenced. The RSS peaks are those of
+    the book's process so far; while tracemalloc runs, the phase's own Python heap peak is
+    reported too.
+    """
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+    self_peak, children_peak = _peak_rss_mb()
+    phases[name] = {"seconds": round(elapsed, 3), "peak_rss_mb": self_peak, "peak_children_rss_mb": children_peak}
+    if tracemalloc.is_tracing():
+        phases[name]["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+
+def benchmark_book(size_mb, book_format, args, work_dir):
+    """Runs every phase over one generated book and returns its measurements."""
+    if args.trace_memory:
+        tracemalloc.start()
+    phases = {}
+    source_filepath = os.path.join(work_dir, f"bench_{size_mb}mb.{book_format}")
+    with _timed_phase(phases, "generate_source"):
+        text = generate_book_text(size_mb, seed=args.seed, line_width=90 if book_format == "pdf" else None)
+        write_source_book(text, book_format, source_filepath)
+        del text
+
+    with _timed_phase(phases, "extraction"):
+        segments = list(file_handler.iter_book_text(source_filepath, workers=args.extraction_workers))
+    extracted_chars = sum(len(segment) for segment in segments)
+
+    with _timed_phase(phases, "chunking"):
+        chunks = list(text_processor.iter_chunks_by_tokens(
+            segments, args.max_input_tokens, args.max_output_tokens, args.target_language_code
+        ))
+    del segments
+
+    model = fake_gemini.FakeGenerativeModel(
+        latency_seconds=args.latency,
+        latency_distribution=args.latency_distribution,
+        latency_spread=args.latency_spread,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        block_rate=args.block_rate,
+        expansion_ratio=args.expansion_ratio,
+        retry_after_seconds=args.retry_after,
+        seed=args.seed
+    )
+    engine = scheduler.TranslationEngine(
+        model,
+        "Benchmark",
+        args.target_language_code,
+        scheduler.RateLimiter(args.requests_per_minute, args.tokens_per_minute),
+        max_concurrency=args.concurrency,
+        pack_chunk_tokens=args.pack_below_tokens,
+        max_pack_tokens=args.max_pack_tokens,
+        max_output_tokens=args.max_output_tokens,
+        base_retry_delay=args.base_retry_delay,
+        circuit_breaker=scheduler.CircuitBreaker(base_pause_seconds=args.base_retry_delay)
+    )
+    with _timed_phase(phases, "translation"):
+        translated_parts = asyncio.run(engine.translate_chunks(chunks))
+
+    for output_format in ("epub", "pdf"):
+        output_filepath = os.path.join(work_dir, f"bench_{size_mb}mb_out.{output_format}")
+        with _timed_phase(phases, f"reconstruction_{output_format}"):
+            writer = file_handler.open_book_writer(output_format.upper(), output_filepath, args.target_language_code, "Benchmark Book", "Benchmark",
+                                                   args.pdf_font_path, args.pdf_bold_font_path)
+            for part in translated_parts:
+                writer.write_part(part)
+            writer.close()
+        phases[f"reconstruction_{output_format}"]["output_bytes"] = os.path.getsize(output_filepath) if os.path.exists(output_filepath) else 0
+
+    translation_seconds = phases["translation"]["seconds"]
+    return {
+        "size_mb": size_mb,
+        "source_format": book_format,
+        "source_bytes": os.path.getsize(source_filepath),
+        "extracted_chars": extracted_chars,
+        "chunks": len(chunks),
+        "chunks_per_second": round(len(chunks) / translation_seconds, 2) if translation_seconds else None,
+        "extraction_mb_per_second": round(extracted_chars / 1024 / 1024 / phases["extraction"]["seconds"], 2) if phases["extraction"]["seconds"] else None,
+        "requests": {
+            "sent": engine.requests_sent,
+            "retries": engine.retries,
+            "requeued_chunks": engine.requeued_chunks,
+            "failed_chunks": engine.failed_chunks,
+            "fake_model": model.stats,
+        },
+        "phases": phases,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the translation pipeline against a local fake Gemini model.")
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1.0], help="Generated book sizes in MB (e.g. 1 10 50).")
+    parser.add_argument("--formats", nargs="+", default=["epub", "pdf"], choices=["epub", "pdf"], help="Source formats to generate.")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+    parser.add_argument("--work-dir", help="Directory for generated books (default: a temporary directory).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extraction-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--target-language-code", default="hi")
+    parser.add_argument("--max-input-tokens", type=int, default=2500)
+    parser.add_argument("--max-output-tokens", type=int, default=8192)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests-per-minute", type=int, default=0, help="0 disables the limit.")
+    parser.add_argument("--tokens-per-minute", type=int, default=0, help="0 disables the limit.")
+    parser.add_argument("--pack-below-tokens", type=int, default=500)
+    parser.add_argument("--max-pack-tokens", type=int, default=4000)
+    parser.add_argument("--base-retry-delay", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean fake API latency in seconds.")
+    parser.add_argument("--latency-distribution", default="lognormal", choices=["constant", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with a 503.")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with a 429.")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="Fraction of requests blocked for safety.")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="retry_delay the fake 429s ask for, in seconds.")
+    parser.add_argument("--pdf-font-path", help="TTF/OTF font for the PDF reconstruction (needed to shape Indic scripts).")
+    parser.add_argument("--pdf-bold-font-path")
+    parser.add_argument("--expansion-ratio", type=float, default=1.2, help="Output length / input length of the fake translation.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Report each phase's own Python heap peak (tracemalloc; slows every phase down).")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        results = []
+        for size_mb in args.sizes:
+            for book_format in args.formats:
+                print(f"Benchmarking {size_mb} MB {book_format.upper()}...", file=sys.stderr)
+                # A fresh process per book, so its RSS peaks are not those of an earlier, larger book
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                    results.append(executor.submit(benchmark_book, size_mb, book_format, args, work_dir).result())
+
+    report = {"created": time.time(), "python": sys.version.split()[0], "settings": vars(args), "results": results}
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report_json + "\n")
+        print(f"Benchmark report written to {args.output}", file=sys.stderr)
+    else:
+        print(report_json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# File: epub_roundtrip.py
+
+import os
+import posixpath
+import re
+import shutil
+import zipfile
+import xml.etree.ElementTree as ET
+from collections import deque
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+# Elements whose text is translated as one segment, when they hold no other block inside
+SEGMENT_TAGS = ["title", "h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "blockquote", "dt", "dd",
+                "td", "th", "caption", "figcaption", "div", "pre"]
+_SKIP_TAGS = ["script", "style", "svg", "math"]
+_DOCUMENT_MEDIA_TYPES = ("application/xhtml+xml", "text/html")
+_CONTAINER_NS = {"c": "urn:oasis:names:tc:opendocument:xmlns:container"}
+_OPF_NS = {"opf": "http://www.idpf.org/2007/opf"}
+
+def _default_xml_parser():
+    """lxml's XML parser keeps XHTML (and inline SVG attribute case) intact; html.parser is the fallback."""
+    try:
+        import lxml  # noqa: F401
+        return 'xml'
+    except ImportError:
+        print("    WARNING: lxml is not installed; parsing EPUB documents with html.parser, which lowercases "
+              "attribute names (e.g. SVG viewBox) and can break inline SVG. Install lxml (see requirements.txt).")
+        return 'html.parser'
+
+def _normalize_segment(text):
+    """Collapses whitespace within each line; the newlines left are the segment's line breaks."""
+    return "\n".join(" ".join(line.split()) for line in text.split("\n")).strip("\n")
+
+def _iter_run_nodes(run):
+    """The nodes of a segment run (sibling nodes) and all of their descendants, in document order."""
+    for node in run:
+        yield node
+        if isinstance(node, Tag):
+            yield from node.descendants
+
+def _is_text_node(node):
+    """Translatable text: no comments, doctypes or processing instructions, nothing inside script/style/svg/math."""
+    return type(node) in (NavigableString, CData) and not node.find_parent(_SKIP_TAGS)
+
+def _segment_text(run):
+    """
+    The run's text with a space between text nodes and a newline for every <br/>;
+    inside <pre> the source newlines are line breaks too, elsewhere they are just whitespace.
+    """
+    pieces = []
+    for node in _iter_run_nodes(run):
+        if getattr(node, "name", None) == "br":
+            pieces.append("\n")
+        elif _is_text_node(node):
+            pieces.append(str(node) if node.find_parent("pre") else " ".join(node.split()))
+    return _normalize_segment(" ".join(pieces))
+
+def _contains_segments(node):
+    return isinstance(node, Tag) and node.name not in _SKIP_TAGS and (node.name in SEGMENT_TAGS or node.find(SEGMENT_TAGS) is not None)
+
+def read_epub_documents(epub_zip):
+    """Returns the zip paths of the package's XHTML documents: spine order first, then the rest (e.g. nav)."""
+    container = ET.fromstring(epub_zip.read("META-INF/container.xml"))
+    opf_path = container.find(".//c:rootfile", _CONTAINER_NS).get("full-path")
+    opf_dir = posixpath.dirname(opf_path)
+    opf = ET.fromstring(epub_zip.read(opf_path))
+    documents = {}
+    for item in opf.findall(".//opf:manifest/opf:item", _OPF_NS):
+        if item.get("media-type") in _DOCUMENT_MEDIA_TYPES:
+            documents[item.get("id")] = posixpath.normpath(posixpath.join(opf_dir, item.get("href")))
+    ordered = [documents.pop(itemref.get("idref")) for itemref in opf.findall(".//opf:spine/opf:itemref", _OPF_NS)
+               if itemref.get("idref") in documents]
+    return opf_path, ordered + sorted(documents.values())
+
+class EpubDocument:
+    """
+    One XHTML document of the package and its segment map: the runs of sibling nodes whose
+    text is translated together. A segment element without segment elements inside is one
+    run; the text of a mixed-content element (e.g. a TOC <li> holding a nested <ol>, or a
+    <div> with loose text between its <p>s) is split into runs around the nested blocks.
+    """
+
+    def __init__(self, path, content, parser):
+        self.path = path
+        self.soup = BeautifulSoup(content, parser)
+        self.runs = []
+        self._collect_runs(self.soup)
+        self.segments = [_segment_text(run) for run in self.runs]
+        self.translations = []
+
+    def _collect_runs(self, element):
+        """Adds the segment runs of `element` to self.runs, in document order."""
+        if element.name in SEGMENT_TAGS and not element.find(SEGMENT_TAGS):
+            self._add_run([element])
+            return
+        run = []
+        for child in element.children:
+            if _contains_segments(child):
+                self._add_run(run)
+                run = []
+                self._collect_runs(child)
+            else:
+                run.append(child)
+        self._add_run(run)
+
+    def _add_run(self, run):
+        if any(_is_text_node(node) and node.strip() for node in _iter_run_nodes(run)):
+            self.runs.append(run)
+
+    def apply_translations(self, target_language_code):
+        """Writes the translations into the runs' text nodes and returns the serialized document."""
+        for run, translated_text in zip(self.runs, self.translations):
+            text_nodes = [node for node in _iter_run_nodes(run) if _is_text_node(node) and node.strip()]
+            if not text_nodes:
+                continue
+            # The first text node takes the whole translation; inline formatting inside the
+            # run cannot be mapped onto the translated words, so later nodes are emptied.
+            # Line breaks go back as <br/> (as newlines inside <pre>) in place of the original ones
+            first = text_nodes[0]
+            in_pre = first.find_parent("pre") is not None
+            line_breaks = [node for node in _iter_run_nodes(run) if getattr(node, "name", None) == "br" and not node.find_parent(_SKIP_TAGS)]
+            for line_break in line_breaks:
+                line_break.decompose()
+            for node in text_nodes[1:]:
+                node.replace_with(NavigableString(""))
+            leading = first[:len(first) - len(first.lstrip())]
+            if in_pre:
+                first.replace_with(NavigableString(leading + translated_text))
+                continue
+            lines = translated_text.split("\n")
+            node = NavigableString(leading + lines[0])
+            first.replace_with(node)
+            for line in lines[1:]:
+                line_break = self.soup.new_tag("br")
+                node.insert_after(line_break)
+                node = NavigableString(line)
+                line_break.insert_after(node)
+        root = self.soup.find("html")
+        if root is not None:
+            root["lang"] = target_language_code
+            if root.get("xml:lang") is not None:
+                root["xml:lang"] = target_language_code
+        return str(self.soup).encode("utf-8")
+
+class EpubRoundTripWriter:
+    """
+    Translates an EPUB in place of its text: every other entry (spine, CSS, images, fonts,
+    TOC) is copied from the original package unchanged, and each XHTML document is written
+    back as soon as the translations of all of its segments have arrived.
+    iter_segments() yields the segment texts of all documents in order (it may run in a
+    background thread); feed one translation per segment, in the same order, to
+    write_part(). close() completes the package and returns True on success.
+    With `split_segment` (a callable segment -> (parts, separators), e.g. a partial of
+    text_processor.split_segment_by_tokens), a segment too large for one request is
+    yielded as several parts, and their translations are joined back before writing.
+    """
+
+    def __init__(self, source_filepath, output_filepath, target_language_code, parser=None, split_segment=None):
+        self.source_filepath = source_filepath
+        self.output_filepath = output_filepath
+        self.target_language_code = target_language_code
+        self.parser = parser or _default_xml_parser()
+        self.split_segment = split_segment
+        self.split_segments = 0  # Segments sent as several parts
+        self.failed = False
+        self.documents_written = 0
+        self._source = zipfile.ZipFile(source_filepath)
+        self.opf_path, self.document_paths = read_epub_documents(self._source)
+        self._pending = deque()  # Parsed documents waiting for translations, in segment order
+        self._separators = deque()  # Per segment yielded, the separators between its parts
+        self._translated_parts = []  # Translations of the parts of the current segment
+        self._output = zipfile.ZipFile(output_filepath, "w")
+        self._copy_package()
+
+    def _copy_package(self):
+        """Copies everything except the documents; the mimetype entry must come first and stay uncompressed."""
+        document_paths = set(self.document_paths)
+        entries = sorted(self._source.infolist(), key=lambda info: info.filename != "mimetype")
+        for info in entries:
+            if info.filename in document_paths:
+                continue
+            if info.filename == "mimetype":
+                self._output.writestr(info, self._source.read(info), compress_type=zipfile.ZIP_STORED)
+            elif info.filename == self.opf_path:
+                opf = self._source.read(info).decode("utf-8")
+                opf = re.sub(r'(<dc:language[^>]*>)[^<]*(</dc:language>)', rf'\g<1>{self.target_language_code}\g<2>', opf)
+                self._output.writestr(info, opf.encode("utf-8"))
+            else:
+                with self._source.open(info) as source, self._output.open(info, "w") as target:
+                    shutil.copyfileobj(source, target, 1024 * 1024)
+
+    def iter_segments(self):
+        """Parses the documents one at a time and yields their segment texts in order."""
+        for path in self.document_paths:
+            document = EpubDocument(path, self._source.read(path), self.parser)
+            self._pending.append(document)
+            for segment in document.segments:
+                parts, separators = self.split_segment(segment) if self.split_segment else ([segment], [])
+                if separators:
+                    self.split_segments += 1
+                self._separators.append(separators)
+                yield from parts
+
+    def _write_ready_documents(self):
+        while self._pending and len(self._pending[0].translations) == len(self._pending[0].segments):
+            document = self._pending.popleft()
+            if self.failed:
+                continue
+            try:
+                info = self._source.getinfo(document.path)
+                self._output.writestr(info, document.apply_translations(self.target_language_code), compress_type=zipfile.ZIP_DEFLATED)
+                self.documents_written += 1
+            except Exception as e:
+                print(f"    ERROR writing {document.path} to {os.path.basename(self.output_filepath)}: {e}")
+                self.failed = True
+
+    def write_part(self, translated_segment):
+        """Takes the translation of the next segment (part); writes its document once it is complete."""
+        self._write_ready_documents()  # Documents without text ahead of this segment
+        if not self._pending or not self._separators:
+            raise RuntimeError("More translated segments than source segments.")
+        self._translated_parts.append(translated_segment.strip())
+        separators = self._separators[0]
+        if len(self._translated_parts) <= len(separators):
+            return
+        self._separators.popleft()
+        joined = self._translated_parts[0] + "".join(separator + part for separator, part in zip(separators, self._translated_parts[1:]))
+        self._translated_parts = []
+        self._pending[0].translations.append(_normalize_segment(joined))
+        self._write_ready_documents()
+
+    def close(self):
+        self._write_ready_documents()
+        ok = not self.failed and not self._pending
+        if not ok and self._pending:
+            print(f"    ERROR: {len(self._pending)} document(s) of {os.path.basename(self.output_filepath)} were not translated.")
+        self._source.close()
+        self._output.close()
+        if not ok:
+            os.remove(self.output_filepath)
+            return False
+        split_note = f", {self.split_segments} oversized block(s) translated in parts" if self.split_segments else ""
+        print(f"    EPUB reconstruction complete: {os.path.basename(self.output_filepath)} ({self.documents_written} document(s), original structure kept{split_note})")
+        return True
+
+    def abort(self):
+        self._source.close()
+        self._output.close()
+        if os.path.exists(self.output_filepath):
+            os.remove(self.output_filepath)
@@ -0,0 +1,221 @@
+# File: fake_gemini.py
+
+import asyncio
+import json
+import math
+import random
+import re
+import time
+
+import translator
+
+# Exceptions named like google.api_core's, so translator.classify_exception treats them the same way
+class ResourceExhausted(Exception):
+    code = 429
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+class _PromptFeedback:
+    def __init__(self, block_reason=None):
+        self.block_reason = block_reason
+
+class _UsageMetadata:
+    def __init__(self, prompt_token_count, candidates_token_count, cached_content_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.cached_content_token_count = cached_content_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    """The parts of a generate_content response that translator.py reads."""
+
+    def __init__(self, text, block_reason=None, prompt_token_count=0, candidates_token_count=0, cached_content_token_count=0):
+        self.text = text
+        self.prompt_feedback = _PromptFeedback(block_reason)
+        self.usage_metadata = _UsageMetadata(prompt_token_count, candidates_token_count, cached_content_token_count)
+
+def _count_tokens(text):
+    return len(text) // 4
+
+class FakeCachedContent:
+    """Handle of a prompt prefix held in the fake context cache."""
+
+    def __init__(self, name, prefix, ttl_seconds):
+        self.name = name
+        self.prefix = prefix
+        self.ttl_seconds = ttl_seconds
+        self.deleted = False
+
+    def delete(self):
+        self.deleted = True
+
+class _CachedPrefixModel:
+    """A FakeGenerativeModel bound to a cached prefix, like GenerativeModel.from_cached_content."""
+
+    def __init__(self, base_model, cached_content):
+        self.base_model = base_model
+        self.cached_content = cached_content
+        self.model_name = base_model.model_name
+
+    def generate_content(self, prompt):
+        time.sleep(self.base_model._latency())
+        return self.base_model._respond(prompt, cached_prefix=self.cached_content.prefix)
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self.base_model._latency())
+        return self.base_model._respond(prompt, cached_prefix=self.cached_content.prefix)
+
+class FakeGenerativeModel:
+    """
+    Local stand-in for genai.GenerativeModel for benchmarks and offline runs.
+    It "translates" the segment(s) in a prompt by stretching every line to
+    `expansion_ratio` times its length, keeping '## ' headings, paragraph breaks and
+    packed-segment markers. Latency, error, 429 and safety-block rates are configurable.
+    create_cached_content() stands in for API context caching; `stats` counts the prompt
+    tokens billed for prefixes sent inline, served from the cache, and per-chunk suffixes
+    (tokens are estimated as characters / 4).
+    latency_distribution is one of "constant", "uniform", "exponential" or "lognormal";
+    latency_seconds is its mean and latency_spread its spread (uniform half-width or
+    lognormal sigma).
+    """
+
+    def __init__(self, model_name="fake-gemini", latency_seconds=0.05, latency_distribution="lognormal", latency_spread=0.5,
+                 error_rate=0.0, rate_limit_rate=0.0, block_rate=0.0, expansion_ratio=1.2, retry_after_seconds=1.0, seed=None):
+        self.model_name = model_name
+        self.latency_seconds = latency_seconds
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.block_rate = block_rate
+        self.expansion_ratio = expansion_ratio
+        self.retry_after_seconds = retry_after_seconds
+        self._random = random.Random(seed)
+        self.stats = {"requests": 0, "rate_limited": 0, "errors": 0, "blocked": 0, "prompt_chars": 0, "output_chars": 0,
+                      "inline_prefix_tokens": 0, "cached_prefix_tokens": 0, "suffix_tokens": 0, "cached_contents_created": 0}
+        self._cached_contents = 0
+
+    def _latency(self):
+        mean = self.latency_seconds
+        if mean <= 0 or self.latency_distribution == "constant":
+            return max(0.0, mean)
+        if self.latency_distribution == "uniform":
+            return max(0.0, self._random.uniform(mean - self.latency_spread, mean + self.latency_spread))
+        if self.latency_distribution == "exponential":
+            return self._random.expovariate(1 / mean)
+        # lognormal with the requested mean
+        sigma = self.latency_spread
+        return self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+
+    def _stretch(self, text):
+        lines = []
+        for line in text.split('\n'):
+            prefix = "## " if line.startswith("## ") else ""
+            body = line[len(prefix):]
+            target_length = int(len(body) * self.expansion_ratio)
+            if target_length <= len(body):
+                stretched = body[:target_length]
+            else:
+                stretched = body + "~" * (target_length - len(body))
+            lines.append(prefix + stretched)
+        return "\n".join(lines)
+
+    def create_cached_content(self, prefix, ttl_seconds=3600):
+        """Caches a prompt prefix; returns (model bound to it, FakeCachedContent)."""
+        self._cached_contents += 1
+        self.stats["cached_contents_created"] += 1
+        cached_content = FakeCachedContent(f"cachedContents/fake-{self._cached_contents}", prefix, ttl_seconds)
+        return _CachedPrefixModel(self, cached_content), cached_content
+
+    def _translate_prompt(self, prompt):
+        first_marker = "\n" + translator.PACKED_SEGMENT_MARKER.format(number=1) + "\n"
+        if first_marker in prompt:
+            # The segments start at the first marker on a line of its own (the instructions quote it too)
+            body = prompt.split(first_marker, 1)[1]
+            body = body.rsplit("\n" + translator.PACKED_END_MARKER, 1)[0]
+            body = "\n" + body
+            parts = re.split(r'(<<<SEGMENT \d+>>>)', translator.PACKED_SEGMENT_MARKER.format(number=1) + body)
+            out = []
+            for part in parts:
+                out.append(part if re.fullmatch(r'<<<SEGMENT \d+>>>', part) else self._stretch(part))
+            return "".join(out) + translator.PACKED_END_MARKER
+        match = re.search(r'--- Text Segment to Translate ---\n(.*)\n--- End of Text Segment ---', prompt, flags=re.DOTALL)
+        return self._stretch(match.group(1) if match else prompt)
+
+    def _count_prompt_tokens(self, prompt, cached_prefix):
+        """Returns (prompt tokens, of which served from the cache) and updates the billing stats."""
+        cached_tokens = 0
+        if cached_prefix is not None:
+            prefix, suffix = cached_prefix, prompt
+            cached_tokens = _count_tokens(prefix)
+            self.stats["cached_prefix_tokens"] += cached_tokens
+        else:
+            split_at = prompt.find("\n" + translator.PROMPT_SUFFIX_HEADER + "\n")
+            prefix, suffix = (prompt[:split_at], prompt[split_at:]) if split_at >= 0 else ("", prompt)
+            self.stats["inline_prefix_tokens"] += _count_tokens(prefix)
+        self.stats["suffix_tokens"] += _count_tokens(suffix)
+        return _count_tokens(prefix) + _count_tokens(suffix), cached_tokens
+
+    def _respond(self, prompt, cached_prefix=None):
+        self.stats["requests"] += 1
+        self.stats["prompt_chars"] += len(prompt)
+        prompt_tokens, cached_tokens = self._count_prompt_tokens(prompt, cached_prefix)
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            raise ResourceExhausted(f"429 Resource has been exhausted (e.g. check quota). retry_delay {{ seconds: {self.retry_after_seconds} }}")
+        roll -= self.rate_limit_rate
+        if roll < self.error_rate:
+            self.stats["errors"] += 1
+            raise ServiceUnavailable("503 The service is currently unavailable.")
+        roll -= self.error_rate
+        if roll < self.block_rate:
+            self.stats["blocked"] += 1
+            return FakeResponse("", block_reason="SAFETY", prompt_token_count=prompt_tokens, cached_content_token_count=cached_tokens)
+        text = self._translate_prompt(prompt)
+        self.stats["output_chars"] += len(text)
+        return FakeResponse(text, prompt_token_count=prompt_tokens, candidates_token_count=_count_tokens(text), cached_content_token_count=cached_tokens)
+
+    def generate_content(self, prompt):
+        time.sleep(self._latency())
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt):
+        await asyncio.sleep(self._latency())
+        return self._respond(prompt)
+
+def run_batch_file(requests_filepath, results_filepath, model=None, missing_rate=0.0):
+    """
+    Answers an offline batch request file (see offline_batch) the way the batch endpoint
+    would, writing a results JSONL. Errors become "error" lines, safety blocks carry a
+    blockReason, and `missing_rate` drops lines entirely. Results are written in shuffled
+    order, as real batch output is not guaranteed to keep the request order.
+    """
+    model = model or FakeGenerativeModel(latency_seconds=0)
+    lines = []
+    with open(requests_filepath, "r", encoding="utf-8") as f:
+        for line in f:
+            request = json.loads(line)
+            if model._random.random() < missing_rate:
+                continue
+            prompt = "".join(part["text"] for content in request["request"]["contents"] for part in content["parts"])
+            try:
+                response = model._respond(prompt)
+            except (ResourceExhausted, ServiceUnavailable) as e:
+                lines.append({"key": request["key"], "error": {"code": e.code, "message": str(e)}})
+                continue
+            if response.prompt_feedback.block_reason:
+                body = {"promptFeedback": {"blockReason": response.prompt_feedback.block_reason}}
+            else:
+                body = {"candidates": [{"content": {"role": "model", "parts": [{"text": response.text}]}, "finishReason": "STOP"}]}
+            body["usageMetadata"] = {
+                "promptTokenCount": response.usage_metadata.prompt_token_count,
+                "candidatesTokenCount": response.usage_metadata.candidates_token_count,
+            }
+            lines.append({"key": request["key"], "response": body})
+    model._random.shuffle(lines)
+    with open(results_filepath, "w", encoding="utf-8") as f:
+        for record in lines:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return len(lines)
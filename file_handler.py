@@ -4,36 +4,177 @@ import ebooklib
 from ebooklib import epub
 import fitz  # PyMuPDF
 from bs4 import BeautifulSoup
+import html
 import re
 import os
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 # --- Extraction Functions ---
 
-def extract_text_from_epub(epub_filepath):
+def _default_html_parser():
+    """Prefers the much faster lxml parser for BeautifulSoup when it is installed."""
+    try:
+        import lxml  # noqa: F401
+        return 'lxml'
+    except ImportError:
+        return 'html.parser'
+
+def _ordered_parallel_map(func, task_args, workers):
+    """
+    Runs func(*args) for each tuple in task_args across a process pool and yields the
+    results in task order. At most two tasks per worker are in flight, so a slow consumer
+    holds back extraction instead of piling up results in memory.
+    """
+    if not workers or workers <= 1:
+        for args in task_args:
+            yield func(*args)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for args in task_args:
+            in_flight.append(pool.submit(func, *args))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+def _parse_epub_document(content_bytes, parser):
+    """Turns one EPUB XHTML document into text, marking headings. Runs in a worker process."""
+    try:
+        content_str = content_bytes.decode('utf-8', errors='replace')
+    except UnicodeDecodeError:
+        content_str = content_bytes.decode('latin-1', errors='replace')
+
+    soup = BeautifulSoup(content_str, parser)
+    # Use a more targeted approach for text
+    text_in_item = []
+    for element in soup.find_all(['h1', 'h2', 'h3', 'p']):
+        if element.name.startswith('h'):
+            text_in_item.append(f"\n\n## {element.get_text(strip=True)}\n\n")
+        else:
+            text_in_item.append(element.get_text(strip=True))
+    # Consolidate excessive newlines
+    return re.sub(r'(\n\s*){3,}', '\n\n', "\n\n".join(text_in_item))
+
+# Running headers and footers live in the top and bottom strips of a page
+_PAGE_MARGIN_FRACTION = 0.08
+# A bare page number: digits, or a front-matter roman numeral (i-xxxix) so words such as
+# "mix" or "lix" are not taken for numerals
+_PAGE_NUMBER_REGEX = re.compile(r'^(page\s*)?(#|(?=[ivx])x{0,3}(ix|iv|v?i{0,3}))(\s*(of|/)\s*#)?$')
+
+def _page_line_key(text):
+    """Normalizes a header/footer block so 'Page 12' and 'Page 13' compare equal."""
+    return re.sub(r'\d+', '#', " ".join(text.split()).lower()).strip(" -–—|.·")
+
+def _strip_repeated_page_lines(pages, min_fraction=0.5):
+    """
+    Drops running headers, footers and page numbers from a list of consecutive pages, each
+    a list of (text, in_margin) blocks. A margin block goes if it is a bare page number or
+    if the same (digit-normalized) text sits in the margin of at least `min_fraction` of the
+    even or of the odd pages, so headers that alternate between left and right pages
+    (book title / chapter title) are caught too.
+    Returns (page texts, blocks removed, characters removed).
+    """
+    counts = ({}, {})  # Per key, on even and on odd pages
+    for page_index, blocks in enumerate(pages):
+        parity_counts = counts[page_index % 2]
+        for key in {_page_line_key(text) for text, in_margin in blocks if in_margin}:
+            parity_counts[key] = parity_counts.get(key, 0) + 1
+    min_pages = [max(2, min_fraction * len(pages[parity::2])) for parity in (0, 1)]
+    repeated = {key for parity in (0, 1) for key, count in counts[parity].items() if count >= min_pages[parity]}
+    page_texts, removed_blocks, removed_chars = [], 0, 0
+    for blocks in pages:
+        kept = []
+        for text, in_margin in blocks:
+            key = _page_line_key(text)
+            if in_margin and (not key or _PAGE_NUMBER_REGEX.match(key) or key in repeated):
+                removed_blocks += 1
+                removed_chars += len(text)
+            else:
+                kept.append(text)
+        page_texts.append("".join(kept))
+    return page_texts, removed_blocks, removed_chars
+
+def _extract_pdf_page_range(pdf_filepath, start_page, stop_page, strip_repeated_lines=False):
+    """
+    Extracts the text of pages [start_page, stop_page). Runs in a worker process.
+    Returns (text, header/footer blocks removed, characters removed).
+    """
+    with fitz.open(pdf_filepath) as doc:
+        if not strip_repeated_lines:
+            page_range_text = "".join(doc[page_number].get_text("text") for page_number in range(start_page, stop_page))
+            return re.sub(r'(\n\s*){2,}', '\n\n', page_range_text), 0, 0
+        pages = []
+        for page_number in range(start_page, stop_page):
+            page = doc[page_number]
+            top, bottom = page.rect.height * _PAGE_MARGIN_FRACTION, page.rect.height * (1 - _PAGE_MARGIN_FRACTION)
+            pages.append([
+                (text, y1 <= top or y0 >= bottom)
+                for x0, y0, x1, y1, text, block_number, block_type in page.get_text("blocks")
+                if block_type == 0  # Text blocks; images carry no text
+            ])
+    page_texts, removed_blocks, removed_chars = _strip_repeated_page_lines(pages)
+    return re.sub(r'(\n\s*){2,}', '\n\n', "".join(page_texts)), removed_blocks, removed_chars
+
+def iter_epub_text_segments(epub_filepath, workers=None, parser=None):
+    """
+    Yields the text of each EPUB document in order, parsing documents in parallel worker
+    processes. Concatenating the segments gives the book text. Raises if the file cannot be read.
+    """
+    book = epub.read_epub(epub_filepath)
+    parser = parser or _default_html_parser()
+    documents = ((item.get_content(), parser) for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT))
+    for document_text in _ordered_parallel_map(_parse_epub_document, documents, workers):
+        yield document_text + "\n\n"
+
+def iter_pdf_text_segments(pdf_filepath, workers=None, pages_per_task=25, strip_repeated_lines=False, stats=None):
+    """
+    Yields the text of consecutive page ranges in order, extracting ranges in parallel
+    worker processes. Concatenating the segments gives the book text. Raises if the file cannot be read.
+    With `strip_repeated_lines`, running headers, footers and page numbers are detected
+    per page range by position and frequency and dropped; the counts are added to the
+    "boilerplate_blocks" and "boilerplate_chars" entries of the `stats` dict.
+    """
+    with fitz.open(pdf_filepath) as doc:
+        page_count = doc.page_count
+    page_ranges = (
+        (pdf_filepath, start, min(start + pages_per_task, page_count), strip_repeated_lines)
+        for start in range(0, page_count, pages_per_task)
+    )
+    for page_range_text, removed_blocks, removed_chars in _ordered_parallel_map(_extract_pdf_page_range, page_ranges, workers):
+        if stats is not None:
+            stats["boilerplate_blocks"] = stats.get("boilerplate_blocks", 0) + removed_blocks
+            stats["boilerplate_chars"] = stats.get("boilerplate_chars", 0) + removed_chars
+        yield page_range_text
+
+def iter_book_text(book_filepath, workers=None, strip_repeated_lines=False, stats=None):
+    """
+    Streaming counterpart of get_book_text: yields ordered text segments as extraction
+    proceeds, so chunking can start before the whole book is read.
+    Yields nothing if the file is missing or unsupported.
+    `strip_repeated_lines` and `stats` apply to PDFs (see iter_pdf_text_segments).
+    """
+    if not os.path.exists(book_filepath):
+        print(f"❌ ERROR: File does not exist at path: {book_filepath}")
+        return
+
+    _, file_extension = os.path.splitext(book_filepath.lower())
+    if file_extension == '.epub':
+        print(f"  Streaming text from EPUB: {os.path.basename(book_filepath)}")
+        yield from iter_epub_text_segments(book_filepath, workers)
+    elif file_extension == '.pdf':
+        print(f"  Streaming text from PDF: {os.path.basename(book_filepath)}")
+        yield from iter_pdf_text_segments(book_filepath, workers, strip_repeated_lines=strip_repeated_lines, stats=stats)
+    else:
+        print(f"❌ ERROR: Unsupported file type: '{file_extension}'. Please use .epub or .pdf.")
+
+def extract_text_from_epub(epub_filepath, workers=None):
     """Extracts textual content from an EPUB file, marking headings."""
     print(f"  Extracting text from EPUB: {os.path.basename(epub_filepath)}")
     try:
-        book = epub.read_epub(epub_filepath)
-        full_text_parts = []
-        for item in book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
-            content_bytes = item.get_content()
-            try:
-                content_str = content_bytes.decode('utf-8', errors='replace')
-            except UnicodeDecodeError:
-                content_str = content_bytes.decode('latin-1', errors='replace')
-
-            soup = BeautifulSoup(content_str, 'html.parser')
-            # Use a more targeted approach for text
-            text_in_item = []
-            for element in soup.find_all(['h1', 'h2', 'h3', 'p']):
-                if element.name.startswith('h'):
-                    text_in_item.append(f"\n\n## {element.get_text(strip=True)}\n\n")
-                else:
-                    text_in_item.append(element.get_text(strip=True))
-            full_text_parts.append("\n\n".join(text_in_item))
-
-        extracted_text = "\n\n".join(full_text_parts)
+        extracted_text = "".join(iter_epub_text_segments(epub_filepath, workers))
         # Consolidate excessive newlines
         extracted_text = re.sub(r'(\n\s*){3,}', '\n\n', extracted_text).strip()
         print(f"    EPUB extraction complete. Characters: {len(extracted_text)}")
@@ -42,13 +183,11 @@ def extract_text_from_epub(epub_filepath):
         print(f"    ❌ ERROR parsing EPUB {os.path.basename(epub_filepath)}: {e}")
         return None
 
-def extract_text_from_pdf(pdf_filepath):
+def extract_text_from_pdf(pdf_filepath, workers=None):
     """Extracts textual content from a PDF file."""
     print(f"  Extracting text from PDF: {os.path.basename(pdf_filepath)}")
     try:
-        doc = fitz.open(pdf_filepath)
-        full_text_parts = [page.get_text("text") for page in doc]
-        extracted_text = "".join(full_text_parts)
+        extracted_text = "".join(iter_pdf_text_segments(pdf_filepath, workers))
         extracted_text = re.sub(r'(\n\s*){2,}', '\n\n', extracted_text).strip()
         print(f"    PDF extraction complete. Characters: {len(extracted_text)}")
         return extracted_text
@@ -56,7 +195,7 @@ def extract_text_from_pdf(pdf_filepath):
         print(f"    ❌ ERROR parsing PDF {os.path.basename(pdf_filepath)}: {e}")
         return None
 
-def get_book_text(book_filepath):
+def get_book_text(book_filepath, workers=None):
     """Detects file type and calls the appropriate extraction function."""
     if not os.path.exists(book_filepath):
         print(f"❌ ERROR: File does not exist at path: {book_filepath}")
@@ -64,15 +203,426 @@ def get_book_text(book_filepath):
 
     _, file_extension = os.path.splitext(book_filepath.lower())
     if file_extension == '.epub':
-        return extract_text_from_epub(book_filepath)
+        return extract_text_from_epub(book_filepath, workers)
     elif file_extension == '.pdf':
-        return extract_text_from_pdf(book_filepath)
+        return extract_text_from_pdf(book_filepath, workers)
     else:
         print(f"❌ ERROR: Unsupported file type: '{file_extension}'. Please use .epub or .pdf.")
         return None
 
 # --- Reconstruction Functions ---
 
+class BookWriter:
+    """
+    Base for incremental book writers. Translated parts are fed in reading order with
+    write_part(); they are grouped into chapters at '## ' headings and handed to
+    add_chapter() one chapter at a time, so the finished book never has to exist as one
+    string. Writers that can lay out part of a chapter set `flush_chars`: once that many
+    characters of a chapter are buffered they are handed over early, and the rest of the
+    chapter follows in add_chapter() calls with `continued=True` (PDF sources have no
+    headings, so a whole book would otherwise be one chapter).
+    close() completes the file and returns True on success.
+    """
+
+    flush_chars = 0  # 0: buffer whole chapters
+
+    def __init__(self, output_filepath):
+        self.output_filepath = output_filepath
+        self.failed = False
+        self._chapter_title = None
+        self._chapter_paragraphs = []
+        self._chapter_chars = 0
+        self._chapter_continued = False
+
+    def write_part(self, translated_part):
+        for paragraph in translated_part.split('\n\n'):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+            if paragraph.startswith('## '):
+                self._flush_chapter()
+                title, _, rest = paragraph[3:].partition('\n')
+                self._chapter_title = title.strip()
+                paragraph = rest.strip()
+                if not paragraph:
+                    continue
+            self._chapter_paragraphs.append(paragraph)
+            self._chapter_chars += len(paragraph)
+        if self.flush_chars and self._chapter_chars >= self.flush_chars:
+            self._flush_chapter(continues=True)
+
+    def _flush_chapter(self, continues=False):
+        if (self._chapter_title is not None or self._chapter_paragraphs) and not self.failed:
+            try:
+                self.add_chapter(self._chapter_title, self._chapter_paragraphs, continued=self._chapter_continued)
+            except Exception as e:
+                print(f"    ERROR writing {os.path.basename(self.output_filepath)}: {e}")
+                self.failed = True
+            self._chapter_continued = continues
+        elif not continues:
+            self._chapter_continued = False
+        self._chapter_title, self._chapter_paragraphs, self._chapter_chars = None, [], 0
+
+    def add_chapter(self, title, paragraphs, continued=False):
+        raise NotImplementedError
+
+    def close(self):
+        self._flush_chapter()
+        if self.failed:
+            self.abort()
+            return False
+        return self._finish()
+
+    def _finish(self):
+        return True
+
+    def abort(self):
+        """Releases resources without completing the file."""
+
+class TxtBookWriter(BookWriter):
+    """Appends translated parts straight to a TXT file as they arrive."""
+
+    def __init__(self, output_filepath):
+        super().__init__(output_filepath)
+        self._file = open(output_filepath, "w", encoding="utf-8")
+        self._parts_written = 0
+
+    def write_part(self, translated_part):
+        translated_part = re.sub(r'(\n\s*){3,}', '\n\n', translated_part).strip()
+        if not translated_part or self.failed:
+            return
+        try:
+            if self._parts_written:
+                self._file.write("\n\n")
+            self._file.write(translated_part)
+            self._parts_written += 1
+        except Exception as e:
+            print(f"    ERROR saving TXT file: {e}")
+            self.failed = True
+
+    def _finish(self):
+        self._file.close()
+        print(f"    TXT reconstruction complete: {os.path.basename(self.output_filepath)}")
+        return True
+
+    def abort(self):
+        self._file.close()
+
+class EpubBookWriter(BookWriter):
+    """Builds an EPUB chapter by chapter; the package is written on close()."""
+
+    def __init__(self, output_filepath, lang_code, book_title, author_name):
+        super().__init__(output_filepath)
+        self.lang_code = lang_code
+        self.book_title = book_title
+        self._book = epub.EpubBook()
+        self._book.set_identifier(f"urn:uuid:{book_title.replace(' ', '_')}-{time.time()}")
+        self._book.set_title(book_title)
+        self._book.set_language(lang_code)
+        self._book.add_author(author_name)
+        self._chapters = []
+
+    @staticmethod
+    def _sanitize_filename(name):
+        name = re.sub(r'[^\w\s-]', '', name.lower())
+        return re.sub(r'[-\s]+', '-', name).strip('-_')
+
+    def add_chapter(self, title, paragraphs, continued=False):
+        if not paragraphs:
+            return  # A heading with no text of its own
+        title = title or "Introduction"
+        safe_title_for_file = self._sanitize_filename(title)
+        chap_file_name = f'chap_{len(self._chapters)+1:02d}_{safe_title_for_file[:20]}.xhtml'
+        content_html = "".join(
+            f"<p>{html.escape(line.strip())}</p>"
+            for paragraph in paragraphs for line in paragraph.split('\n') if line.strip()
+        )
+        ch_obj = epub.EpubHtml(title=title, file_name=chap_file_name, lang=self.lang_code)
+        ch_obj.content = f'<h1>{html.escape(title)}</h1>{content_html}'
+        self._chapters.append(ch_obj)
+        self._book.add_item(ch_obj)
+
+    def _finish(self):
+        if not self._chapters:
+            self.add_chapter(self.book_title, [""])
+        self._book.toc = tuple(self._chapters)
+        self._book.add_item(epub.EpubNcx())
+        self._book.add_item(epub.EpubNav())
+        self._book.spine = ['nav'] + self._chapters
+        try:
+            epub.write_epub(self.output_filepath, self._book, {})
+            print(f"    EPUB reconstruction complete: {os.path.basename(self.output_filepath)}")
+            return True
+        except Exception as e:
+            print(f"    ERROR writing EPUB file: {e}")
+            return False
+
+# Target languages whose scripts need shaping (conjuncts, reordered vowel signs, joining)
+SHAPED_SCRIPT_LANGUAGES = {"hi", "mr", "ne", "sa", "bn", "as", "pa", "gu", "or", "ta", "te", "kn", "ml", "si",
+                           "th", "lo", "km", "my", "bo", "ar", "fa", "ur", "ps", "he", "yi"}
+
+class PdfBookWriter(BookWriter):
+    """
+    Lays out chapters onto A4 pages as they arrive; the document is saved on close().
+    The regular and bold fonts (TTF/OTF files, or built-in Helvetica) are loaded once per
+    document. Lines are wrapped with glyph advances cached per character and word widths
+    cached per word, and each page is drawn with one TextWriter, so layout time grows
+    linearly with the text. Only the glyphs used are embedded (font subsetting on save).
+    Text is not shaped: use ShapedPdfBookWriter for scripts such as Devanagari.
+    Paragraphs are drawn as soon as each translated part arrives.
+    """
+
+    flush_chars = 1
+
+    def __init__(self, output_filepath, font_path=None, bold_font_path=None):
+        super().__init__(output_filepath)
+        self._doc = fitz.open()
+        self.page_width, self.page_height = fitz.paper_size("a4")
+        margin = 50
+        self.text_area_rect = fitz.Rect(margin, margin, self.page_width - margin, self.page_height - margin)
+        self.font_regular = fitz.Font(fontfile=font_path) if font_path else fitz.Font("helv")
+        if bold_font_path:
+            self.font_bold = fitz.Font(fontfile=bold_font_path)
+        else:
+            # A custom regular font has no built-in bold partner; headings use it at a larger size
+            self.font_bold = self.font_regular if font_path else fitz.Font("hebo")
+        self.regular_fontsize = 11; self.heading_fontsize = 15
+        self.line_spacing_factor = 1.4
+        self._advances = {id(self.font_regular): {}, id(self.font_bold): {}}  # font -> {char: advance in em}
+        self._word_widths = {id(self.font_regular): {}, id(self.font_bold): {}}  # font -> {word: width in em}
+        self.missing_glyphs = set()
+        self._page = None
+        self._page_writer = None
+        self._current_y = self.text_area_rect.y0
+
+    def _char_advance(self, font, char):
+        advances = self._advances[id(font)]
+        advance = advances.get(char)
+        if advance is None:
+            if not font.has_glyph(ord(char)) and not char.isspace():
+                self.missing_glyphs.add(char)
+            advance = advances[char] = font.glyph_advance(ord(char))
+        return advance
+
+    def _word_width(self, font, word):
+        """Width of `word` in em, from cached glyph advances."""
+        widths = self._word_widths[id(font)]
+        width = widths.get(word)
+        if width is None:
+            width = widths[word] = sum(self._char_advance(font, char) for char in word)
+        return width
+
+    def _wrap_line(self, text, font, fontsize):
+        """Greedily wraps one line of text to the text area width; returns the wrapped lines."""
+        max_width = self.text_area_rect.width / fontsize  # In em
+        space_width = self._char_advance(font, " ")
+        lines, current_words, current_width = [], [], 0.0
+        for word in text.split():
+            word_width = self._word_width(font, word)
+            if current_words and current_width + space_width + word_width <= max_width:
+                current_words.append(word)
+                current_width += space_width + word_width
+                continue
+            if current_words:
+                lines.append(" ".join(current_words))
+            if word_width <= max_width:
+                current_words, current_width = [word], word_width
+                continue
+            # A word wider than the line (e.g. a URL) is broken by characters
+            piece, piece_width = [], 0.0
+            for char in word:
+                advance = self._char_advance(font, char)
+                if piece and piece_width + advance > max_width:
+                    lines.append("".join(piece))
+                    piece, piece_width = [], 0.0
+                piece.append(char)
+                piece_width += advance
+            current_words, current_width = ["".join(piece)], piece_width
+        if current_words:
+            lines.append(" ".join(current_words))
+        return lines
+
+    def _finish_page(self):
+        if self._page_writer is not None:
+            self._page_writer.write_text(self._page)
+            self._page_writer = None
+
+    def _add_new_page(self):
+        self._finish_page()
+        self._page = self._doc.new_page(width=self.page_width, height=self.page_height)
+        self._page_writer = fitz.TextWriter(self._page.rect)
+        self._current_y = self.text_area_rect.y0
+
+    def _draw_paragraph(self, display_text, is_heading):
+        if self._page is None:
+            self._add_new_page()
+        fontsize = self.heading_fontsize if is_heading else self.regular_fontsize
+        font = self.font_bold if is_heading else self.font_regular
+        effective_line_height = fontsize * self.line_spacing_factor
+        if is_heading and self._current_y > self.text_area_rect.y0 + effective_line_height:
+            self._current_y += self.heading_fontsize * 0.5
+        for source_line in display_text.split('\n'):
+            for single_line in self._wrap_line(source_line, font, fontsize) or [""]:
+                if self._current_y + effective_line_height > self.text_area_rect.y1:
+                    self._add_new_page()
+                if single_line:
+                    self._page_writer.append(fitz.Point(self.text_area_rect.x0, self._current_y + fontsize), single_line, font=font, fontsize=fontsize)
+                self._current_y += effective_line_height
+        self._current_y += effective_line_height * 0.2
+
+    def add_chapter(self, title, paragraphs, continued=False):
+        if title is not None:
+            self._draw_paragraph(title, True)
+        for paragraph in paragraphs:
+            self._draw_paragraph(paragraph, False)
+
+    def _finish(self):
+        try:
+            self._finish_page()
+            if self._doc.page_count > 0:
+                if self.missing_glyphs:
+                    sample = "".join(sorted(self.missing_glyphs)[:20])
+                    print(f"    ⚠️ The PDF font has no glyphs for {len(self.missing_glyphs)} character(s) (e.g. {sample}); set pdf_font_path to a font that covers the script.")
+                _subset_pdf_fonts(self._doc)
+                self._doc.save(self.output_filepath, garbage=3, deflate=True)
+                print(f"    PDF reconstruction complete: {os.path.basename(self.output_filepath)}")
+                return True
+            else:
+                print("    ⚠️ PDF not saved as no content was added.")
+                return False
+        except Exception as e:
+            print(f"    ERROR saving PDF: {e}")
+            return False
+        finally:
+            self._doc.close()
+
+    def abort(self):
+        self._doc.close()
+
+def _subset_pdf_fonts(doc):
+    """Replaces embedded fonts by subsets of the glyphs actually used; keeps full fonts if that fails."""
+    try:
+        doc.subset_fonts()
+    except Exception as e:
+        print(f"    ⚠️ Font subsetting skipped ({type(e).__name__}: {e}); the full font files are embedded.")
+
+class ShapedPdfBookWriter(BookWriter):
+    """
+    PDF writer for scripts that need shaping, such as Devanagari, Bengali or Tamil.
+    Each chapter is laid out in bulk by MuPDF's HTML engine (fitz.Story), which shapes,
+    wraps and paginates it with the configured TTF/OTF font; the font files are read
+    once per document. Long chapters are laid out every `flush_chars` characters, each
+    part continuing on the page where the previous one ended. Pages are streamed to a
+    temporary file and the fonts are subset when the document is finished.
+    """
+
+    flush_chars = 20000
+
+    def __init__(self, output_filepath, font_path, bold_font_path=None, lang_code=""):
+        super().__init__(output_filepath)
+        if not font_path:
+            raise ValueError("ShapedPdfBookWriter needs a TTF/OTF font that covers the script (pdf_font_path).")
+        self.page_rect = fitz.paper_rect("a4")
+        margin = 50
+        self.text_area_rect = self.page_rect + (margin, margin, -margin, -margin)
+        self.lang_code = lang_code
+        self._archive = fitz.Archive()
+        font_faces = []
+        for weight, path in (("normal", font_path), ("bold", bold_font_path or font_path)):
+            font_filename = f"{weight}{os.path.splitext(path)[1].lower()}"
+            with open(path, "rb") as f:
+                self._archive.add(f.read(), font_filename)
+            font_faces.append(f'@font-face {{font-family: "BookFont"; font-weight: {weight}; src: url("{font_filename}");}}')
+        self._css = "\n".join(font_faces) + """
+            body {font-family: "BookFont"; font-size: 11pt; line-height: 1.4;}
+            h2 {font-size: 15pt; font-weight: bold; margin: 0 0 8pt 0;}
+            p {margin: 0 0 3pt 0;}
+        """
+        self._temp_filepath = output_filepath + ".partial"
+        self._writer = fitz.DocumentWriter(self._temp_filepath)
+        self._pages = 0
+        self._device = None  # The open page, while a chapter part may still continue on it
+        self._free_rect = None
+
+    def _end_page(self):
+        if self._device is not None:
+            self._writer.end_page()
+            self._device = None
+
+    def add_chapter(self, title, paragraphs, continued=False):
+        body = [f"<h2>{html.escape(title)}</h2>"] if title is not None else []
+        for paragraph in paragraphs:
+            lines = [html.escape(line.strip()) for line in paragraph.split('\n') if line.strip()]
+            body.append(f"<p>{'<br/>'.join(lines)}</p>")
+        story = fitz.Story(html=f'<body lang="{html.escape(self.lang_code)}">{"".join(body)}</body>', user_css=self._css, archive=self._archive)
+        if not continued:
+            self._end_page()  # Each chapter starts on a new page
+        more = True
+        while more:
+            if self._device is None:
+                self._device = self._writer.begin_page(self.page_rect)
+                self._free_rect = self.text_area_rect
+                self._pages += 1
+            more, filled = story.place(self._free_rect)
+            story.draw(self._device)
+            if more or filled.y1 >= self.text_area_rect.y1:
+                self._end_page()
+            else:
+                self._free_rect = fitz.Rect(self.text_area_rect.x0, filled.y1, self.text_area_rect.x1, self.text_area_rect.y1)
+
+    def _finish(self):
+        try:
+            self._end_page()
+            self._writer.close()
+            if not self._pages:
+                print("    ⚠️ PDF not saved as no content was added.")
+                return False
+            with fitz.open(self._temp_filepath) as doc:
+                _subset_pdf_fonts(doc)
+                doc.save(self.output_filepath, garbage=3, deflate=True)
+            print(f"    PDF reconstruction complete: {os.path.basename(self.output_filepath)}")
+            return True
+        except Exception as e:
+            print(f"    ERROR saving PDF: {e}")
+            return False
+        finally:
+            if os.path.exists(self._temp_filepath):
+                os.remove(self._temp_filepath)
+
+    def abort(self):
+        try:
+            self._writer.close()
+        except Exception:
+            pass
+        if os.path.exists(self._temp_filepath):
+            os.remove(self._temp_filepath)
+
+def open_pdf_book_writer(output_filepath, lang_code, font_path=None, bold_font_path=None):
+    """Picks the PDF backend: shaped layout for complex scripts when a font is configured, fast wrapping otherwise."""
+    if lang_code in SHAPED_SCRIPT_LANGUAGES:
+        if font_path:
+            return ShapedPdfBookWriter(output_filepath, font_path, bold_font_path, lang_code)
+        print(f"    ⚠️ '{lang_code}' text needs a font that covers its script: set pdf_font_path (e.g. a Noto Sans font). Falling back to Helvetica.")
+    return PdfBookWriter(output_filepath, font_path, bold_font_path)
+
+def open_book_writer(output_format, output_filepath, lang_code, book_title, author_name, pdf_font_path=None, pdf_bold_font_path=None):
+    """
+    Returns an incremental writer for the output format, or None if it cannot be created.
+    `pdf_font_path` / `pdf_bold_font_path` are TTF/OTF files for PDF output.
+    """
+    print(f"  Writing {output_format}: {os.path.basename(output_filepath)}")
+    try:
+        if output_format == "TXT":
+            return TxtBookWriter(output_filepath)
+        elif output_format == "EPUB":
+            return EpubBookWriter(output_filepath, lang_code, book_title, author_name)
+        elif output_format == "PDF":
+            return open_pdf_book_writer(output_filepath, lang_code, pdf_font_path, pdf_bold_font_path)
+        print(f"❌ ERROR: Unsupported output format: '{output_format}'. Please use TXT, EPUB or PDF.")
+    except Exception as e:
+        print(f"    ERROR opening {os.path.basename(output_filepath)} for writing: {e}")
+    return None
+
 def save_text_file(text, output_filepath):
     """Saves the translated text as a simple TXT file."""
     print(f"  Reconstructing basic TXT: {os.path.basename(output_filepath)}")
@@ -88,110 +638,17 @@ def save_text_file(text, output_filepath):
 def reconstruct_epub_basic(translated_text, lang_code, book_title, author_name, output_filepath):
     """Creates a basic EPUB from translated text, splitting by '##' headings."""
     print(f"  Reconstructing basic EPUB: {os.path.basename(output_filepath)}")
-    # Your full reconstruct_epub_basic function from the notebook goes here
-    # (Pasted from your provided code for completeness)
-    book = epub.EpubBook()
-    book.set_identifier(f"urn:uuid:{book_title.replace(' ', '_')}-{time.time()}")
-    book.set_title(book_title)
-    book.set_language(lang_code)
-    book.add_author(author_name)
-    raw_segments = re.split(r'(\n## .*?\n)', translated_text, flags=re.DOTALL)
-    epub_chapters_list = []
-    current_chapter_title_str = "Introduction"
-    current_chapter_content_html_str = ""
-    def sanitize_filename(name):
-        name = re.sub(r'[^\w\s-]', '', name.lower())
-        return re.sub(r'[-\s]+', '-', name).strip('-_')
-    processed_first_segment = False
-    if raw_segments and raw_segments[0].strip() and not raw_segments[0].startswith("\n## "):
-        content_html = "".join([f"<p>{p.strip()}</p>" for p in raw_segments[0].strip().split('\n') if p.strip()])
-        current_chapter_content_html_str += content_html
-        processed_first_segment = True
-    start_idx = 1 if processed_first_segment else 0
-    for i in range(start_idx, len(raw_segments)):
-        segment = raw_segments[i]
-        if segment.startswith("\n## "):
-            if current_chapter_content_html_str.strip():
-                safe_title_for_file = sanitize_filename(current_chapter_title_str)
-                chap_file_name = f'chap_{len(epub_chapters_list)+1:02d}_{safe_title_for_file[:20]}.xhtml'
-                ch_obj = epub.EpubHtml(title=current_chapter_title_str, file_name=chap_file_name, lang=lang_code)
-                ch_obj.content = f'<h1>{current_chapter_title_str}</h1>{current_chapter_content_html_str}'
-                epub_chapters_list.append(ch_obj); book.add_item(ch_obj)
-            current_chapter_title_str = segment.replace("\n## ", "").strip().split('\n')[0]
-            current_chapter_content_html_str = "".join([f"<p>{p.strip()}</p>" for p in segment.replace("\n## " + current_chapter_title_str, "").strip().split('\n') if p.strip()])
-        else:
-            current_chapter_content_html_str += "".join([f"<p>{p.strip()}</p>" for p in segment.strip().split('\n') if p.strip()])
-    if current_chapter_content_html_str.strip() or not epub_chapters_list:
-        if not current_chapter_content_html_str.strip() and not epub_chapters_list and translated_text.strip():
-             current_chapter_title_str = book_title
-             current_chapter_content_html_str = "".join([f"<p>{p.strip()}</p>" for p in translated_text.strip().split('\n') if p.strip()])
-        safe_title_for_file = sanitize_filename(current_chapter_title_str)
-        chap_file_name = f'chap_{len(epub_chapters_list)+1:02d}_{safe_title_for_file[:20]}.xhtml'
-        ch_obj = epub.EpubHtml(title=current_chapter_title_str, file_name=chap_file_name, lang=lang_code)
-        ch_obj.content = f'<h1>{current_chapter_title_str}</h1>{current_chapter_content_html_str}'
-        epub_chapters_list.append(ch_obj); book.add_item(ch_obj)
-    
-    book.toc = tuple(epub_chapters_list)
-    book.add_item(epub.EpubNcx())
-    book.add_item(epub.EpubNav())
-    book.spine = ['nav'] + epub_chapters_list
-    
-    try: 
-        epub.write_epub(output_filepath, book, {})
-        print(f"    EPUB reconstruction complete: {os.path.basename(output_filepath)}")
-        return True
-    except Exception as e: 
-        print(f"    ERROR writing EPUB file: {e}")
-        return False
+    writer = EpubBookWriter(output_filepath, lang_code, book_title, author_name)
+    writer.write_part(translated_text)
+    return writer.close()
 
-
-def reconstruct_pdf_basic(translated_text, output_filepath):
+def reconstruct_pdf_basic(translated_text, output_filepath, lang_code="", font_path=None, bold_font_path=None):
     """Creates a basic PDF from the translated text."""
     print(f"  Reconstructing basic PDF: {os.path.basename(output_filepath)}")
-    # Your full reconstruct_pdf_basic function from the notebook goes here
-    # (Pasted from your provided code for completeness)
-    doc = None
     try:
-        doc = fitz.open()
-        page_width, page_height = fitz.paper_size("a4")
-        margin = 50
-        text_area_rect = fitz.Rect(margin, margin, page_width - margin, page_height - margin)
-        font_regular = "helvetica"; font_bold = "helvetica-bold"
-        regular_fontsize = 11; heading_fontsize = 15
-        line_spacing_factor = 1.4
-        current_y = text_area_rect.y0
-        page = None
-        def add_new_page_pdf():
-            nonlocal page, current_y
-            page = doc.new_page(width=page_width, height=page_height)
-            current_y = text_area_rect.y0
-            return page
-        page = add_new_page_pdf()
-        paragraphs = translated_text.split('\n\n')
-        for para_text in paragraphs:
-            para_text = para_text.strip()
-            if not para_text: continue
-            is_heading = para_text.startswith("## ")
-            display_text = para_text[3:].strip() if is_heading else para_text
-            fontsize = heading_fontsize if is_heading else regular_fontsize
-            fontname = font_bold if is_heading else font_regular
-            effective_line_height = fontsize * line_spacing_factor
-            if is_heading and current_y > text_area_rect.y0 + effective_line_height: current_y += heading_fontsize * 0.5
-            lines_in_para = display_text.split('\n')
-            for single_line in lines_in_para:
-                if current_y + effective_line_height > text_area_rect.y1: page = add_new_page_pdf()
-                page.insert_text(fitz.Point(text_area_rect.x0, current_y + fontsize), single_line, fontname=fontname, fontsize=fontsize)
-                current_y += effective_line_height
-            current_y += effective_line_height * 0.2
-        if doc.page_count > 0: 
-            doc.save(output_filepath, garbage=3, deflate=True)
-            print(f"    PDF reconstruction complete: {os.path.basename(output_filepath)}")
-            return True
-        else: 
-            print("    ⚠️ PDF not saved as no content was added.")
-            return False
-    except Exception as e: 
+        writer = open_pdf_book_writer(output_filepath, lang_code, font_path, bold_font_path)
+    except Exception as e:
         print(f"    ERROR saving PDF: {e}")
         return False
-    finally:
-        if doc: doc.close()
\ No newline at end of file
+    writer.write_part(translated_text)
+    return writer.close()
\ No newline at end of file
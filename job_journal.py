@@ -0,0 +1,125 @@
+# File: job_journal.py
+
+import hashlib
+import json
+import os
+import time
+
+
+def chunk_hash(chunk_text):
+    """Stable identifier for the content of one chunk."""
+    return hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+
+def compute_job_fingerprint(source_filepath, settings):
+    """
+    Fingerprints a job from the source file bytes and the settings that shape its chunks
+    and translations, so a journal is only re-used for the same book and configuration.
+    """
+    digest = hashlib.sha256()
+    with open(source_filepath, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(json.dumps(settings, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+class JobJournal:
+    """
+    Append-only JSONL journal of one translation job. It holds the job fingerprint, the
+    chunk plan and every completed chunk translation. Each write is flushed and fsynced so
+    a crash, Ctrl-C or quota exhaustion loses at most the chunks that were in flight.
+    """
+
+    def __init__(self, journal_path, fingerprint):
+        self.journal_path = journal_path
+        self.fingerprint = fingerprint
+        self.planned_hashes = {}
+        self.translations = {}  # index -> (chunk hash, translated text) loaded from a previous run
+        self._file = None
+
+    def _load(self):
+        """Reads an existing journal. Returns False if it belongs to a different job."""
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A torn final line from a crash mid-write
+                if record["type"] == "job":
+                    if record["fingerprint"] != self.fingerprint:
+                        return False
+                elif record["type"] == "plan":
+                    self.planned_hashes[record["index"]] = record["sha256"]
+                elif record["type"] == "result":
+                    if record["ok"]:
+                        self.translations[record["index"]] = (record["sha256"], record["translation"])
+                    else:
+                        self.translations.pop(record["index"], None)
+        return True
+
+    def _append(self, records, durable=True):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if durable:
+            os.fsync(self._file.fileno())
+
+    def record_planned_chunk(self, index, chunk):
+        """
+        Records one entry of the chunk plan as chunks are produced. Plan entries are synced
+        together with the next result, and unchanged entries are not rewritten on resume.
+        """
+        sha = chunk_hash(chunk)
+        if self.planned_hashes.get(index) != sha:
+            self.planned_hashes[index] = sha
+            self._append([{"type": "plan", "index": index, "sha256": sha, "chars": len(chunk)}], durable=False)
+
+    def record_result(self, index, chunk, result):
+        """Durably records the outcome (a translator.TranslationResult) of one chunk."""
+        self._append([{
+            "type": "result",
+            "index": index,
+            "sha256": chunk_hash(chunk),
+            "ok": result.ok,
+            "status": result.status,
+            "attempts": result.attempts,
+            "error": result.error,
+            "translation": result.text if result.ok else "",
+        }])
+
+    def completed_translation(self, index, chunk):
+        """Returns the journaled translation of a chunk if it still matches the plan, else None."""
+        entry = self.translations.get(index)
+        if entry and entry[0] == chunk_hash(chunk):
+            return entry[1]
+        return None
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+def open_job_journal(journal_path, fingerprint, resume=False):
+    """
+    Opens the journal for a job. With `resume`, an existing journal is re-used if its
+    fingerprint matches; otherwise a fresh journal replaces any previous one.
+    Returns None if resuming is impossible because the source or configuration changed.
+    """
+    journal = JobJournal(journal_path, fingerprint)
+    if resume and os.path.exists(journal_path):
+        if not journal._load():
+            print(f"❌ ERROR: Journal {os.path.basename(journal_path)} belongs to a different source file or configuration.")
+            return None
+        journal._file = open(journal_path, "a", encoding="utf-8")
+        if journal._file.tell() > 0:
+            with open(journal_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    journal._file.write("\n")  # Terminate a torn final line before appending
+        print(f"  Resuming from journal: {len(journal.translations)} chunk(s) already translated.")
+        return journal
+
+    if resume:
+        print(f"  No journal found at {journal_path}; starting a new job.")
+    journal._file = open(journal_path, "w", encoding="utf-8")
+    journal._append([{"type": "job", "fingerprint": fingerprint, "created": time.time()}])
+    return journal
@@ -1,8 +1,11 @@
 # File: main.py
 
 import os
+import argparse
+import subprocess
+import sys
 import time
-import re
+import asyncio
 from dotenv import load_dotenv
 import google.generativeai as genai
 
@@ -10,9 +13,37 @@ import google.generativeai as genai
 import file_handler
 import text_processor
 import translator
+import scheduler
+import translation_cache
+import job_journal
+import metrics
+import batch
+import offline_batch
+import epub_roundtrip
+import work_queue
+
+def parse_args():
+    """Command-line options for a translation run."""
+    parser = argparse.ArgumentParser(description="Translate a book with Gemini.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Re-use the job journal in translated_books/ and only translate missing or failed chunks.")
+    parser.add_argument("--batch", action="store_true",
+                        help="Translate every EPUB/PDF in source_books/ into every language in batch_languages.")
+    parser.add_argument("--export-batch", action="store_true",
+                        help="Write the chunks as a JSONL request file for the batch endpoint instead of calling the API.")
+    parser.add_argument("--ingest-batch", nargs="+", metavar="RESULTS_JSONL",
+                        help="Build the output file from batch results for the exported request file.")
+    parser.add_argument("--queue-coordinator", metavar="QUEUE_DB",
+                        help="Write the book's chunks to a shared SQLite work queue, wait for workers, then assemble the output.")
+    parser.add_argument("--queue-worker", metavar="QUEUE_DB",
+                        help="Translate chunks from a shared work queue with every key in GOOGLE_API_KEYS. Run as many as you like, on any host.")
+    parser.add_argument("--local-workers", type=int, default=0, metavar="N",
+                        help="With --queue-coordinator: also start N worker processes on this machine.")
+    return parser.parse_args()
 
 def main():
     """Main function to run the entire book translation workflow."""
+    args = parse_args()
 
     # --- 1. CONFIGURATION (Replaces the Colab Form) ---
     # Make sure to create a .env file with your GOOGLE_API_KEY
@@ -25,14 +56,71 @@ def main():
         "output_format": "EPUB",  # Options: TXT, EPUB, PDF
         "target_language_name": "Hindi",
         "target_language_code": "hi", # ISO 639-1 code
-        "max_chars_per_chunk": 10000, # Recommended to keep this within model context limits
-        "api_call_delay_seconds": 3,
-        "author_name": "Translator AI" # For EPUB metadata
+        "max_input_tokens_per_chunk": 2500, # Source tokens per chunk (about 10,000 English characters)
+        "max_output_tokens_per_chunk": 8192, # The model's output limit; the translation of a chunk must fit
+        "max_concurrent_requests": 8, # Requests kept in flight at once
+        "requests_per_minute": 15, # Set these to your API quota
+        "tokens_per_minute": 1000000,
+        "max_attempts_per_chunk": 4, # Retries with backoff for 429s, 5xx errors and timeouts
+        "pack_small_chunks_below_tokens": 500, # Smaller chunks share one request; set to 0 to disable packing
+        "max_tokens_per_packed_request": 4000,
+        "extraction_workers": os.cpu_count(), # Processes used to parse EPUB documents / PDF page ranges
+        "max_chunks_in_memory": 64, # Chunks buffered between extraction and the writer
+        "cache_path": os.path.join("cache", "translation_cache.sqlite"), # Set to None to disable the cache
+        "cache_max_megabytes": 500,
+        "progress_interval_seconds": 10, # Live progress/ETA line; per-chunk details go to the metrics file
+        "verbose_chunk_logs": False, # Also print a line for every chunk request
+        "profile_phases": [], # e.g. ["extraction", "reconstruction"] to save cProfile stats
+        "trace_memory": False, # tracemalloc peak and top allocation sites in the metrics summary
+        "author_name": "Translator AI", # For EPUB metadata
+        "pdf_font_path": None, # TTF/OTF for PDF output, e.g. "fonts/NotoSansDevanagari-Regular.ttf" (needed for Indic scripts)
+        "pdf_bold_font_path": None, # Optional bold face for headings
+        # Book-level context sent with every chunk; kept in the API's context cache where possible
+        "glossary": {}, # e.g. {"Genji": "गेंजी", "Kiritsubo": "किरित्सुबो"}
+        "style_notes": "", # e.g. "Keep the honorifics of the court; use formal register in dialogue."
+        "use_context_cache": True,
+        "context_cache_ttl_seconds": 3600,
+        "context_cache_min_prefix_tokens": 1024, # Smaller prefixes are sent inline; the API rejects them
+        "strip_pdf_headers_footers": True, # Drop running headers, footers and page numbers before translating
+        "deduplicate_paragraphs": True, # Translate repeated paragraphs once and re-use the translation
+        "min_duplicate_paragraph_chars": 40,
+        # EPUB -> EPUB: translate each document in a copy of the original package (keeps spine, images, CSS, TOC).
+        # Single-book runs only; --batch, --export-batch/--ingest-batch and the queue modes rebuild the EPUB from
+        # chunked text. Its chunks are one per text block, so cached translations are not shared with runs that
+        # chunk the same book for PDF/TXT output, and vice versa: off by default so that re-rendering a book in
+        # another format is served from the cache. Turn it on for EPUB output that keeps the original layout.
+        "preserve_epub_structure": False,
+        # --batch: every book in source_books/ into each of these languages (higher priority goes first)
+        "batch_languages": [
+            {"name": "Hindi", "code": "hi", "priority": 0},
+            {"name": "Bengali", "code": "bn", "priority": 0},
+            {"name": "Tamil", "code": "ta", "priority": 0},
+        ],
+        "batch_book_priorities": {}, # e.g. {"The Tale of Genji_Murasaki Shikibu.epub": 1}
+        "max_books_in_memory": 2, # Books held as chunks at once while their languages translate
+        # --queue-coordinator / --queue-worker: requests_per_minute and tokens_per_minute apply to each API key
+        "queue_lease_chunks": 32, # Chunks a worker takes from the queue at a time
+        "queue_lease_seconds": 300, # A worker that stops heartbeating loses its chunks after this long
+        "queue_poll_seconds": 5,
+        "queue_max_rounds_per_chunk": 3, # Times a rate-limited/transient chunk goes back to the queue before it is marked failed
+        "api_key_cooldown_seconds": 10 # First cool-down of a key after a 429 without a retry-after hint; doubles on repeats
     }
 
     # --- 2. SETUP & INITIALIZATION ---
     start_time_total = time.time()
 
+    if args.export_batch or args.ingest_batch:
+        # Offline batch jobs work on local files only; no API key is needed here
+        run_offline_batch_workflow(CONFIG, args)
+        return
+    if args.queue_coordinator:
+        # The coordinator only chunks and assembles; the workers hold the API keys
+        run_queue_coordinator(CONFIG, args, start_time_total)
+        return
+    if args.queue_worker:
+        run_queue_worker(CONFIG, args.queue_worker)
+        return
+
     # Configure the Gemini client
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -42,11 +130,18 @@ def main():
     model = genai.GenerativeModel(CONFIG["gemini_model_name"])
     print(f"🤖 Gemini client configured with model: {CONFIG['gemini_model_name']}")
 
+    if args.batch:
+        run_batch_workflow(model, CONFIG, args.resume, start_time_total)
+        return
+
     # Prepare file paths
     input_filepath = os.path.join("source_books", CONFIG["input_filename"])
     output_extension = "." + CONFIG["output_format"].lower()
     output_filename = f"{CONFIG['output_base_filename']}{output_extension}"
     output_filepath = os.path.join("translated_books", output_filename)
+    round_trip_epub = CONFIG["preserve_epub_structure"] and CONFIG["output_format"] == "EPUB" and input_filepath.lower().endswith(".epub")
+    journal_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.journal.jsonl")
+    metrics_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.metrics.jsonl")
     os.makedirs("source_books", exist_ok=True)
     os.makedirs("translated_books", exist_ok=True)
     
@@ -58,59 +153,163 @@ def main():
 
 
     # --- 3. WORKFLOW EXECUTION ---
+    # The phases run as one streaming pipeline: extract -> chunk -> translate -> write.
+    # Each stage pulls from the previous one with bounded buffers, so memory stays flat
+    # and early chapters reach the writer while later ones are still translating.
 
-    # Phase 1: Extract Text
-    print("Phase 1/4: Extracting text from book...")
-    extracted_text = file_handler.get_book_text(input_filepath)
-    if not extracted_text:
-        print("❌ ERROR: Failed to extract text. Workflow halted.")
-        return
-    print(f"✅ Text extracted successfully ({len(extracted_text):,} characters).\n")
+    prompt_context = translator.PromptContext(CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["glossary"], CONFIG["style_notes"])
 
-    # Phase 2: Chunk Text
-    print("Phase 2/4: Chunking text for translation...")
-    translation_chunks = text_processor.chunk_text_sensibly(extracted_text, CONFIG["max_chars_per_chunk"])
-    if not translation_chunks:
-        print("❌ ERROR: No text chunks were created. Workflow halted.")
+    # Open the job journal so completed chunks survive a crash or Ctrl-C
+    job_fingerprint = job_journal.compute_job_fingerprint(input_filepath, {
+        "model": CONFIG["gemini_model_name"],
+        "target_language_code": CONFIG["target_language_code"],
+        "max_input_tokens_per_chunk": CONFIG["max_input_tokens_per_chunk"],
+        "max_output_tokens_per_chunk": CONFIG["max_output_tokens_per_chunk"],
+        "prompt_version": prompt_context.prompt_version,
+        "strip_pdf_headers_footers": CONFIG["strip_pdf_headers_footers"],
+        "deduplicate_paragraphs": CONFIG["deduplicate_paragraphs"],
+        "min_duplicate_paragraph_chars": CONFIG["min_duplicate_paragraph_chars"],
+        "preserve_epub_structure": round_trip_epub,
+    }) if os.path.exists(input_filepath) else None
+    if not job_fingerprint:
+        print(f"❌ ERROR: File does not exist at path: {input_filepath}. Workflow halted.")
         return
-    num_chunks = len(translation_chunks)
-    print(f"✅ Text divided into {num_chunks} chunk(s).\n")
-    
-    # Phase 3: Translate Chunks
-    print(f"Phase 3/4: Translating {num_chunks} chunk(s) sequentially...")
-    all_translated_parts = []
-    for i, chunk in enumerate(translation_chunks):
-        print(f"  Translating chunk {i+1} of {num_chunks} ({len(chunk):,} chars)...")
-        translated_part = translator.translate_single_chunk(
-            chunk,
-            CONFIG["target_language_name"],
+    journal = job_journal.open_job_journal(journal_filepath, job_fingerprint, resume=args.resume)
+    if not journal:
+        print("❌ ERROR: Cannot resume this job. Run without --resume to start over. Workflow halted.")
+        return
+
+    run_metrics = metrics.MetricsRecorder(metrics_filepath, profile_phases=CONFIG["profile_phases"], trace_memory=CONFIG["trace_memory"])
+    progress = metrics.ProgressReporter(CONFIG["progress_interval_seconds"])
+
+    # Phases 1 & 2: Extraction runs in worker processes; chunking consumes its segments as they arrive
+    print("Phase 1-2/4: Extracting and chunking text from book...")
+    extracted_chars = 0
+    source_chunks = {}  # Chunks in flight, kept until delivery for their journal records
+    boilerplate_stats = {}
+    repeated_paragraphs = text_processor.RepeatedParagraphFilter(CONFIG["min_duplicate_paragraph_chars"]) if CONFIG["deduplicate_paragraphs"] else None
+    round_trip = None
+    if round_trip_epub:
+        # Every text block of every document is its own chunk (small ones are packed into
+        # shared requests, oversized ones split within the chunk budget), and translations
+        # go back into the same elements
+        def split_segment(segment):
+            return text_processor.split_segment_by_tokens(segment, CONFIG["max_input_tokens_per_chunk"], CONFIG["max_output_tokens_per_chunk"],
+                                                          CONFIG["target_language_code"])
+        try:
+            round_trip = epub_roundtrip.EpubRoundTripWriter(input_filepath, output_filepath, CONFIG["target_language_code"], split_segment=split_segment)
+        except Exception as e:
+            journal.close()
+            print(f"❌ ERROR: Cannot read the EPUB package: {type(e).__name__} - {e}. Workflow halted.")
+            return
+        repeated_paragraphs = None
+        book_segments = round_trip.iter_segments()
+    else:
+        book_segments = file_handler.iter_book_text(input_filepath, workers=CONFIG["extraction_workers"],
+                                                    strip_repeated_lines=CONFIG["strip_pdf_headers_footers"], stats=boilerplate_stats)
+    def counted_segments():
+        nonlocal extracted_chars
+        for segment in run_metrics.timed_iter("extraction", book_segments):
+            extracted_chars += len(segment)
+            yield segment
+    if round_trip:
+        translation_chunks = counted_segments()
+    else:
+        translation_chunks = run_metrics.timed_iter("chunking", text_processor.iter_chunks_by_tokens(
+            counted_segments(),
+            CONFIG["max_input_tokens_per_chunk"],
+            CONFIG["max_output_tokens_per_chunk"],
             CONFIG["target_language_code"],
-            model
-        )
-        all_translated_parts.append(translated_part)
+            repeated_paragraphs=repeated_paragraphs
+        ))
 
-        if translated_part.startswith("[CHUNK"): # Check for our error markers
-             print(f"    ⚠️ WARNING: Chunk {i+1} failed/blocked. See message above.")
-        else:
-            print(f"    ✅ Chunk {i+1} translated successfully.")
+    # Phase 3: Translate chunks as they are produced
+    print(f"Phase 3/4: Translating with up to {CONFIG['max_concurrent_requests']} request(s) in flight...")
+    rate_limiter = scheduler.RateLimiter(CONFIG["requests_per_minute"], CONFIG["tokens_per_minute"])
+    cache = None
+    if CONFIG["cache_path"]:
+        cache = translation_cache.TranslationCache(CONFIG["cache_path"], CONFIG["cache_max_megabytes"] * 1024 * 1024)
+    if CONFIG["use_context_cache"]:
+        prompt_context.register(model, CONFIG["context_cache_ttl_seconds"], CONFIG["context_cache_min_prefix_tokens"])
+    engine = scheduler.TranslationEngine(
+        model,
+        CONFIG["target_language_name"],
+        CONFIG["target_language_code"],
+        rate_limiter,
+        max_concurrency=CONFIG["max_concurrent_requests"],
+        cache=cache,
+        model_name=CONFIG["gemini_model_name"],
+        pack_chunk_tokens=CONFIG["pack_small_chunks_below_tokens"],
+        max_pack_tokens=CONFIG["max_tokens_per_packed_request"],
+        max_output_tokens=CONFIG["max_output_tokens_per_chunk"],
+        max_buffered_chunks=CONFIG["max_chunks_in_memory"],
+        max_attempts=CONFIG["max_attempts_per_chunk"],
+        verbose=CONFIG["verbose_chunk_logs"],
+        prompt_context=prompt_context,
+        deduplicate_chunks=CONFIG["deduplicate_paragraphs"]
+    )
+    def record_chunk(index, result):
+        journal.record_result(index, source_chunks[index], result)
+        run_metrics.record_chunk(index, source_chunks[index], result)
+    def plan_chunk(index, chunk):
+        # Called on the event loop for every chunk read: journal the plan and
+        # return the translation from a previous run, if there is one
+        journal.record_planned_chunk(index, chunk)
+        source_chunks[index] = chunk
+        return journal.completed_translation(index, chunk)
+
+    # Phase 4: Chapters are written as soon as all of their chunks are translated
+    book_title = CONFIG['output_base_filename'].replace('_', ' ')
+    writer = round_trip or file_handler.open_book_writer(CONFIG["output_format"], output_filepath, CONFIG["target_language_code"], book_title, CONFIG["author_name"],
+                                                         CONFIG["pdf_font_path"], CONFIG["pdf_bold_font_path"])
+    if not writer:
+        journal.close()
+        print("❌ ERROR: Cannot create the output file. Workflow halted.")
+        return
 
-        if i < num_chunks - 1 and CONFIG["api_call_delay_seconds"] > 0:
-            time.sleep(CONFIG["api_call_delay_seconds"])
-    print("✅ All chunks processed.\n")
+    async def run_pipeline():
+        async for index, result in engine.translate_stream(translation_chunks, on_result=record_chunk, completed_lookup=plan_chunk):
+            chunk = source_chunks.pop(index, "")
+            if result.source == "journal":
+                run_metrics.record_chunk(index, chunk, result)
+            progress.update(len(chunk), engine.num_chunks)
+            with run_metrics.timer("reconstruction"):
+                writer.write_part(result.output_text(chunk))
 
-    # Phase 4: Assemble and Save
-    print("Phase 4/4: Assembling and saving final file...")
-    final_translated_text = "\n\n".join(all_translated_parts)
-    final_translated_text = re.sub(r'(\n\s*){3,}', '\n\n', final_translated_text)
-    
     file_saved = False
-    book_title = CONFIG['output_base_filename'].replace('_', ' ')
-    if CONFIG["output_format"] == "TXT":
-        file_saved = file_handler.save_text_file(final_translated_text, output_filepath)
-    elif CONFIG["output_format"] == "EPUB":
-        file_saved = file_handler.reconstruct_epub_basic(final_translated_text, CONFIG["target_language_code"], book_title, CONFIG["author_name"], output_filepath)
-    elif CONFIG["output_format"] == "PDF":
-        file_saved = file_handler.reconstruct_pdf_basic(final_translated_text, output_filepath)
+    try:
+        with run_metrics.timer("pipeline"):
+            asyncio.run(run_pipeline())
+        if engine.num_chunks:
+            print(f"✅ Text extracted ({extracted_chars:,} characters) and all {engine.num_chunks} chunk(s) processed with {engine.requests_sent} API request(s) ({engine.retries} retries, {engine.requeued_chunks} re-queued).")
+            print_dedup_report(boilerplate_stats, repeated_paragraphs, engine)
+            if engine.failed_chunks:
+                print(f"    ⚠️ WARNING: {engine.failed_chunks} chunk(s) failed and are marked in the output. Run again with --resume to retry only those.")
+            print()
+            print("Phase 4/4: Finishing the output file...")
+            with run_metrics.timer("reconstruction"):
+                file_saved = writer.close()
+        else:
+            print("❌ ERROR: No text chunks were created. Workflow halted.")
+            writer.abort()
+    except Exception as e:
+        print(f"❌ ERROR: Pipeline failed: {type(e).__name__} - {e}. Workflow halted.")
+        writer.abort()
+    finally:
+        journal.close()
+        prompt_context.release()
+        print_prompt_token_report(prompt_context)
+        cache_stats = None
+        if cache:
+            cache_stats = cache.stats()
+            print(f"  Cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es), {cache_stats['entries']} entries stored.")
+            cache.close()
+        summary = run_metrics.close(requests_sent=engine.requests_sent, requeued_chunks=engine.requeued_chunks, cache=cache_stats,
+                                    prompt_tokens=prompt_context.token_report(), boilerplate=boilerplate_stats,
+                                    duplicate_chunks=engine.duplicate_chunks, duplicate_chars=engine.duplicate_chars, file_saved=file_saved)
+        phase_times = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in sorted(summary["phase_seconds"].items()))
+        print(f"  📈 Phase times: {phase_times}; API latency {summary['latency_seconds']:.1f}s over {summary['api_chunks']} chunk(s).")
+        print(f"     Per-chunk metrics written to: {metrics_filepath}")
 
     total_time = time.time() - start_time_total
     print("\n-------------------------------------------")
@@ -122,5 +321,295 @@ def main():
         print(f"❌ FAILED: The final file could not be saved.")
     print("-------------------------------------------\n")
 
+def print_dedup_report(boilerplate_stats, repeated_paragraphs, engine):
+    """Reports the characters and requests saved by stripping boilerplate and re-using duplicate translations."""
+    if boilerplate_stats.get("boilerplate_blocks"):
+        print(f"    🧹 Stripped {boilerplate_stats['boilerplate_blocks']:,} running header/footer/page-number line(s) ({boilerplate_stats['boilerplate_chars']:,} chars).")
+    if repeated_paragraphs and repeated_paragraphs.repeated_paragraphs:
+        print(f"    🧹 {repeated_paragraphs.repeated_paragraphs:,} repeated paragraph(s) ({repeated_paragraphs.repeated_chars:,} chars) kept apart for re-use.")
+    if engine.duplicate_chunks:
+        print(f"    ♻️ {engine.duplicate_chunks:,} duplicate chunk(s) ({engine.duplicate_chars:,} chars) re-used a single translation instead of a request.")
+
+def print_prompt_token_report(prompt_context):
+    """Reports how many prompt-prefix tokens were sent inline and how many came from the context cache."""
+    report = prompt_context.token_report()
+    if not report["requests"]:
+        return
+    print(f"  🧾 Prompt tokens (estimated): prefix {report['prefix_tokens']} x {report['requests']} request(s), per-chunk text {report['suffix_tokens']:,}.")
+    if report["cached_prefix_tokens"]:
+        total = report["cached_prefix_tokens"] + report["suffix_tokens"]
+        print(f"     {report['cached_prefix_tokens']:,} prefix token(s) served from the context cache instead of re-sent at the full input rate ({report['cached_prefix_tokens'] / total:.0%} of prompt tokens).")
+    elif report["inline_prefix_tokens"]:
+        print(f"     {report['inline_prefix_tokens']:,} prefix token(s) were sent inline (context cache not used).")
+    if report["reported_prompt_tokens"]:
+        print(f"     API-reported usage: {report['reported_prompt_tokens']:,} prompt token(s), {report['reported_cached_tokens']:,} of them from the context cache.")
+
+def note_epub_structure_not_preserved(CONFIG, mode_name):
+    """preserve_epub_structure applies to single-book runs; the other modes say so instead of ignoring it silently."""
+    if CONFIG["preserve_epub_structure"] and CONFIG["output_format"] == "EPUB":
+        print(f"⚠️ preserve_epub_structure applies to single-book runs only; {mode_name} rebuilds the EPUB from the translated text.")
+
+def run_offline_batch_workflow(CONFIG, args):
+    """Exports the book's chunks as a batch request file, or builds the output from batch results."""
+    input_filepath = os.path.join("source_books", CONFIG["input_filename"])
+    requests_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.batch_requests.jsonl")
+    retry_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.batch_retry_requests.jsonl")
+    output_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.{CONFIG['output_format'].lower()}")
+    os.makedirs("translated_books", exist_ok=True)
+    note_epub_structure_not_preserved(CONFIG, "the offline batch mode")
+
+    if args.export_batch:
+        if not os.path.exists(input_filepath):
+            print(f"❌ ERROR: File does not exist at path: {input_filepath}. Workflow halted.")
+            return
+        prompt_context = translator.PromptContext(CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["glossary"], CONFIG["style_notes"])
+        print(f"📦 Exporting batch requests for {CONFIG['input_filename']} ({CONFIG['target_language_name']})...")
+        chunks = text_processor.iter_chunks_by_tokens(
+            file_handler.iter_book_text(input_filepath, workers=CONFIG["extraction_workers"], strip_repeated_lines=CONFIG["strip_pdf_headers_footers"]),
+            CONFIG["max_input_tokens_per_chunk"],
+            CONFIG["max_output_tokens_per_chunk"],
+            CONFIG["target_language_code"],
+            repeated_paragraphs=text_processor.RepeatedParagraphFilter(CONFIG["min_duplicate_paragraph_chars"]) if CONFIG["deduplicate_paragraphs"] else None
+        )
+        offline_batch.write_batch_requests(chunks, requests_filepath, CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["gemini_model_name"], prompt_context=prompt_context)
+        print(f"✅ Submit {requests_filepath} to the batch endpoint, then run with --ingest-batch <results.jsonl>.")
+        return
+
+    if not os.path.exists(offline_batch.manifest_path_for(requests_filepath)):
+        print(f"❌ ERROR: No exported batch found at {requests_filepath}. Run with --export-batch first.")
+        return
+    print(f"📥 Ingesting batch results from {len(args.ingest_batch)} file(s)...")
+    chunks, results = offline_batch.ingest_batch_results(requests_filepath, args.ingest_batch)
+    prompt_version = offline_batch.load_batch_manifest(requests_filepath)["prompt_version"]
+
+    cache = None
+    if CONFIG["cache_path"]:
+        # Successful batch translations are cached, so a later interactive run re-uses them
+        cache = translation_cache.TranslationCache(CONFIG["cache_path"], CONFIG["cache_max_megabytes"] * 1024 * 1024)
+        for chunk, result in zip(chunks, results):
+            if result.ok:
+                cache.put(cache.make_key(chunk, CONFIG["target_language_code"], CONFIG["gemini_model_name"], prompt_version), result.text)
+        cache.close()
+
+    retry_indexes = offline_batch.failed_chunk_indexes(results)
+    if retry_indexes:
+        prompt_context = translator.PromptContext(CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["glossary"], CONFIG["style_notes"])
+        offline_batch.write_batch_requests(chunks, retry_filepath, CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["gemini_model_name"],
+                                           only_indexes=retry_indexes, prompt_context=prompt_context)
+        print(f"    ⚠️ WARNING: {len(retry_indexes)} chunk(s) are missing or failed. Submit {retry_filepath}, then ingest both results files together.")
+
+    book_title = CONFIG['output_base_filename'].replace('_', ' ')
+    writer = file_handler.open_book_writer(CONFIG["output_format"], output_filepath, CONFIG["target_language_code"], book_title, CONFIG["author_name"],
+                                           CONFIG["pdf_font_path"], CONFIG["pdf_bold_font_path"])
+    if not writer:
+        print("❌ ERROR: Cannot create the output file. Workflow halted.")
+        return
+    for chunk, result in zip(chunks, results):
+        writer.write_part(result.output_text(chunk))
+    if writer.close():
+        print(f"🎉 Output saved to: {output_filepath}")
+
+def run_batch_workflow(model, CONFIG, resume, start_time_total):
+    """Translates every book in source_books/ into every batch language with one shared scheduler."""
+    os.makedirs("source_books", exist_ok=True)
+    os.makedirs("translated_books", exist_ok=True)
+    book_filepaths = batch.find_source_books("source_books")
+    if not book_filepaths:
+        print("❌ ERROR: No EPUB or PDF files found in source_books/. Workflow halted.")
+        return
+
+    languages = ", ".join(f"{language['name']} ({language['code']})" for language in CONFIG["batch_languages"])
+    print("\n--- Starting Batch Translation Workflow ---")
+    print(f"📚 Books: {len(book_filepaths)}")
+    print(f"🌐 Languages: {languages}")
+    print(f"💾 Outputs: {len(book_filepaths) * len(CONFIG['batch_languages'])} {CONFIG['output_format']} file(s) in translated_books/")
+    print("-------------------------------------------\n")
+    note_epub_structure_not_preserved(CONFIG, "--batch")
+
+    cache = None
+    if CONFIG["cache_path"]:
+        cache = translation_cache.TranslationCache(CONFIG["cache_path"], CONFIG["cache_max_megabytes"] * 1024 * 1024)
+    batch_translator = batch.BatchTranslator(model, CONFIG, cache=cache, resume=resume)
+    try:
+        jobs = asyncio.run(batch_translator.run(book_filepaths))
+    finally:
+        if cache:
+            cache.close()
+
+    total_time = time.time() - start_time_total
+    saved = [job for job in jobs if job.file_saved]
+    cached_prefix_tokens = sum(job.prompt_tokens["cached_prefix_tokens"] for job in jobs if job.prompt_tokens)
+    inline_prefix_tokens = sum(job.prompt_tokens["inline_prefix_tokens"] for job in jobs if job.prompt_tokens)
+    print("\n-------------------------------------------")
+    print(f"{'🎉 SUCCESS!' if len(saved) == len(jobs) else '⚠️ PARTIAL:'} {len(saved)} of {len(jobs)} translation(s) saved in {total_time/60:.2f} minutes.")
+    print(f"   Prompt prefix tokens (estimated): {cached_prefix_tokens:,} from the context cache, {inline_prefix_tokens:,} sent inline.")
+    reported_prompt_tokens = sum(job.prompt_tokens["reported_prompt_tokens"] for job in jobs if job.prompt_tokens)
+    reported_cached_tokens = sum(job.prompt_tokens["reported_cached_tokens"] for job in jobs if job.prompt_tokens)
+    if reported_prompt_tokens:
+        print(f"   API-reported prompt tokens: {reported_prompt_tokens:,}, {reported_cached_tokens:,} of them from the context cache.")
+    for job in jobs:
+        if job.file_saved:
+            tokens = f", {job.tokens_granted:,} tokens" if CONFIG["tokens_per_minute"] else ""
+            print(f"   -> {job.output_filepath} ({job.requests_granted} request(s){tokens} of the shared budget)")
+        else:
+            print(f"   ❌ {job.label}: {job.error or 'failed'}")
+    print("-------------------------------------------\n")
+
+def load_api_keys():
+    """API keys from GOOGLE_API_KEYS (comma or whitespace separated) and GOOGLE_API_KEY, without duplicates."""
+    keys = (os.getenv("GOOGLE_API_KEYS") or "").replace(",", " ").split() + [os.getenv("GOOGLE_API_KEY") or ""]
+    return list(dict.fromkeys(key for key in keys if key))
+
+class KeyedGenerativeModel:
+    """
+    generate_content_async() on its own API key; genai.configure() holds only one key per
+    process. The async client is created on the first request, so it belongs to the event
+    loop that runs the requests.
+    """
+
+    def __init__(self, model_name, api_key):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.api_key = api_key
+        self._client = None
+
+    async def generate_content_async(self, prompt):
+        from google.ai import generativelanguage as glm
+        if self._client is None:
+            self._client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+        response = await self._client.generate_content(model=self.model_name, contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])])
+        return genai.types.GenerateContentResponse.from_response(response)
+
+def run_queue_worker(CONFIG, queue_filepath):
+    """Translates chunks from a shared work queue, rotating across the API key pool, until the job is done."""
+    api_keys = load_api_keys()
+    if not api_keys:
+        print("🛑 FATAL ERROR: No API keys found. Set GOOGLE_API_KEYS (or GOOGLE_API_KEY) in your .env file.")
+        return
+    queue = work_queue.WorkQueue(queue_filepath)
+    settings = work_queue.wait_for_job_settings(queue, CONFIG["queue_poll_seconds"])
+    key_pool = scheduler.ApiKeyPool(
+        [scheduler.ApiKey(f"#{number} (...{api_key[-4:]})", KeyedGenerativeModel(settings["model"], api_key), CONFIG["requests_per_minute"], CONFIG["tokens_per_minute"])
+         for number, api_key in enumerate(api_keys, start=1)],
+        base_cooldown_seconds=CONFIG["api_key_cooldown_seconds"]
+    )
+    cache = None
+    if CONFIG["cache_path"]:
+        cache = translation_cache.TranslationCache(CONFIG["cache_path"], CONFIG["cache_max_megabytes"] * 1024 * 1024)
+    worker = work_queue.QueueWorker(queue, key_pool, CONFIG, cache=cache)
+    try:
+        chunks_done = asyncio.run(worker.run())
+        print(f"✅ Worker {worker.worker_id} finished: {chunks_done} chunk(s) translated with {worker.engine.requests_sent} API request(s).")
+        for key_stats in key_pool.stats():
+            print(f"   🔑 Key {key_stats['key']}: {key_stats['requests']} request(s), {key_stats['rate_limited']} rate-limited.")
+    except KeyboardInterrupt:
+        print(f"⏹️ Worker {worker.worker_id} stopped; its chunks went back to the queue.")
+    finally:
+        queue.close()
+        if cache:
+            cache.close()
+
+def run_queue_coordinator(CONFIG, args, start_time_total):
+    """Writes the book's chunks to a shared work queue, waits until workers have translated them all, and assembles the output."""
+    input_filepath = os.path.join("source_books", CONFIG["input_filename"])
+    output_filepath = os.path.join("translated_books", f"{CONFIG['output_base_filename']}.{CONFIG['output_format'].lower()}")
+    os.makedirs("translated_books", exist_ok=True)
+    if not os.path.exists(input_filepath):
+        print(f"❌ ERROR: File does not exist at path: {input_filepath}. Workflow halted.")
+        return
+    note_epub_structure_not_preserved(CONFIG, "the queue coordinator")
+
+    settings = {
+        "model": CONFIG["gemini_model_name"],
+        "target_language_name": CONFIG["target_language_name"],
+        "target_language_code": CONFIG["target_language_code"],
+        "glossary": CONFIG["glossary"],
+        "style_notes": CONFIG["style_notes"],
+    }
+    prompt_context = translator.PromptContext(CONFIG["target_language_name"], CONFIG["target_language_code"], CONFIG["glossary"], CONFIG["style_notes"])
+    job_fingerprint = job_journal.compute_job_fingerprint(input_filepath, {
+        **settings,
+        "max_input_tokens_per_chunk": CONFIG["max_input_tokens_per_chunk"],
+        "max_output_tokens_per_chunk": CONFIG["max_output_tokens_per_chunk"],
+        "prompt_version": prompt_context.prompt_version,
+        "strip_pdf_headers_footers": CONFIG["strip_pdf_headers_footers"],
+        "min_duplicate_paragraph_chars": CONFIG["min_duplicate_paragraph_chars"] if CONFIG["deduplicate_paragraphs"] else None,
+    })
+    queue = work_queue.WorkQueue(args.queue_coordinator)
+    print("\n--- Starting Work Queue Coordinator ---")
+    print(f"📖 Source: {CONFIG['input_filename']}")
+    print(f"🗃️ Queue: {args.queue_coordinator}")
+    print("-------------------------------------------\n")
+
+    workers = []
+    aborted = False
+    try:
+        if args.resume:
+            if not queue.resume_job(job_fingerprint):
+                print("❌ ERROR: The queue belongs to a different book or configuration. Run without --resume to start over. Workflow halted.")
+                return
+            print("  Resuming the queue: failed chunks are queued again.")
+        else:
+            queue.start_job(job_fingerprint, settings)
+        for _ in range(max(0, args.local_workers)):
+            workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--queue-worker", args.queue_coordinator]))
+        if workers:
+            print(f"  Started {len(workers)} local worker process(es).")
+
+        if not queue.enqueue_complete:
+            print("Phase 1-2/4: Extracting and chunking text into the queue...")
+            num_chunks = queue.add_chunks(text_processor.iter_chunks_by_tokens(
+                file_handler.iter_book_text(input_filepath, workers=CONFIG["extraction_workers"], strip_repeated_lines=CONFIG["strip_pdf_headers_footers"]),
+                CONFIG["max_input_tokens_per_chunk"],
+                CONFIG["max_output_tokens_per_chunk"],
+                CONFIG["target_language_code"],
+                repeated_paragraphs=text_processor.RepeatedParagraphFilter(CONFIG["min_duplicate_paragraph_chars"]) if CONFIG["deduplicate_paragraphs"] else None
+            ))
+            print(f"✅ {num_chunks} chunk(s) queued.")
+
+        print("Phase 3/4: Waiting for workers (start more with --queue-worker on any host)...")
+        last_report = 0.0
+        while not queue.is_finished():
+            if time.time() - last_report >= CONFIG["progress_interval_seconds"]:
+                last_report = time.time()
+                counts = queue.counts()
+                print(f"  📊 Queue: {counts['done']} done, {counts['leased']} leased by {counts['workers']} worker(s), {counts['pending']} pending.")
+            time.sleep(CONFIG["queue_poll_seconds"])
+
+        print("Phase 4/4: Assembling the output file...")
+        book_title = CONFIG['output_base_filename'].replace('_', ' ')
+        writer = file_handler.open_book_writer(CONFIG["output_format"], output_filepath, CONFIG["target_language_code"], book_title, CONFIG["author_name"],
+                                               CONFIG["pdf_font_path"], CONFIG["pdf_bold_font_path"])
+        if not writer:
+            print("❌ ERROR: Cannot create the output file. Workflow halted.")
+            return
+        try:
+            for _, chunk, result in queue.iter_results():
+                writer.write_part(result.output_text(chunk))
+            file_saved = writer.close()
+        except Exception as e:
+            print(f"❌ ERROR: Assembly failed: {type(e).__name__} - {e}. Workflow halted.")
+            writer.abort()
+            return
+        failed = queue.counts()["failed"]
+        if failed:
+            print(f"    ⚠️ WARNING: {failed} chunk(s) failed and are marked in the output. Run again with --resume to queue only those.")
+        if file_saved:
+            print(f"🎉 Output saved to: {output_filepath} ({(time.time() - start_time_total) / 60:.2f} minutes).")
+    except Exception as e:
+        print(f"❌ ERROR: Queue coordinator failed: {type(e).__name__} - {e}. Workflow halted.")
+        aborted = True
+    except KeyboardInterrupt:
+        print("⏹️ Coordinator stopped. Run again with --resume to continue the queue.")
+        aborted = True
+    finally:
+        if aborted:
+            # Workers would otherwise wait forever for chunks that are never enqueued
+            for worker in workers:
+                worker.terminate()
+            queue.abort_job()
+        for worker in workers:
+            worker.wait()
+        queue.close()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
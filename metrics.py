@@ -0,0 +1,213 @@
+# File: metrics.py
+
+import cProfile
+import contextlib
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+import text_processor
+
+class MetricsRecorder:
+    """
+    Structured instrumentation for a translation run. Writes JSONL events to `events_path`:
+    one "chunk" record per translated chunk, one "phase" record per pipeline phase and a
+    final "summary". Phases overlap in the streaming pipeline, so each phase reports the
+    time spent inside that stage rather than wall-clock start/end.
+    Phases named in `profile_phases` run under cProfile (stats are saved next to the events
+    file); `trace_memory` turns on tracemalloc and reports the top allocation sites.
+    """
+
+    def __init__(self, events_path=None, profile_phases=(), trace_memory=False):
+        self.events_path = events_path
+        self.profile_phases = set(profile_phases or ())
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.phase_seconds = {}
+        self.totals = {"chunks": 0, "api_chunks": 0, "input_chars": 0, "output_chars": 0, "retries": 0, "failed": 0, "latency_seconds": 0.0}
+        self._profilers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        if events_path:
+            directory = os.path.dirname(events_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(events_path, "w", encoding="utf-8")
+        if trace_memory:
+            tracemalloc.start()
+
+    def emit(self, event, **fields):
+        """Writes one structured event."""
+        if not self._file:
+            return
+        record = {"ts": round(time.time(), 3), "event": event, **fields}
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def _add_phase_time(self, name, seconds):
+        with self._lock:
+            self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        """
+        Accumulates the time spent in the block under phase `name` (profiled if requested).
+        Timers nest per thread and are exclusive: time spent in an inner phase, such as
+        extraction pulled by the chunker, is not counted again in the outer one.
+        """
+        stack = self._timer_stack()
+        profiler = self._profiler_for(name)
+        stack.append(0.0)  # Time consumed by nested phases
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self._add_phase_time(name, elapsed - nested)
+
+    def _timer_stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def timed_iter(self, name, iterable):
+        """Wraps an iterator so the time spent producing each item counts toward phase `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.timer(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def _profiler_for(self, name):
+        if name not in self.profile_phases:
+            return None
+        # cProfile only sees the thread that enables it, so keep one profiler per thread
+        key = (name, threading.get_ident())
+        with self._lock:
+            if key not in self._profilers:
+                self._profilers[key] = cProfile.Profile()
+            return self._profilers[key]
+
+    def record_chunk(self, index, chunk, result):
+        """
+        Writes the per-chunk record for a translator.TranslationResult. A chunk translated in
+        a packed request carries its share of that request's latency.
+        """
+        output_chars = len(result.text) if result.ok else 0
+        with self._lock:
+            self.totals["chunks"] += 1
+            self.totals["input_chars"] += len(chunk)
+            self.totals["output_chars"] += output_chars
+            if result.source == "api":
+                self.totals["api_chunks"] += 1
+                self.totals["retries"] += result.attempts - 1
+                self.totals["latency_seconds"] += result.latency
+            if not result.ok:
+                self.totals["failed"] += 1
+        self.emit(
+            "chunk",
+            index=index,
+            source=result.source,
+            status=result.status,
+            input_chars=len(chunk),
+            estimated_tokens=text_processor.estimate_tokens(chunk),
+            output_chars=output_chars,
+            expansion_ratio=round(output_chars / len(chunk), 3) if chunk and result.ok else None,
+            latency_seconds=round(result.latency, 3),
+            attempts=result.attempts,
+            retries=result.attempts - 1,
+            block_reason=result.error if result.status == "blocked" else None,
+            error=result.error or None,
+        )
+
+    def close(self, **summary_fields):
+        """Emits phase and summary events, writes profiles, and returns the summary dict."""
+        for name, seconds in sorted(self.phase_seconds.items()):
+            self.emit("phase", phase=name, seconds=round(seconds, 3))
+
+        profile_files = self._save_profiles()
+        summary = {
+            "wall_seconds": round(time.time() - self.started, 3),
+            "phase_seconds": {name: round(seconds, 3) for name, seconds in self.phase_seconds.items()},
+            **self.totals,
+            **summary_fields,
+        }
+        summary["latency_seconds"] = round(summary["latency_seconds"], 3)
+        if profile_files:
+            summary["profiles"] = profile_files
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary["traced_peak_mb"] = round(peak / 1024 / 1024, 1)
+            summary["top_allocations"] = [
+                {"site": str(stat.traceback[0]), "kb": round(stat.size / 1024, 1)}
+                for stat in snapshot.statistics("lineno")[:10]
+            ]
+        self.emit("summary", **summary)
+        if self._file:
+            self._file.close()
+            self._file = None
+        return summary
+
+    def _save_profiles(self):
+        profile_files = {}
+        base = os.path.splitext(self.events_path)[0] if self.events_path else "metrics"
+        for name in sorted({name for name, _ in self._profilers}):
+            profilers = [profiler for (phase, _), profiler in self._profilers.items() if phase == name]
+            stats = pstats.Stats(profilers[0])
+            for profiler in profilers[1:]:
+                stats.add(profiler)
+            profile_path = f"{base}.{name}.prof"
+            stats.dump_stats(profile_path)
+            profile_files[name] = profile_path
+        return profile_files
+
+class ProgressReporter:
+    """Prints a one-line progress summary with throughput and ETA at most every `interval_seconds`."""
+
+    def __init__(self, interval_seconds=10.0):
+        self.interval_seconds = interval_seconds
+        self.started = time.monotonic()
+        self._last_report = self.started
+        self.done = 0
+        self.chars_done = 0
+
+    def update(self, chars, total_chunks=None, force=False):
+        """Counts one finished chunk of `chars` characters; `total_chunks` once it is known."""
+        self.done += 1
+        self.chars_done += chars
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval_seconds:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        chunks_per_second = self.done / elapsed
+        if total_chunks:
+            remaining = max(total_chunks - self.done, 0)
+            eta = f"ETA {_format_duration(remaining / chunks_per_second)}" if chunks_per_second else "ETA --"
+            position = f"{self.done}/{total_chunks} chunks ({self.done / total_chunks:.0%})"
+        else:
+            eta = "ETA pending (still reading the book)"
+            position = f"{self.done} chunks"
+        print(f"  📊 Progress: {position}, {chunks_per_second:.2f} chunks/s, {self.chars_done / elapsed:,.0f} chars/s, {eta}")
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
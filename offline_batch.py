@@ -0,0 +1,167 @@
+# File: offline_batch.py
+
+import hashlib
+import json
+import os
+
+import translator
+
+# Offline batch jobs: chunks are written to a JSONL request file for the provider's batch
+# endpoint (one generate_content request per line, keyed by a stable chunk ID), and the
+# results JSONL it returns is read back into TranslationResults in chunk order.
+# A manifest next to the request file keeps the chunk texts and job settings, so ingest
+# needs neither the source book nor a live service.
+
+MISSING_RESULT_ERROR = "MISSING FROM BATCH RESULTS"
+
+def make_chunk_id(index, chunk_text):
+    """Stable ID of a chunk: its position plus a hash of its text, e.g. 'chunk-00042-3f2a9c1b7d0e'."""
+    digest = hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()[:12]
+    return f"chunk-{index:05d}-{digest}"
+
+def manifest_path_for(requests_filepath):
+    return os.path.splitext(requests_filepath)[0] + ".manifest.json"
+
+def build_batch_request(chunk_id, chunk_text, target_language_name, target_language_code, prompt_context=None):
+    """One line of the request file, using the same prompt as translate_single_chunk."""
+    if prompt_context:
+        prompt = prompt_context.prefix + translator.build_chunk_prompt_suffix(chunk_text, target_language_name)
+    else:
+        prompt = translator.build_translation_prompt(chunk_text, target_language_name, target_language_code)
+    return {"key": chunk_id, "request": {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}}
+
+def write_batch_requests(chunks, requests_filepath, target_language_name, target_language_code, model_name="", only_indexes=None, prompt_context=None):
+    """
+    Writes one JSONL request per chunk (or per chunk in `only_indexes`, e.g. to resubmit
+    failures) and the manifest for ingest. `chunks` may be any iterable, such as a
+    streaming chunker. A chunk identical to an earlier one gets no request of its own; the
+    manifest points it at the first one's ID. A translator.PromptContext adds the job's glossary and style notes.
+    Returns the number of requests written.
+    """
+    directory = os.path.dirname(requests_filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    manifest_chunks = []
+    first_ids = {}  # Chunk text -> ID of its first occurrence
+    num_requests = 0
+    with open(requests_filepath, "w", encoding="utf-8") as f:
+        for index, chunk in enumerate(chunks):
+            chunk_id = make_chunk_id(index, chunk)
+            if chunk in first_ids:
+                manifest_chunks.append({"id": chunk_id, "text": chunk, "same_as": first_ids[chunk]})
+                continue
+            first_ids[chunk] = chunk_id
+            manifest_chunks.append({"id": chunk_id, "text": chunk})
+            if only_indexes is not None and index not in only_indexes:
+                continue
+            request = build_batch_request(chunk_id, chunk, target_language_name, target_language_code, prompt_context)
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            num_requests += 1
+
+    manifest = {
+        "target_language_name": target_language_name,
+        "target_language_code": target_language_code,
+        "model": model_name,
+        "prompt_version": prompt_context.prompt_version if prompt_context else translator.PROMPT_TEMPLATE_VERSION,
+        "chunks": manifest_chunks,
+    }
+    with open(manifest_path_for(requests_filepath), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    duplicates = len(manifest_chunks) - len(first_ids)
+    print(f"  📝 Wrote {num_requests} batch request(s) for {len(manifest_chunks)} chunk(s) to {requests_filepath}"
+          f"{f' ({duplicates} duplicate chunk(s) re-use an earlier request)' if duplicates else ''}")
+    return num_requests
+
+def load_batch_manifest(requests_filepath):
+    with open(manifest_path_for(requests_filepath), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _status_from_error(error):
+    code = error.get("code")
+    if code == 429 or error.get("status") == "RESOURCE_EXHAUSTED":
+        return translator.STATUS_RATE_LIMITED
+    if isinstance(code, int) and code >= 500:
+        return translator.STATUS_TRANSIENT
+    return translator.STATUS_FATAL
+
+def parse_batch_result(record):
+    """Turns one line of a batch results file into a TranslationResult."""
+    error = record.get("error") or (record.get("status") if isinstance(record.get("status"), dict) else None)
+    if error:
+        return translator.TranslationResult(_status_from_error(error), error=f"BATCH ERROR {error.get('code', '')} {error.get('message', '')}".strip(), source="batch")
+    response = record.get("response") or {}
+    feedback = response.get("promptFeedback") or response.get("prompt_feedback") or {}
+    block_reason = feedback.get("blockReason") or feedback.get("block_reason")
+    if block_reason:
+        return translator.TranslationResult(translator.STATUS_BLOCKED, error=str(block_reason), source="batch")
+    candidates = response.get("candidates") or []
+    if not candidates:
+        return translator.TranslationResult(translator.STATUS_TRANSIENT, error="EMPTY RESPONSE", source="batch")
+    candidate = candidates[0]
+    parts = (candidate.get("content") or {}).get("parts") or []
+    translated_text = "".join(part.get("text", "") for part in parts).strip()
+    finish_reason = candidate.get("finishReason") or candidate.get("finish_reason")
+    if not translated_text and finish_reason in ("SAFETY", "RECITATION", "PROHIBITED_CONTENT", "BLOCKLIST"):
+        return translator.TranslationResult(translator.STATUS_BLOCKED, error=f"NO TEXT (finish reason {finish_reason})", source="batch")
+    if not translated_text:
+        return translator.TranslationResult(translator.STATUS_TRANSIENT, error="EMPTY RESPONSE", source="batch")
+    return translator.TranslationResult(translator.STATUS_OK, text=translated_text, source="batch")
+
+def read_batch_results(results_filepath):
+    """Returns {chunk ID: TranslationResult} for every parseable line of a results file."""
+    results = {}
+    with open(results_filepath, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                record = None
+            if not isinstance(record, dict):
+                print(f"    ⚠️ WARNING: Skipping unreadable line {line_number} of {os.path.basename(results_filepath)}.")
+                continue
+            chunk_id = record.get("key") or record.get("custom_id")
+            if not chunk_id:
+                continue
+            result = parse_batch_result(record)
+            previous = results.get(chunk_id)
+            if previous is None or not previous.ok:  # A success wins over an earlier failed line
+                results[chunk_id] = result
+    return results
+
+def ingest_batch_results(requests_filepath, results_filepaths):
+    """
+    Matches batch results to the chunks of a request file's manifest.
+    `results_filepaths` may list several files, e.g. the first run and a resubmission of
+    its failures; a successful result for a chunk in any of them is used.
+    Returns (chunks, results): the chunk texts and one TranslationResult per chunk in order.
+    Chunks without a result come back as transient failures (MISSING_RESULT_ERROR).
+    """
+    if isinstance(results_filepaths, str):
+        results_filepaths = [results_filepaths]
+    manifest = load_batch_manifest(requests_filepath)
+    results_by_id = {}
+    for results_filepath in results_filepaths:
+        for chunk_id, result in read_batch_results(results_filepath).items():
+            if chunk_id not in results_by_id or not results_by_id[chunk_id].ok:
+                results_by_id[chunk_id] = result
+
+    chunks, results = [], []
+    known_ids = set()
+    for entry in manifest["chunks"]:
+        known_ids.add(entry["id"])
+        chunks.append(entry["text"])
+        results.append(results_by_id.get(entry.get("same_as", entry["id"])) or translator.TranslationResult(translator.STATUS_TRANSIENT, error=MISSING_RESULT_ERROR, source="batch"))
+
+    unknown = len(set(results_by_id) - known_ids)
+    if unknown:
+        print(f"    ⚠️ WARNING: {unknown} result(s) have IDs that are not in this batch and were ignored.")
+    failed = sum(1 for result in results if not result.ok)
+    missing = sum(1 for result in results if result.error == MISSING_RESULT_ERROR)
+    print(f"  📥 Ingested {len(results) - failed} of {len(results)} chunk translation(s) ({missing} missing, {failed - missing} failed).")
+    return chunks, results
+
+def failed_chunk_indexes(results):
+    """Indexes of chunks worth resubmitting: missing, rate-limited or transient failures."""
+    return {index for index, result in enumerate(results) if result.retryable}
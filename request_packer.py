@@ -0,0 +1,51 @@
+# File: request_packer.py
+
+import text_processor
+import translator
+
+class ChunkPacker:
+    """
+    Groups consecutive small chunks so they can share one API request. Chunks estimated
+    below `small_chunk_tokens` are combined, in order, until the pack would exceed
+    `max_request_tokens` of source text or, with `max_output_tokens` set, until the
+    expected translation into `target_language_code` (markers included) would no longer
+    fit the model's output limit; larger chunks always travel alone. add() chunks one at
+    a time and it returns the packs that became complete; flush() returns whatever is left.
+    """
+
+    def __init__(self, small_chunk_tokens, max_request_tokens, target_language_code=None, max_output_tokens=0):
+        self.small_chunk_tokens = small_chunk_tokens
+        self.max_request_tokens = max_request_tokens
+        self.target_language_code = target_language_code
+        self.max_output_tokens = max_output_tokens
+        self._marker_tokens = text_processor.estimate_tokens(translator.PACKED_SEGMENT_MARKER.format(number=1000) + "\n\n")
+        self._current_pack = []
+        self._current_tokens = 0
+        self._current_output_tokens = 0
+
+    @property
+    def first_index(self):
+        """Index of the oldest chunk waiting in the partial pack, or None."""
+        return self._current_pack[0][0] if self._current_pack else None
+
+    def add(self, index, chunk):
+        chunk_tokens = text_processor.estimate_tokens(chunk)
+        if chunk_tokens >= self.small_chunk_tokens:
+            return self.flush() + [[(index, chunk)]]
+
+        output_tokens = 0
+        if self.max_output_tokens:
+            output_tokens = text_processor.estimate_output_tokens(chunk, self.target_language_code) + self._marker_tokens
+        ready = []
+        over_output_budget = self.max_output_tokens and self._current_output_tokens + output_tokens > self.max_output_tokens
+        if self._current_pack and (self._current_tokens + chunk_tokens > self.max_request_tokens or over_output_budget):
+            ready = self.flush()
+        self._current_pack.append((index, chunk))
+        self._current_tokens += chunk_tokens
+        self._current_output_tokens += output_tokens
+        return ready
+
+    def flush(self):
+        ready = [self._current_pack] if self._current_pack else []
+        self._current_pack, self._current_tokens, self._current_output_tokens = [], 0, 0
+        return ready
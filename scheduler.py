@@ -0,0 +1,605 @@
+# File: scheduler.py
+
+import asyncio
+import dataclasses
+import random
+import time
+
+import request_packer
+import text_processor
+import translator
+
+class RateLimiter:
+    """
+    Token-bucket limiter enforcing a requests-per-minute and a tokens-per-minute budget.
+    Both buckets start full and refill continuously, so bursts use up idle quota.
+    A budget of 0 or None disables that limit.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute or 0
+        self.tokens_per_minute = tokens_per_minute or 0
+        self._request_allowance = float(self.requests_per_minute)
+        self._token_allowance = float(self.tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_allowance = min(self.requests_per_minute, self._request_allowance + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_allowance = min(self.tokens_per_minute, self._token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def _seconds_until_available(self, tokens):
+        wait = 0.0
+        if self.requests_per_minute and self._request_allowance < 1:
+            wait = max(wait, (1 - self._request_allowance) * 60 / self.requests_per_minute)
+        if self.tokens_per_minute and self._token_allowance < tokens:
+            wait = max(wait, (tokens - self._token_allowance) * 60 / self.tokens_per_minute)
+        return wait
+
+    async def acquire(self, tokens):
+        """Waits until one request costing roughly `tokens` tokens fits in both budgets."""
+        if self.tokens_per_minute:
+            # A single oversized request must still be able to go out eventually
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:  # FIFO: requests are granted in the order they asked
+            while True:
+                self._refill()
+                wait = self._seconds_until_available(tokens)
+                if wait <= 0:
+                    if self.requests_per_minute: self._request_allowance -= 1
+                    if self.tokens_per_minute: self._token_allowance -= tokens
+                    return
+                await asyncio.sleep(wait)
+
+class FairShareRateLimiter(RateLimiter):
+    """
+    RateLimiter shared by several jobs, e.g. every (book, language) pair of a batch.
+    Each job paces its requests through its own handle from for_job(). When several
+    requests are waiting, the job with the highest priority goes first and, within a
+    priority, the job that has used the least of the budget for its weight, so one large
+    book cannot starve the others. A job that joins late starts level with the rest.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self._jobs = []
+        self._waiters = []  # (job, tokens, sequence, future) of every waiting request
+        self._sequence = 0
+        self._wake_up = None  # Timer that grants the next request once the budget has refilled
+
+    def for_job(self, name, priority=0, weight=1.0):
+        """Registers a job and returns its limiter; close() it when the job is done."""
+        job = JobRateLimiter(self, name, priority, weight)
+        peers = [other.used for other in self._jobs if other.priority == priority]
+        job.used = min(peers) if peers else 0.0
+        self._jobs.append(job)
+        return job
+
+    def _grant_order(self, waiter):
+        job, _, sequence, _ = waiter
+        return (-job.priority, job.used, sequence)
+
+    def _grant(self):
+        """Grants waiting requests in order while the budget lasts, then sets a timer for the next one."""
+        if self._wake_up:
+            self._wake_up.cancel()
+            self._wake_up = None
+        while self._waiters:
+            self._refill()
+            waiter = min(self._waiters, key=self._grant_order)
+            job, tokens, _, future = waiter
+            wait = self._seconds_until_available(tokens)
+            if wait > 0:
+                self._wake_up = asyncio.get_running_loop().call_later(wait, self._grant)
+                return
+            self._waiters.remove(waiter)
+            if future.done():  # Cancelled while waiting
+                continue
+            if self.requests_per_minute: self._request_allowance -= 1
+            if self.tokens_per_minute: self._token_allowance -= tokens
+            job.requests_granted += 1
+            job.tokens_granted += tokens
+            job.used += (tokens if self.tokens_per_minute else 1) / job.weight
+            future.set_result(None)
+
+    async def _acquire_for(self, job, tokens):
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+        self._sequence += 1
+        # Each request waits on its own future, which only _grant() resolves, so a
+        # cancelled request (Ctrl-C, a failed job) just leaves the line
+        waiter = (job, tokens, self._sequence, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._grant()
+        try:
+            await waiter[3]
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._grant()
+
+    async def acquire(self, tokens):
+        """Requests made on the shared limiter directly count as one anonymous job."""
+        if not hasattr(self, "_default_job"):
+            self._default_job = self.for_job("default")
+        await self._acquire_for(self._default_job, tokens)
+
+class JobRateLimiter:
+    """One job's handle on a FairShareRateLimiter; a drop-in for RateLimiter in TranslationEngine."""
+
+    def __init__(self, shared_limiter, name, priority=0, weight=1.0):
+        self.shared_limiter = shared_limiter
+        self.name = name
+        self.priority = priority
+        self.weight = weight if weight and weight > 0 else 1.0
+        self.used = 0.0  # Budget used so far, divided by weight
+        self.requests_granted = 0
+        self.tokens_granted = 0
+
+    async def acquire(self, tokens):
+        await self.shared_limiter._acquire_for(self, tokens)
+
+    def close(self):
+        if self in self.shared_limiter._jobs:
+            self.shared_limiter._jobs.remove(self)
+
+class CircuitBreaker:
+    """
+    Pauses every worker of the pool after a quota / rate-limit error, so the whole pool
+    backs off together instead of each worker burning retries against a 429.
+    The pause honors the API's retry-after hint and doubles on consecutive trips. 429s of
+    requests that were already in flight when a pause began count toward that pause.
+    """
+
+    def __init__(self, base_pause_seconds=10.0, max_pause_seconds=300.0):
+        self.base_pause_seconds = base_pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self._resume_at = 0.0
+        self._consecutive_trips = 0
+
+    def trip(self, retry_after=None):
+        if time.monotonic() < self._resume_at:
+            if not retry_after:
+                return  # Same pause window: no escalation
+        else:
+            self._consecutive_trips += 1
+        pause = retry_after or min(self.max_pause_seconds, self.base_pause_seconds * 2 ** (self._consecutive_trips - 1))
+        resume_at = time.monotonic() + pause
+        if resume_at > self._resume_at:
+            self._resume_at = resume_at
+            print(f"    ⏸️ Quota/rate limit hit: pausing all requests for {pause:.1f}s.")
+
+    def record_success(self):
+        self._consecutive_trips = 0
+
+    async def wait_until_closed(self):
+        while True:
+            wait = self._resume_at - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+class ApiKey:
+    """One API key of an ApiKeyPool: its own model client, rate budget and cool-down state."""
+
+    def __init__(self, label, model, requests_per_minute, tokens_per_minute):
+        self.label = label
+        self.model = model
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.cooldown_until = 0.0
+        self.consecutive_rate_limits = 0
+        self.requests = 0
+        self.rate_limited = 0
+
+class ApiKeyPool:
+    """
+    Rotates requests across several API keys, each with its own requests/tokens-per-minute
+    budget. Every request goes to the key that can take it soonest; a key that gets a 429
+    cools down on its own (for the API's retry-after hint, else with doubling pauses)
+    while the other keys keep working. Requests only wait when every key is cooling down.
+    A drop-in for the rate limiter and circuit breaker of TranslationEngine (`key_pool=`).
+    """
+
+    def __init__(self, keys, base_cooldown_seconds=10.0, max_cooldown_seconds=300.0):
+        if not keys:
+            raise ValueError("An ApiKeyPool needs at least one key.")
+        self.keys = list(keys)
+        self.base_cooldown_seconds = base_cooldown_seconds
+        self.max_cooldown_seconds = max_cooldown_seconds
+        self._lock = asyncio.Lock()
+
+    def _seconds_until_ready(self, key, tokens, now):
+        key.rate_limiter._refill()
+        if key.rate_limiter.tokens_per_minute:
+            tokens = min(tokens, key.rate_limiter.tokens_per_minute)
+        return max(key.cooldown_until - now, key.rate_limiter._seconds_until_available(tokens))
+
+    async def acquire(self, tokens):
+        """Waits for a key with budget for one request of roughly `tokens` tokens and returns it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                key = min(self.keys, key=lambda key: (self._seconds_until_ready(key, tokens, now), key.requests))
+                if key.cooldown_until <= now:
+                    # The key's own limiter waits out any remaining budget shortfall
+                    await key.rate_limiter.acquire(tokens)
+                    if key.cooldown_until <= time.monotonic():
+                        key.requests += 1
+                        return key
+                else:
+                    await asyncio.sleep(key.cooldown_until - now)
+
+    def record_result(self, key, result):
+        """
+        Cools a key down after a rate-limit error; a success resets its back-off. 429s of
+        requests that were already in flight on the key when its cool-down began count
+        toward that cool-down instead of doubling it again.
+        """
+        if result.status == translator.STATUS_RATE_LIMITED:
+            key.rate_limited += 1
+            if time.monotonic() < key.cooldown_until:
+                if not result.retry_after:
+                    return  # Same cool-down window: no escalation
+            else:
+                key.consecutive_rate_limits += 1
+            pause = result.retry_after or min(self.max_cooldown_seconds, self.base_cooldown_seconds * 2 ** (key.consecutive_rate_limits - 1))
+            cooldown_until = time.monotonic() + pause
+            if cooldown_until > key.cooldown_until:
+                key.cooldown_until = cooldown_until
+                print(f"    🔑 API key {key.label} hit its rate limit: cooling it down for {pause:.1f}s.")
+        elif result.ok:
+            key.consecutive_rate_limits = 0
+
+    def stats(self):
+        return [{"key": key.label, "requests": key.requests, "rate_limited": key.rate_limited} for key in self.keys]
+
+def backoff_delay(attempt, base_delay, max_delay, retry_after=None):
+    """Jittered exponential backoff ("full jitter"), never shorter than the API's retry-after hint."""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0)
+
+class TranslationEngine:
+    """
+    Translates chunks concurrently, keeping up to `max_concurrency` requests in flight
+    while the shared RateLimiter paces them. Results come back in the original chunk order.
+    If a TranslationCache is given, cached chunks are served without an API call.
+    With `pack_chunk_tokens` set, consecutive chunks smaller than that are packed into
+    shared requests of at most `max_pack_tokens`, and with `max_output_tokens` set no pack
+    is expected to translate to more than that (see request_packer).
+    At most `max_buffered_chunks` chunks are held between reading and delivery, so a
+    streamed book is translated in bounded memory.
+    Rate-limited and transient failures are retried up to `max_attempts` times with
+    jittered exponential backoff; chunks that still fail are re-queued behind the pending
+    work for one more round before they are reported as failed.
+    A translator.PromptContext supplies the job's prompt prefix (glossary, style notes),
+    sent inline or referenced from the API's context cache.
+    With `deduplicate_chunks`, a chunk identical to one already in flight is not sent; it
+    receives a copy of that chunk's result (source "duplicate").
+    With an ApiKeyPool as `key_pool`, each request goes out on one of its keys instead of
+    `model`, and a 429 cools down that key rather than pausing the whole engine.
+    """
+
+    def __init__(self, model, target_language_name, target_language_code, rate_limiter, max_concurrency=4, cache=None, model_name=None,
+                 pack_chunk_tokens=0, max_pack_tokens=0, max_output_tokens=0, max_buffered_chunks=64,
+                 max_attempts=4, base_retry_delay=2.0, max_retry_delay=60.0, circuit_breaker=None, verbose=True,
+                 prompt_context=None, deduplicate_chunks=True, key_pool=None):
+        self.model = model
+        self.target_language_name = target_language_name
+        self.target_language_code = target_language_code
+        self.rate_limiter = rate_limiter
+        self.max_concurrency = max(1, max_concurrency)
+        self.cache = cache
+        self.model_name = model_name or getattr(model, "model_name", "")
+        self.pack_chunk_tokens = pack_chunk_tokens
+        self.max_pack_tokens = max_pack_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_buffered_chunks = max(self.max_concurrency, max_buffered_chunks)
+        self.max_attempts = max(1, max_attempts)
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.verbose = verbose  # Per-chunk progress lines; warnings are always printed
+        self.prompt_context = prompt_context or translator.PromptContext(target_language_name, target_language_code)
+        self.deduplicate_chunks = deduplicate_chunks
+        self.key_pool = key_pool
+        self.requests_sent = 0
+        self.retries = 0
+        self.requeued_chunks = 0
+        self.failed_chunks = 0
+        self.duplicate_chunks = 0  # Chunks served from an identical chunk's translation
+        self.duplicate_chars = 0
+        self.num_chunks = None  # Known once the whole input has been read
+
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+    def _label(self, index):
+        return f"{index+1} of {self.num_chunks}" if self.num_chunks is not None else f"{index+1}"
+
+    def estimate_request_tokens(self, chunk):
+        """Prompt tokens plus the expected size of the translation."""
+        suffix = translator.build_chunk_prompt_suffix(chunk, self.target_language_name)
+        prompt_tokens = self.prompt_context.prefix_tokens + text_processor.estimate_tokens(suffix)
+        return prompt_tokens + text_processor.estimate_output_tokens(chunk, self.target_language_code)
+
+    def estimate_packed_request_tokens(self, chunks):
+        suffix = translator.build_packed_prompt_suffix(chunks, self.target_language_name)
+        prompt_tokens = self.prompt_context.prefix_tokens + text_processor.estimate_tokens(suffix)
+        return prompt_tokens + sum(text_processor.estimate_output_tokens(chunk, self.target_language_code) for chunk in chunks)
+
+    def _cache_key(self, chunk):
+        return self.cache.make_key(chunk, self.target_language_code, self.model_name, self.prompt_context.prompt_version)
+
+    def _lookup_cache(self, index, chunk):
+        if not self.cache:
+            return None
+        cached_part = self.cache.get(self._cache_key(chunk))
+        if cached_part is not None:
+            self._log(f"    ♻️ Chunk {self._label(index)} loaded from cache.")
+        return cached_part
+
+    def _store_cache(self, chunk, translated_part):
+        if self.cache:
+            self.cache.put(self._cache_key(chunk), translated_part)
+
+    async def _send(self, estimated_tokens, translate_call):
+        """
+        One paced API call: waits out the circuit breaker and the rate limiter (or for a
+        key of the pool) first. `translate_call(model)` makes the request.
+        """
+        if self.key_pool:
+            key = await self.key_pool.acquire(estimated_tokens)
+            self.requests_sent += 1
+            started = time.monotonic()
+            result = await translate_call(key.model)
+            result.latency = time.monotonic() - started
+            self.key_pool.record_result(key, result)
+            self.prompt_context.record_usage(result)
+            return result
+        await self.circuit_breaker.wait_until_closed()
+        await self.rate_limiter.acquire(estimated_tokens)
+        self.requests_sent += 1
+        started = time.monotonic()
+        result = await translate_call(self.model)
+        result.latency = time.monotonic() - started
+        self.prompt_context.record_usage(result)
+        if result.status == translator.STATUS_RATE_LIMITED:
+            self.circuit_breaker.trip(result.retry_after)
+        elif result.ok:
+            self.circuit_breaker.record_success()
+        return result
+
+    def _retry_delay(self, attempt, result):
+        # With a key pool the retry can go out on another key; it need not wait for this one
+        retry_after = None if self.key_pool else result.retry_after
+        return backoff_delay(attempt, self.base_retry_delay, self.max_retry_delay, retry_after)
+
+    async def _translate_one(self, index, chunk):
+        """Translates one chunk, retrying rate-limited and transient failures with backoff."""
+        latency = 0.0
+        for attempt in range(1, self.max_attempts + 1):
+            self._log(f"  Translating chunk {self._label(index)} ({len(chunk):,} chars){f' - attempt {attempt}' if attempt > 1 else ''}...")
+            result = await self._send(
+                self.estimate_request_tokens(chunk),
+                lambda model: translator.translate_chunk_async(chunk, self.target_language_name, self.target_language_code, model, self.prompt_context)
+            )
+            result.attempts = attempt
+            latency += result.latency
+            result.latency = latency
+            if not result.retryable or attempt == self.max_attempts:
+                break
+            self.retries += 1
+            delay = self._retry_delay(attempt, result)
+            print(f"    🔁 Chunk {index+1} {result.status}; retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+        if result.ok:
+            self._log(f"    ✅ Chunk {index+1} translated successfully.")
+            self._store_cache(chunk, result.text)
+        else:
+            print(f"    ⚠️ WARNING: Chunk {index+1} {result.status} after {result.attempts} attempt(s). See message above.")
+        return result
+
+    async def _translate_pack(self, pack):
+        """
+        Translates a pack of chunks in one request. Rate-limited and transient failures
+        retry the whole pack; only a response that cannot be split back into its segments
+        (or a safety block, to find the blocked segment) falls back to one request per chunk.
+        """
+        if len(pack) == 1:
+            index, chunk = pack[0]
+            return [(index, await self._translate_one(index, chunk))]
+
+        chunks = [chunk for _, chunk in pack]
+        first_index, last_index = pack[0][0], pack[-1][0]
+        latency = 0.0
+        for attempt in range(1, self.max_attempts + 1):
+            self._log(f"  Translating chunks {first_index+1}-{last_index+1} in one request ({len(pack)} segments, {sum(len(c) for c in chunks):,} chars){f' - attempt {attempt}' if attempt > 1 else ''}...")
+            result = await self._send(
+                self.estimate_packed_request_tokens(chunks),
+                lambda model: translator.translate_packed_chunks_async(chunks, self.target_language_name, self.target_language_code, model, self.prompt_context)
+            )
+            result.attempts = attempt
+            latency += result.latency
+            result.latency = latency
+            split_up = result.status == translator.STATUS_BLOCKED or result.error == translator.SEGMENT_COUNT_MISMATCH_ERROR
+            if split_up or not result.retryable or attempt == self.max_attempts:
+                break
+            self.retries += 1
+            delay = self._retry_delay(attempt, result)
+            print(f"    🔁 Chunks {first_index+1}-{last_index+1} {result.status}; retrying in {delay:.1f}s.")
+            await asyncio.sleep(delay)
+
+        if split_up:
+            print(f"    ⚠️ WARNING: Packed request for chunks {first_index+1}-{last_index+1} failed ({result.error}); translating them one by one.")
+            return [(index, await self._translate_one(index, chunk)) for index, chunk in pack]
+        if not result.ok:
+            print(f"    ⚠️ WARNING: Chunks {first_index+1}-{last_index+1} {result.status} after {result.attempts} attempt(s). See message above.")
+            return [(index, dataclasses.replace(result, segments=None, latency=result.latency / len(pack))) for index, _ in pack]
+
+        self._log(f"    ✅ Chunks {first_index+1}-{last_index+1} translated successfully.")
+        for chunk, translated_part in zip(chunks, result.segments):
+            self._store_cache(chunk, translated_part)
+        # Each segment gets its share of the request's latency, so per-chunk sums count the request once
+        return [
+            (index, translator.TranslationResult(translator.STATUS_OK, text=translated_part, latency=result.latency / len(pack)))
+            for (index, _), translated_part in zip(pack, result.segments)
+        ]
+
+    async def translate_stream(self, chunks, on_result=None, completed_lookup=None, max_buffered_chunks=None):
+        """
+        Translates a (possibly lazy) iterable of chunks and yields (index, TranslationResult)
+        in chunk order as soon as each next chunk is done. The iterable is consumed in a
+        background thread, so it may do blocking extraction and chunking work; reading
+        pauses while `max_buffered_chunks` chunks are still waiting to be delivered.
+        `on_result(index, result)` is called as each chunk finishes, and chunks for which
+        `completed_lookup(index, chunk)` returns a translation are not sent again.
+        """
+        loop = asyncio.get_running_loop()
+        chunk_iterator = iter(chunks)
+        end_of_input = object()
+        buffer_slots = asyncio.Semaphore(max_buffered_chunks or self.max_buffered_chunks)
+        # Unbounded: buffer_slots already limits how many chunks can be queued
+        work_queue = asyncio.Queue()
+        finished = {}
+        requeued = set()
+        state_changed = asyncio.Condition()
+        failure = []
+        next_to_deliver = [0]
+        leaders_by_text = {}  # Chunk text -> index of the identical chunk being translated
+        followers = {}  # Leader index -> (chunk text, indexes of its duplicates)
+
+        async def deliver(index, result):
+            if on_result:
+                on_result(index, result)
+            async with state_changed:
+                finished[index] = result
+                state_changed.notify_all()
+            if index in followers:
+                chunk, duplicate_indexes = followers.pop(index)
+                del leaders_by_text[chunk]
+                for duplicate_index in duplicate_indexes:
+                    await deliver(duplicate_index, dataclasses.replace(result, source="duplicate", latency=0.0, segments=None))
+
+        async def feed():
+            packer = None
+            if self.pack_chunk_tokens and self.max_pack_tokens:
+                packer = request_packer.ChunkPacker(self.pack_chunk_tokens, self.max_pack_tokens, self.target_language_code, self.max_output_tokens)
+            index = 0
+            try:
+                while True:
+                    if packer and packer.first_index is not None and buffer_slots.locked():
+                        # Don't let a partial pack wait for chunks that are blocked on its own delivery
+                        async with state_changed:
+                            await state_changed.wait_for(lambda: not buffer_slots.locked() or next_to_deliver[0] == packer.first_index)
+                        if buffer_slots.locked():
+                            for pack in packer.flush():
+                                work_queue.put_nowait(pack)
+                    await buffer_slots.acquire()
+                    chunk = await loop.run_in_executor(None, next, chunk_iterator, end_of_input)
+                    if chunk is end_of_input:
+                        buffer_slots.release()
+                        break
+                    known_part = completed_lookup(index, chunk) if completed_lookup else None
+                    source = "journal"
+                    if known_part is None:
+                        known_part = self._lookup_cache(index, chunk)
+                        source = "cache"
+                    if known_part is not None:
+                        known_result = translator.TranslationResult(translator.STATUS_OK, text=known_part, source=source)
+                        if source == "cache":
+                            await deliver(index, known_result)
+                        else:
+                            async with state_changed:
+                                finished[index] = known_result
+                                state_changed.notify_all()
+                    elif self.deduplicate_chunks and chunk in leaders_by_text:
+                        followers[leaders_by_text[chunk]][1].append(index)
+                        self.duplicate_chunks += 1
+                        self.duplicate_chars += len(chunk)
+                    else:
+                        if self.deduplicate_chunks:
+                            leaders_by_text[chunk] = index
+                            followers[index] = (chunk, [])
+                        if packer:
+                            for pack in packer.add(index, chunk):
+                                work_queue.put_nowait(pack)
+                        else:
+                            work_queue.put_nowait([(index, chunk)])
+                    index += 1
+                if packer:
+                    for pack in packer.flush():
+                        work_queue.put_nowait(pack)
+            except Exception as e:
+                failure.append(e)
+            finally:
+                async with state_changed:
+                    self.num_chunks = index
+                    state_changed.notify_all()
+
+        async def worker():
+            while True:
+                pack = await work_queue.get()
+                try:
+                    chunks_by_index = dict(pack)
+                    retry_pack = []
+                    for index, result in await self._translate_pack(pack):
+                        if result.retryable and index not in requeued:
+                            requeued.add(index)
+                            self.requeued_chunks += 1
+                            retry_pack.append((index, chunks_by_index[index]))
+                            continue
+                        if not result.ok:
+                            self.failed_chunks += 1
+                        await deliver(index, result)
+                    if retry_pack:
+                        # Give the API time to recover while other chunks proceed; a pack goes back whole
+                        label = f"Chunk {retry_pack[0][0]+1}" if len(retry_pack) == 1 else f"Chunks {retry_pack[0][0]+1}-{retry_pack[-1][0]+1}"
+                        print(f"    ↩️ {label} re-queued for another round.")
+                        work_queue.put_nowait(retry_pack)
+                except Exception as e:
+                    failure.append(e)
+                    async with state_changed:
+                        state_changed.notify_all()
+
+        self.num_chunks = None
+        tasks = [asyncio.create_task(feed())] + [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+        try:
+            while True:
+                next_index = next_to_deliver[0]
+                async with state_changed:
+                    await state_changed.wait_for(
+                        lambda: next_index in finished or failure or self.num_chunks == next_index
+                    )
+                    if failure:
+                        raise failure[0]
+                    if next_index not in finished:
+                        break
+                    result = finished.pop(next_index)
+                    next_to_deliver[0] += 1
+                    buffer_slots.release()
+                    state_changed.notify_all()
+                yield next_index, result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def translate_chunks(self, chunks, on_result=None, completed=None):
+        """
+        Translates every chunk and returns the translations in chunk order; chunks that
+        failed for good are returned as error markers.
+        `on_result(index, result)` is called as each chunk finishes.
+        Chunks whose index is in `completed` (index -> translation) are not sent again.
+        """
+        completed = completed or {}
+        return [
+            result.output_text(chunks[index]) async for index, result
+            in self.translate_stream(chunks, on_result, lambda index, chunk: completed.get(index), max(self.max_buffered_chunks, len(chunks)))
+        ]
@@ -0,0 +1,58 @@
+# File: tests/test_file_handler.py
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("ebooklib")
+pytest.importorskip("bs4")
+
+import file_handler
+
+class RecordingWriter(file_handler.BookWriter):
+    flush_chars = 50
+
+    def __init__(self):
+        super().__init__("unused")
+        self.calls = []
+
+    def add_chapter(self, title, paragraphs, continued=False):
+        self.calls.append((title, list(paragraphs), continued))
+
+def test_long_chapters_are_handed_over_in_parts():
+    writer = RecordingWriter()
+    writer.write_part("Intro paragraph.")
+    writer.write_part("## Chapter One\n\nThe first paragraph of chapter one, long enough to be flushed.")
+    writer.write_part("More of chapter one.")
+    writer.write_part("## Chapter Two\n\nShort.")
+    assert writer.close()
+    assert writer.calls == [
+        (None, ["Intro paragraph."], False),
+        ("Chapter One", ["The first paragraph of chapter one, long enough to be flushed."], False),
+        (None, ["More of chapter one."], True),
+        ("Chapter Two", ["Short."], False),
+    ]
+
+def _page(number, header):
+    return [(f"{header}\n", True), (f"Body text of page {number}, which says something different each time ({number * 7}).\n", False), (f"{number}\n", True)]
+
+def test_alternating_running_headers_and_page_numbers_are_stripped():
+    pages = [_page(number, "The Tale of Genji" if number % 2 else f"Chapter {number // 10}: The Paulownia Court") for number in range(1, 26)]
+    texts, removed_blocks, _ = file_handler._strip_repeated_page_lines(pages)
+    assert removed_blocks == 50
+    assert all(text.startswith("Body text of page") for text in texts)
+
+def test_text_that_repeats_on_few_pages_is_kept():
+    pages = [_page(number, f"Header {number}") for number in range(1, 11)]
+    pages[0].insert(0, ("A line quoted twice.\n", True))
+    pages[5].insert(0, ("A line quoted twice.\n", True))
+    texts, removed_blocks, _ = file_handler._strip_repeated_page_lines(pages)
+    assert removed_blocks == 20  # Digit-normalized headers repeat; the quoted line does not reach half the pages
+    assert texts[0].startswith("A line quoted twice.")
+
+def test_page_numbers_and_words_that_look_like_numerals():
+    for text in ("12", "Page 12", "12 of 300", "12 / 300", "xiv", "XXXIX", "- 7 -"):
+        assert file_handler._PAGE_NUMBER_REGEX.match(file_handler._page_line_key(text)), text
+    for text in ("mix", "Lix", "civil", "page", "Chapter 12"):
+        assert not file_handler._PAGE_NUMBER_REGEX.match(file_handler._page_line_key(text)), text
+    texts, removed_blocks, _ = file_handler._strip_repeated_page_lines([[("mix\n", True), ("Body.\n", False)]])
+    assert removed_blocks == 0 and texts == ["mix\nBody.\n"]
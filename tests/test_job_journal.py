@@ -0,0 +1,67 @@
+# File: tests/test_job_journal.py
+
+import job_journal
+import translator
+
+def _ok(text):
+    return translator.TranslationResult(translator.STATUS_OK, text=text)
+
+def _write_job(path, fingerprint="job-a"):
+    journal = job_journal.open_job_journal(str(path), fingerprint)
+    journal.record_planned_chunk(0, "First chunk.")
+    journal.record_result(0, "First chunk.", _ok("Erster Abschnitt."))
+    journal.record_planned_chunk(1, "Second chunk.")
+    journal.record_result(1, "Second chunk.", _ok("Zweiter Abschnitt."))
+    journal.close()
+
+def test_resume_reuses_translations_of_the_same_job(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    assert journal.completed_translation(0, "First chunk.") == "Erster Abschnitt."
+    assert journal.completed_translation(1, "Second chunk.") == "Zweiter Abschnitt."
+    journal.close()
+
+def test_resume_refuses_a_different_job(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    assert job_journal.open_job_journal(str(path), "job-b", resume=True) is None
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    job_journal.open_job_journal(str(path), "job-b").close()
+    journal = job_journal.open_job_journal(str(path), "job-b", resume=True)
+    assert journal.completed_translation(0, "First chunk.") is None
+    journal.close()
+
+def test_torn_final_line_is_skipped_and_terminated(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"type": "result", "index": 2, "sha')
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    assert journal.completed_translation(0, "First chunk.") == "Erster Abschnitt."
+    journal.record_result(2, "Third chunk.", _ok("Dritter Abschnitt."))
+    journal.close()
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    assert journal.completed_translation(2, "Third chunk.") == "Dritter Abschnitt."
+    journal.close()
+
+def test_failed_result_overrides_an_earlier_success(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    journal.record_result(1, "Second chunk.", translator.TranslationResult(translator.STATUS_BLOCKED, error="SAFETY"))
+    journal.close()
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    assert journal.completed_translation(1, "Second chunk.") is None
+    assert journal.completed_translation(0, "First chunk.") == "Erster Abschnitt."
+    journal.close()
+
+def test_changed_chunk_invalidates_its_translation(tmp_path):
+    path = tmp_path / "job.journal.jsonl"
+    _write_job(path)
+    journal = job_journal.open_job_journal(str(path), "job-a", resume=True)
+    assert journal.completed_translation(1, "Second chunk, re-chunked.") is None
+    journal.close()
@@ -0,0 +1,86 @@
+# File: tests/test_offline_batch.py
+
+import json
+
+import fake_gemini
+import offline_batch
+import translator
+
+CHUNKS = ["First paragraph of the book.", "A repeated line.", "Second paragraph.", "A repeated line."]
+
+def _write_results(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record)) + "\n")
+
+def _ok(key, text):
+    return {"key": key, "response": {"candidates": [{"content": {"parts": [{"text": text}]}, "finishReason": "STOP"}]}}
+
+def _request_keys(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["key"] for line in f]
+
+def test_round_trip_through_fake_batch_endpoint(tmp_path):
+    requests_path = str(tmp_path / "requests.jsonl")
+    results_path = str(tmp_path / "results.jsonl")
+    assert offline_batch.write_batch_requests(CHUNKS, requests_path, "Hindi", "hi", "fake-gemini") == 3
+    fake_gemini.run_batch_file(requests_path, results_path, fake_gemini.FakeGenerativeModel(latency_seconds=0, expansion_ratio=1.0, seed=0))
+
+    chunks, results = offline_batch.ingest_batch_results(requests_path, [results_path])
+    assert chunks == CHUNKS
+    assert all(result.ok for result in results)
+    assert [result.text for result in results] == CHUNKS
+    assert offline_batch.failed_chunk_indexes(results) == set()
+
+def test_duplicate_chunks_share_one_request(tmp_path):
+    requests_path = str(tmp_path / "requests.jsonl")
+    offline_batch.write_batch_requests(CHUNKS, requests_path, "Hindi", "hi")
+    manifest = offline_batch.load_batch_manifest(requests_path)
+    assert manifest["chunks"][3]["same_as"] == manifest["chunks"][1]["id"]
+    assert manifest["chunks"][1]["id"] in _request_keys(requests_path)
+    assert manifest["chunks"][3]["id"] not in _request_keys(requests_path)
+
+    ids = [entry["id"] for entry in manifest["chunks"]]
+    results_path = str(tmp_path / "results.jsonl")
+    _write_results(results_path, [_ok(ids[0], "one"), _ok(ids[1], "repeat"), _ok(ids[2], "two")])
+    _, results = offline_batch.ingest_batch_results(requests_path, results_path)
+    assert [result.text for result in results] == ["one", "repeat", "two", "repeat"]
+
+def test_missing_and_failed_ids_are_resubmitted(tmp_path):
+    requests_path = str(tmp_path / "requests.jsonl")
+    retry_path = str(tmp_path / "retry.jsonl")
+    offline_batch.write_batch_requests(CHUNKS, requests_path, "Hindi", "hi")
+    ids = [entry["id"] for entry in offline_batch.load_batch_manifest(requests_path)["chunks"]]
+
+    first_results = str(tmp_path / "results.jsonl")
+    _write_results(first_results, [
+        _ok(ids[0], "one"),
+        {"key": ids[1], "error": {"code": 429, "message": "quota"}},
+        # ids[2] is missing
+        {"key": "chunk-99999-unknown", "error": {"code": 500}},
+        '{"key": "torn line',
+    ])
+    _, results = offline_batch.ingest_batch_results(requests_path, [first_results])
+    assert results[0].ok
+    assert results[1].status == translator.STATUS_RATE_LIMITED
+    assert results[2].error == offline_batch.MISSING_RESULT_ERROR
+    assert results[3].status == translator.STATUS_RATE_LIMITED  # Shares the failed request
+    assert offline_batch.failed_chunk_indexes(results) == {1, 2, 3}
+
+    offline_batch.write_batch_requests(CHUNKS, retry_path, "Hindi", "hi", only_indexes={1, 2, 3})
+    assert _request_keys(retry_path) == [ids[1], ids[2]]
+
+    retry_results = str(tmp_path / "retry_results.jsonl")
+    _write_results(retry_results, [_ok(ids[1], "repeat"), _ok(ids[2], "two")])
+    _, results = offline_batch.ingest_batch_results(requests_path, [first_results, retry_results])
+    assert [result.text for result in results] == ["one", "repeat", "two", "repeat"]
+
+def test_blocked_results_are_not_retried(tmp_path):
+    requests_path = str(tmp_path / "requests.jsonl")
+    offline_batch.write_batch_requests(CHUNKS[:1], requests_path, "Hindi", "hi")
+    chunk_id = offline_batch.load_batch_manifest(requests_path)["chunks"][0]["id"]
+    results_path = str(tmp_path / "results.jsonl")
+    _write_results(results_path, [{"key": chunk_id, "response": {"promptFeedback": {"blockReason": "SAFETY"}}}])
+    _, results = offline_batch.ingest_batch_results(requests_path, results_path)
+    assert results[0].status == translator.STATUS_BLOCKED
+    assert offline_batch.failed_chunk_indexes(results) == set()
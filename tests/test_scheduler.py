@@ -0,0 +1,119 @@
+# File: tests/test_scheduler.py
+
+import asyncio
+
+import fake_gemini
+import request_packer
+import scheduler
+import text_processor
+import translator
+
+def _engine(model, **kwargs):
+    options = {"max_concurrency": 8, "base_retry_delay": 0.001, "max_retry_delay": 0.01,
+               "circuit_breaker": scheduler.CircuitBreaker(base_pause_seconds=0.001), "verbose": False}
+    options.update(kwargs)
+    return scheduler.TranslationEngine(model, "Hindi", "hi", scheduler.RateLimiter(0, 0), **options)
+
+class ScriptedModel:
+    """Fails each distinct prompt with the given exceptions first, then echoes it back upper-cased."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = {}
+        self.requests = 0
+
+    async def generate_content_async(self, prompt):
+        self.requests += 1
+        attempt = self.calls.get(prompt, 0)
+        self.calls[prompt] = attempt + 1
+        await asyncio.sleep(0)
+        if attempt < len(self.failures):
+            raise self.failures[attempt]
+        text = prompt.split("--- Text Segment to Translate ---\n")[1].split("\n--- End of Text Segment ---")[0]
+        return fake_gemini.FakeResponse(text.upper())
+
+def test_results_come_back_in_chunk_order():
+    model = fake_gemini.FakeGenerativeModel(latency_seconds=0.005, latency_distribution="uniform", latency_spread=0.005, expansion_ratio=1.0, seed=1)
+    engine = _engine(model, max_buffered_chunks=8)
+    chunks = [" ".join([f"Paragraph number {index}."] * 40) for index in range(40)]
+
+    async def collect():
+        return [index async for index, _ in engine.translate_stream(iter(chunks))]
+
+    assert asyncio.run(collect()) == list(range(40))
+    assert asyncio.run(engine.translate_chunks(chunks)) == chunks
+    assert engine.num_chunks == 40
+
+def test_completed_chunks_are_not_sent_again():
+    model = fake_gemini.FakeGenerativeModel(latency_seconds=0, expansion_ratio=1.0)
+    engine = _engine(model)
+    chunks = [" ".join([word] * 200) for word in ("one", "two", "three")]
+    parts = asyncio.run(engine.translate_chunks(chunks, completed={1: "journaled"}))
+    assert parts == [chunks[0], "journaled", chunks[2]]
+    assert model.stats["requests"] == 2
+
+def test_rate_limited_chunks_are_retried():
+    model = ScriptedModel([fake_gemini.ResourceExhausted("429"), fake_gemini.ServiceUnavailable("503")])
+    engine = _engine(model)
+    results = []
+    parts = asyncio.run(engine.translate_chunks([" ".join(["alpha"] * 200), " ".join(["beta"] * 200)], on_result=lambda index, result: results.append(result)))
+    assert parts == [" ".join(["ALPHA"] * 200), " ".join(["BETA"] * 200)]
+    assert engine.retries == 4
+    assert engine.failed_chunks == 0
+    assert all(result.attempts == 3 for result in results)
+
+def test_chunks_that_keep_failing_are_requeued_then_marked():
+    model = ScriptedModel([fake_gemini.ServiceUnavailable("503")] * 10)
+    engine = _engine(model, max_attempts=2)
+    parts = asyncio.run(engine.translate_chunks([" ".join(["gamma"] * 200)]))
+    assert engine.requeued_chunks == 1
+    assert engine.failed_chunks == 1
+    assert model.requests == 4  # Two attempts, re-queued once, two more attempts
+    assert translator.is_failed_translation(parts[0])
+
+def test_fatal_errors_are_not_retried():
+    model = ScriptedModel([ValueError("bad request")])
+    engine = _engine(model)
+    results = []
+    asyncio.run(engine.translate_chunks([" ".join(["delta"] * 200)], on_result=lambda index, result: results.append(result)))
+    assert results[0].status == translator.STATUS_FATAL
+    assert model.requests == 1
+
+def test_rate_limited_pack_is_retried_as_one_request():
+    model = fake_gemini.FakeGenerativeModel(latency_seconds=0, expansion_ratio=1.0)
+    failures = [fake_gemini.ResourceExhausted("429")]
+    respond = model.generate_content_async
+
+    async def flaky(prompt):
+        if failures:
+            raise failures.pop()
+        return await respond(prompt)
+
+    model.generate_content_async = flaky
+    engine = _engine(model, pack_chunk_tokens=500, max_pack_tokens=4000)
+    chunks = [f"Short line {index}." for index in range(10)]
+    assert asyncio.run(engine.translate_chunks(chunks)) == chunks
+    assert engine.requests_sent == 2
+
+def test_circuit_breaker_escalates_once_per_pause():
+    breaker = scheduler.CircuitBreaker(base_pause_seconds=10, max_pause_seconds=300)
+    for _ in range(8):
+        breaker.trip()
+    assert breaker._consecutive_trips == 1
+
+def test_key_pool_escalates_once_per_cooldown():
+    key = scheduler.ApiKey("key 1", None, 0, 0)
+    pool = scheduler.ApiKeyPool([key], base_cooldown_seconds=10, max_cooldown_seconds=300)
+    for _ in range(8):
+        pool.record_result(key, translator.TranslationResult(translator.STATUS_RATE_LIMITED))
+    assert key.consecutive_rate_limits == 1
+    assert key.rate_limited == 8
+
+def test_packs_fit_the_output_budget():
+    packer = request_packer.ChunkPacker(500, 4000, "ta", 8192)
+    chunk = "A short paragraph of the book, about forty words long. " * 7
+    packs = [pack for index in range(200) for pack in packer.add(index, chunk)] + packer.flush()
+    assert len(packs) > 1
+    assert sum(len(pack) for pack in packs) == 200
+    for pack in packs:
+        assert sum(text_processor.estimate_output_tokens(text, "ta") for _, text in pack) <= 8192
@@ -0,0 +1,45 @@
+# File: tests/test_text_processor.py
+
+import text_processor
+
+def _join(parts, separators):
+    return parts[0] + "".join(separator + part for separator, part in zip(separators, parts[1:]))
+
+def test_small_segment_is_not_split():
+    assert text_processor.split_segment_by_tokens("A short line.", 2500, 8192, "hi") == (["A short line."], [])
+
+def test_oversized_segment_splits_at_lines_then_sentences():
+    segment = "Intro line\n" + " ".join(f"Sentence {i} is here." for i in range(3000)) + "\nlast line\n\nafter a blank line"
+    parts, separators = text_processor.split_segment_by_tokens(segment, 2500, 8192, "hi")
+    assert len(parts) > 2
+    assert _join(parts, separators) == segment
+    assert separators[0] == "\n" and separators[1] == " " and separators[-1] == "\n"
+    measure = text_processor._token_measure(2500, 8192, "hi")
+    assert all(measure(part) <= 2500 for part in parts)
+
+def test_repeated_paragraphs_become_standalone_units():
+    units = [(False, "A copyright notice long enough to count as a paragraph."), (False, "Short."),
+             (True, "## Chapter"), (False, "A copyright notice long enough to count as a paragraph."), (False, "Short.")]
+    repeated = text_processor.RepeatedParagraphFilter(min_chars=40)
+    assert list(repeated.filter_units(units)) == units[:3] + [(True, units[3][1]), (False, "Short.")]
+    assert repeated.repeated_paragraphs == 1
+    assert repeated.repeated_chars == len(units[3][1])
+
+def test_repeats_that_do_not_fit_a_chunk_stay_paragraphs():
+    paragraph = "A paragraph repeated later that is too long for one chunk."
+    repeated = text_processor.RepeatedParagraphFilter(min_chars=40)
+    assert list(repeated.filter_units([(False, paragraph)] * 2, fits=lambda para: False)) == [(False, paragraph)] * 2
+    assert repeated.repeated_paragraphs == 0
+
+def test_cjk_sentences_are_split_at_full_width_punctuation():
+    assert text_processor.split_by_sentences("これは文です。「そうですか？」と彼は言った。終わり！") == \
+        ["これは文です。", "「そうですか？」", "と彼は言った。", "終わり！"]
+
+def test_streaming_splitter_bounds_text_without_breaks():
+    for sentence in ("这是一个很长的句子没有任何换行符号也没有空格", "这是一个句子。"):
+        text = sentence * 20000
+        pieces = [text[start:start + 1000] for start in range(0, len(text), 1000)]
+        units = list(text_processor._iter_text_units_streaming(pieces))
+        assert "".join(unit for _, unit in units) == text
+        assert max(len(unit) for _, unit in units) <= text_processor._MAX_PENDING_CHARS + 1000
+    assert all(unit.endswith("。") for _, unit in units)
@@ -0,0 +1,43 @@
+# File: tests/test_translation_cache.py
+
+import itertools
+
+import translation_cache
+
+def _cache(tmp_path, monkeypatch, max_size_bytes):
+    clock = itertools.count(1)
+    monkeypatch.setattr(translation_cache.time, "time", lambda: next(clock))
+    return translation_cache.TranslationCache(str(tmp_path / "cache.sqlite"), max_size_bytes)
+
+def test_hits_and_misses(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch, 1024 * 1024)
+    key = cache.make_key("Hello.", "hi", "model")
+    assert cache.get(key) is None
+    assert cache.put(key, "नमस्ते।")
+    assert cache.get(key) == "नमस्ते।"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.make_key("Hello.", "bn", "model") != key
+    cache.close()
+
+def test_error_markers_are_not_stored(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch, 1024 * 1024)
+    for marker in ("[CHUNK FAILED: FATAL EXCEPTION X - Hello]", "[CHUNK BLOCKED: SAFETY - Hello]", "[TRANSLATION FAILED]", ""):
+        assert not cache.put(cache.make_key(marker, "hi", "model"), marker)
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+def test_least_recently_used_entries_are_evicted_by_size(tmp_path, monkeypatch):
+    entry_size = 64 + 100  # Key hex digest plus translation bytes
+    cache = _cache(tmp_path, monkeypatch, 3 * entry_size)
+    keys = [cache.make_key(f"Chunk {number}.", "hi", "model") for number in range(4)]
+    for key in keys[:3]:
+        cache.put(key, "x" * 100)
+    assert cache.get(keys[0]) is not None  # Now the most recently used
+    cache.put(keys[3], "x" * 100)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2], keys[3]))
+    assert cache.stats()["size_bytes"] == 3 * entry_size
+    cache.close()
+    reopened = translation_cache.TranslationCache(str(tmp_path / "cache.sqlite"), 3 * entry_size)
+    assert reopened.stats()["size_bytes"] == 3 * entry_size
+    reopened.close()
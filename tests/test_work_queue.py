@@ -0,0 +1,76 @@
+# File: tests/test_work_queue.py
+
+import translator
+import work_queue
+
+CHUNKS = ["First chunk.", "Second chunk.", "Third chunk."]
+
+def _queue(tmp_path, fingerprint="job-a"):
+    queue = work_queue.WorkQueue(str(tmp_path / "queue.sqlite"))
+    queue.start_job(fingerprint, {"model": "test"})
+    queue.add_chunks(CHUNKS)
+    return queue
+
+def _ok(text):
+    return translator.TranslationResult(translator.STATUS_OK, text=text.upper())
+
+def _rate_limited():
+    return translator.TranslationResult(translator.STATUS_RATE_LIMITED, error="429")
+
+def test_expired_leases_are_leased_again(tmp_path):
+    queue = _queue(tmp_path)
+    assert [index for index, _ in queue.lease("a", 2, -1, "job-a")] == [0, 1]
+    assert [index for index, _ in queue.lease("b", 10, 60, "job-a")] == [0, 1, 2]
+    assert queue.heartbeat("a", 60) == 0
+    assert queue.counts()["workers"] == 1
+
+def test_live_leases_are_not_shared(tmp_path):
+    queue = _queue(tmp_path)
+    assert len(queue.lease("a", 2, 60, "job-a")) == 2
+    assert [index for index, _ in queue.lease("b", 10, 60, "job-a")] == [2]
+
+def test_retryable_failures_go_back_max_rounds_times(tmp_path):
+    queue = _queue(tmp_path)
+    for _ in range(2):
+        assert queue.lease("a", 1, 60, "job-a") == [(0, CHUNKS[0])]
+        assert queue.complete("a", 0, CHUNKS[0], _rate_limited(), 2, "job-a")
+        assert queue.counts()["pending"] == 3
+    assert queue.lease("a", 1, 60, "job-a") == [(0, CHUNKS[0])]
+    assert queue.complete("a", 0, CHUNKS[0], _rate_limited(), 2, "job-a")
+    counts = queue.counts()
+    assert counts["done"] == 1 and counts["failed"] == 1
+
+def test_late_success_loses_to_the_new_owner(tmp_path):
+    queue = _queue(tmp_path)
+    queue.lease("a", 1, -1, "job-a")
+    queue.lease("b", 1, 60, "job-a")
+    assert queue.complete("b", 0, CHUNKS[0], _ok("from b"), 3, "job-a")
+    assert not queue.complete("a", 0, CHUNKS[0], _ok("from a"), 3, "job-a")
+    assert next(queue.iter_results())[2].text == "FROM B"
+
+def test_late_success_is_kept_while_the_chunk_is_unfinished(tmp_path):
+    queue = _queue(tmp_path)
+    queue.lease("a", 1, -1, "job-a")
+    queue.lease("b", 1, 60, "job-a")
+    assert queue.complete("a", 0, CHUNKS[0], _ok("from a"), 3, "job-a")
+    assert not queue.complete("b", 0, CHUNKS[0], _ok("from b"), 3, "job-a")
+
+def test_resume_requeues_only_failed_chunks(tmp_path):
+    queue = _queue(tmp_path)
+    queue.lease("a", 3, 60, "job-a")
+    queue.complete("a", 0, CHUNKS[0], _ok(CHUNKS[0]), 3, "job-a")
+    queue.complete("a", 1, CHUNKS[1], translator.TranslationResult(translator.STATUS_FATAL, error="bad"), 3, "job-a")
+    queue.complete("a", 2, CHUNKS[2], _ok(CHUNKS[2]), 3, "job-a")
+    assert queue.is_finished()
+    assert not queue.resume_job("job-b")
+    assert queue.resume_job("job-a")
+    assert queue.lease("b", 10, 60, "job-a") == [(1, CHUNKS[1])]
+
+def test_workers_of_a_previous_job_are_locked_out(tmp_path):
+    queue = _queue(tmp_path)
+    queue.lease("a", 1, 60, "job-a")
+    queue.start_job("job-b", {"model": "other"})
+    queue.add_chunks(CHUNKS)
+    assert queue.lease("a", 10, 60, "job-a") == []
+    assert not queue.complete("a", 0, CHUNKS[0], _ok(CHUNKS[0]), 3, "job-a")
+    assert [index for index, _ in queue.lease("b", 10, 60, "job-b")] == [0, 1, 2]
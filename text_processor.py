@@ -1,75 +1,284 @@
 # File: text_processor.py
 
+import hashlib
+import math
 import re
 
+# CJK sentences end in full-width punctuation, optionally inside closing quotes/brackets,
+# and are not followed by a space
+_CJK_SENTENCE_END = r'(?:(?<=[。！？])(?![」』）”’])|(?<=[。！？][」』）”’]))\s*'
+
 def split_by_sentences(text_block):
     """Splits a block of text into sentences."""
-    sentences = re.split(r'(?<=[.?!])\s+(?=[A-Z"\'])|(?<=[.?!])\n+', text_block)
+    sentences = re.split(r'(?<=[.?!])\s+(?=[A-Z"\'])|(?<=[.?!])\n+|' + _CJK_SENTENCE_END, text_block)
     return [s.strip() for s in sentences if s and s.strip()]
 
+# Rough characters-per-token ratios of Gemini's tokenizer for scripts that tokenize
+# much more densely than Latin text; everything else counts as ~4 characters per token.
+_DEFAULT_CHARS_PER_TOKEN = 4.0
+_CHARS_PER_TOKEN_BY_SCRIPT = [
+    (re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]'), 1.3), # CJK, kana, hangul
+    (re.compile(r'[\u0900-\u0dff]'), 2.5), # Indic scripts, Devanagari through Sinhala
+    (re.compile(r'[\u0370-\u04ff\u0600-\u06ff]'), 3.0), # Greek, Cyrillic, Arabic
+]
+
+# Expected output tokens per source token when translating English-like text into
+# the target language. Indic scripts expand the most.
+OUTPUT_EXPANSION_BY_LANGUAGE = {
+    "hi": 2.2, "mr": 2.3, "ne": 2.3, "bn": 2.4, "pa": 2.3, "gu": 2.3,
+    "ta": 2.8, "te": 2.6, "kn": 2.7, "ml": 3.0,
+    "ja": 1.3, "zh": 1.1, "ko": 1.4, "ru": 1.5, "ar": 1.6,
+}
+DEFAULT_OUTPUT_EXPANSION = 1.2
+
+CHAPTER_SPLIT_REGEX = r'(\n## .*?\n)'
+
+def estimate_tokens(text):
+    """Estimates the model token count of a piece of text from its per-script character counts."""
+    if text.isascii():
+        return max(1, math.ceil(len(text) / _DEFAULT_CHARS_PER_TOKEN))
+    tokens = 0.0
+    remaining_chars = len(text)
+    for script_pattern, chars_per_token in _CHARS_PER_TOKEN_BY_SCRIPT:
+        script_chars = len(script_pattern.findall(text))
+        tokens += script_chars / chars_per_token
+        remaining_chars -= script_chars
+    tokens += remaining_chars / _DEFAULT_CHARS_PER_TOKEN
+    return max(1, math.ceil(tokens))
+
+def estimate_output_tokens(text, target_language_code, tokenizer=None):
+    """Estimates how many tokens the translation of `text` into the target language will take."""
+    input_tokens = tokenizer(text) if tokenizer else estimate_tokens(text)
+    expansion = OUTPUT_EXPANSION_BY_LANGUAGE.get(target_language_code, DEFAULT_OUTPUT_EXPANSION)
+    return math.ceil(input_tokens * expansion)
+
+def _iter_text_units(full_text):
+    """Yields (is_heading, text) units: chapter heading lines and the paragraphs between them."""
+    # re.split with a capture group puts the chapter markers at odd positions
+    segments = re.split(CHAPTER_SPLIT_REGEX, full_text)
+    for i, segment_text in enumerate(segments):
+        if not segment_text.strip():
+            continue
+        if i % 2 == 1:
+            yield True, segment_text.strip()
+            continue
+        for paragraph in segment_text.strip().split('\n\n'):
+            para = paragraph.strip()
+            if para:
+                yield False, para
+
+# Text buffered without a paragraph break before the streaming splitter cuts at a line end
+_MAX_PENDING_CHARS = 32 * 1024
+_SENTENCE_LINE_END_REGEX = re.compile(r'[.?!。！？]["\'\u201d\u2019)」』）]*\n')
+_CJK_SENTENCE_END_REGEX = re.compile(r'[。！？][」』）”’]*')
+
+def _find_streaming_cut(pending):
+    """
+    Where to cut buffered text: returns (end of the part to release, start of the part to
+    keep), or None to keep buffering. Past _MAX_PENDING_CHARS there is always a cut, so
+    text without any breaks (e.g. CJK or Thai without newlines) never piles up.
+    """
+    paragraph_break = pending.rfind('\n\n')
+    if paragraph_break >= 0:
+        # Cut between the two newlines: no heading line or paragraph can span that point
+        return paragraph_break + 1, paragraph_break + 1
+    if len(pending) < _MAX_PENDING_CHARS:
+        return None
+    # No blank lines (e.g. PDF text, one line per row): cut at a line end, preferably one
+    # that ends a sentence. The newline stays on both sides, so a heading line still matches.
+    sentence_ends = [match.end() - 1 for match in _SENTENCE_LINE_END_REGEX.finditer(pending)]
+    newline = sentence_ends[-1] if sentence_ends else pending.rfind('\n')
+    if newline > 0:
+        return newline + 1, newline
+    # No line breaks either: after the last full-width sentence end, else at a space
+    cjk_sentence_ends = [match.end() for match in _CJK_SENTENCE_END_REGEX.finditer(pending, len(pending) - _MAX_PENDING_CHARS)]
+    if cjk_sentence_ends and cjk_sentence_ends[-1] < len(pending):
+        return cjk_sentence_ends[-1], cjk_sentence_ends[-1]
+    space = pending.rfind(' ')
+    if space > 0:
+        return space, space + 1
+    return len(pending), len(pending)  # Hard cut
+
+def _iter_text_units_streaming(text_segments):
+    """
+    Like _iter_text_units, but over an iterable of text pieces whose concatenation is the
+    book text. Pieces are buffered up to the last paragraph break seen (or, in text without
+    blank lines, up to a line end once _MAX_PENDING_CHARS are buffered), so units are
+    yielded while later pieces are still being extracted.
+    """
+    pending = ""
+    for piece in text_segments:
+        pending += piece
+        cut = _find_streaming_cut(pending)
+        if cut is None:
+            continue
+        yield from _iter_text_units(pending[:cut[0]])
+        pending = pending[cut[1]:]
+    yield from _iter_text_units(pending)
+
+class RepeatedParagraphFilter:
+    """
+    Finds paragraphs that already appeared earlier in the book (copyright notices, scene
+    separators, letters quoted twice) and marks each repeat to become a chunk of its own.
+    The engine translates identical chunks once and fans the translation out, so every
+    occurrence after the first standalone one costs no request. Only 8-byte hashes of
+    paragraphs of at least `min_chars` characters are kept.
+    """
+
+    def __init__(self, min_chars=40):
+        self.min_chars = min_chars
+        self._seen = set()
+        self.repeated_paragraphs = 0
+        self.repeated_chars = 0
+
+    def filter_units(self, units, fits=None):
+        """Passes (is_heading, text) units through, turning repeated paragraphs into standalone units."""
+        for is_heading, para in units:
+            if not is_heading and len(para) >= self.min_chars:
+                digest = hashlib.blake2b(para.encode("utf-8"), digest_size=8).digest()
+                if digest not in self._seen:
+                    self._seen.add(digest)
+                elif fits is None or fits(para):
+                    self.repeated_paragraphs += 1
+                    self.repeated_chars += len(para)
+                    yield True, para  # Standalone, like a heading
+                    continue
+            yield is_heading, para
+
+def _iter_chunks(units, budget, measure, paragraph_separator_cost, sentence_separator_cost):
+    """
+    Core chunker shared by the character- and token-budgeted entry points.
+    Accumulates paragraphs until `budget` (in units of `measure`) is reached, keeps every
+    chapter heading (or other standalone unit) as its own chunk, splits oversized paragraphs
+    by sentence and oversized sentences by length. Buffers are lists joined once per chunk,
+    so the run is linear.
+    """
+    buffer_parts, buffer_cost = [], 0
+    for is_heading, para in units:
+        # A chapter marker (or repeated paragraph) closes the current buffer and becomes a chunk of its own
+        if is_heading:
+            if buffer_parts:
+                yield "\n\n".join(buffer_parts)
+                buffer_parts, buffer_cost = [], 0
+            yield para
+            continue
+
+        para_cost = measure(para)
+
+        if para_cost > budget:
+            # Flush buffer before handling the oversized paragraph
+            if buffer_parts:
+                yield "\n\n".join(buffer_parts)
+                buffer_parts, buffer_cost = [], 0
+            # Split oversized paragraph by sentence
+            sentence_parts, sentence_cost = [], 0
+            for sentence in split_by_sentences(para):
+                cost = measure(sentence)
+                if sentence_cost + cost + sentence_separator_cost <= budget:
+                    sentence_parts.append(sentence)
+                    sentence_cost += cost + sentence_separator_cost
+                    continue
+                if sentence_parts:
+                    yield " ".join(sentence_parts)
+                sentence_parts, sentence_cost = [], 0
+                # Handle case where a single sentence is too long
+                if cost > budget:
+                    slice_chars = max(1, len(sentence) * budget // cost)
+                    for j in range(0, len(sentence), slice_chars):
+                        yield sentence[j:j+slice_chars]
+                else:
+                    sentence_parts.append(sentence)
+                    sentence_cost = cost + sentence_separator_cost
+            if sentence_parts:
+                yield " ".join(sentence_parts)
+        elif buffer_cost + para_cost + paragraph_separator_cost <= budget:
+            if buffer_parts:
+                buffer_cost += paragraph_separator_cost
+            buffer_parts.append(para)
+            buffer_cost += para_cost
+        else:
+            if buffer_parts:
+                yield "\n\n".join(buffer_parts)
+            buffer_parts, buffer_cost = [para], para_cost
+    if buffer_parts:
+        yield "\n\n".join(buffer_parts)
+
 def chunk_text_sensibly(full_text, max_chars_per_chunk):
     """
-    Definitive version: Tries to accumulate paragraphs to fill chunks close to max_chars_per_chunk.
+    Tries to accumulate paragraphs to fill chunks close to max_chars_per_chunk.
     Handles chapters, oversized paragraphs, and oversized sentences gracefully.
     """
     print(f"  Chunking text... Max chars per chunk: {max_chars_per_chunk}")
-    # The full chunk_text_sensibly function from the notebook goes here
-    # (Pasted from your provided code for completeness)
     if not full_text or not full_text.strip():
         return []
-    final_chunks = []
-    chapter_split_regex = r'(\n## .*?\n)'
-    # Use re.split to keep the chapter markers as separate elements
-    segments = re.split(chapter_split_regex, full_text)
-
-    # Process segments
-    for i in range(len(segments)):
-        segment_text = segments[i]
-        if not segment_text.strip():
-            continue
+    final_chunks = [chunk for chunk in _iter_chunks(_iter_text_units(full_text), max_chars_per_chunk, len, 2, 1) if chunk]
+    print(f"    Text divided into {len(final_chunks)} final small chunk(s).")
+    return final_chunks
+
+def _token_measure(max_input_tokens, max_output_tokens, target_language_code, tokenizer=None):
+    """Token cost of a text against `max_input_tokens`, scaled so the output limit is respected too."""
+    count_tokens = tokenizer or estimate_tokens
+    expansion = OUTPUT_EXPANSION_BY_LANGUAGE.get(target_language_code, DEFAULT_OUTPUT_EXPANSION)
+    # Scale input tokens so one budget covers both limits: whichever is tighter wins
+    scale = max(1.0, expansion * max_input_tokens / max_output_tokens)
+    def measure(text):
+        return math.ceil(count_tokens(text) * scale)
+    return measure
 
-        # If the segment is a chapter marker
-        if re.match(chapter_split_regex, segment_text):
-            final_chunks.append(segment_text.strip())
+def split_segment_by_tokens(segment, max_input_tokens, max_output_tokens, target_language_code, tokenizer=None):
+    """
+    Splits one text block that must be translated on its own (e.g. an EPUB element) into
+    parts within the budgets of iter_chunks_by_tokens: whole lines are kept together where
+    they fit, oversized lines are split by sentence. Returns (parts, separators), where
+    separators[i] ("\n" or " ") goes between the translations of parts i and i+1.
+    """
+    measure = _token_measure(max_input_tokens, max_output_tokens, target_language_code, tokenizer)
+    if measure(segment) <= max_input_tokens:
+        return [segment], []
+    parts, separators = [], []
+    current_lines, current_cost = [], 0
+    for line in segment.split("\n"):
+        cost = measure(line) if line else 0
+        if cost <= max_input_tokens and (not current_lines or current_cost + cost <= max_input_tokens):
+            current_lines.append(line)
+            current_cost += cost
             continue
-        
-        # If it's a content segment
-        paragraphs = segment_text.strip().split('\n\n')
-        current_chunk_buffer = ""
-        for paragraph in paragraphs:
-            para = paragraph.strip()
-            if not para:
-                continue
-
-            if len(para) > max_chars_per_chunk:
-                # Flush buffer before handling the oversized paragraph
-                if current_chunk_buffer:
-                    final_chunks.append(current_chunk_buffer)
-                    current_chunk_buffer = ""
-                # Split oversized paragraph by sentence
-                sentences = split_by_sentences(para)
-                current_sentence_buffer = ""
-                for sentence in sentences:
-                    if len(current_sentence_buffer) + len(sentence) + 1 <= max_chars_per_chunk:
-                        current_sentence_buffer += sentence + " "
-                    else:
-                        if current_sentence_buffer: final_chunks.append(current_sentence_buffer.strip())
-                        # Handle case where a single sentence is too long
-                        if len(sentence) > max_chars_per_chunk:
-                            for j in range(0, len(sentence), max_chars_per_chunk):
-                                final_chunks.append(sentence[j:j+max_chars_per_chunk])
-                            current_sentence_buffer = ""
-                        else:
-                            current_sentence_buffer = sentence + " "
-                if current_sentence_buffer: final_chunks.append(current_sentence_buffer.strip())
-            elif len(current_chunk_buffer) + len(para) + 2 <= max_chars_per_chunk:
-                if current_chunk_buffer: current_chunk_buffer += "\n\n"
-                current_chunk_buffer += para
-            else:
-                final_chunks.append(current_chunk_buffer)
-                current_chunk_buffer = para
-        if current_chunk_buffer: final_chunks.append(current_chunk_buffer)
-    
-    final_chunks = [chunk for chunk in final_chunks if chunk] # Cleanup empty chunks
-    print(f"    Text divided into {len(final_chunks)} final small chunk(s).")
-    return final_chunks
\ No newline at end of file
+        if current_lines:
+            parts.append("\n".join(current_lines))
+            separators.append("\n")
+            current_lines, current_cost = [], 0
+        if cost <= max_input_tokens:
+            current_lines, current_cost = [line], cost
+            continue
+        for piece in _iter_chunks([(False, line)], max_input_tokens, measure, 0, 0):
+            parts.append(piece)
+            separators.append(" ")
+        separators[-1] = "\n"
+    if current_lines:
+        parts.append("\n".join(current_lines))
+    else:
+        separators.pop()
+    return parts, separators
+
+def iter_chunks_by_tokens(text_segments, max_input_tokens, max_output_tokens, target_language_code, tokenizer=None, repeated_paragraphs=None):
+    """
+    Token-budgeted chunker: every chunk fits within `max_input_tokens` of source text and its
+    expected translation fits within `max_output_tokens`, using the per-language output
+    expansion. `tokenizer` is an optional callable text -> token count; by default the
+    per-script estimator is used. Keeps the chapter/paragraph/sentence rules of
+    chunk_text_sensibly.
+    `text_segments` is an iterable of text pieces (e.g. from file_handler.iter_book_text);
+    chunks are yielded as soon as they are complete.
+    With a RepeatedParagraphFilter, repeated paragraphs become chunks of their own.
+    """
+    print(f"  Chunking text... Max tokens per chunk: {max_input_tokens} in / {max_output_tokens} out")
+    measure = _token_measure(max_input_tokens, max_output_tokens, target_language_code, tokenizer)
+    num_chunks = 0
+    units = _iter_text_units_streaming(text_segments)
+    if repeated_paragraphs:
+        units = repeated_paragraphs.filter_units(units, fits=lambda para: measure(para) <= max_input_tokens)
+    for chunk in _iter_chunks(units, max_input_tokens, measure, 0, 0):
+        if chunk:
+            num_chunks += 1
+            yield chunk
+    print(f"    Text divided into {num_chunks} final small chunk(s).")
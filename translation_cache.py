@@ -0,0 +1,91 @@
+# File: translation_cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+import translator
+
+class TranslationCache:
+    """
+    Disk-backed, content-addressed store of finished chunk translations (SQLite).
+    Entries are keyed by a hash of the chunk text, target language, model name and
+    prompt template version. The least recently used entries are evicted once the
+    stored translations grow past `max_size_bytes`.
+    """
+
+    def __init__(self, db_path, max_size_bytes=500 * 1024 * 1024):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(db_path)
+        # A lost tail of the cache only costs a re-translation, so skip per-commit fsyncs
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " key TEXT PRIMARY KEY,"
+            " translation TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+        self._conn.commit()
+        self._total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+
+    @staticmethod
+    def make_key(chunk_text, target_language_code, model_name, prompt_version=translator.PROMPT_TEMPLATE_VERSION):
+        """Returns the cache key for one chunk translation request."""
+        payload = json.dumps([chunk_text, target_language_code, model_name, prompt_version], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Returns the cached translation for `key`, or None on a miss."""
+        row = self._conn.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._conn.execute("UPDATE translations SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+        return row[0]
+
+    def put(self, key, translated_text):
+        """Stores a finished translation. Error markers are never cached."""
+        if not translated_text or translator.is_failed_translation(translated_text):
+            return False
+        size = len(key) + len(translated_text.encode("utf-8"))
+        previous = self._conn.execute("SELECT size FROM translations WHERE key = ?", (key,)).fetchone()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO translations (key, translation, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, translated_text, size, time.time())
+        )
+        self._total_size += size - (previous[0] if previous else 0)
+        self._evict()
+        self._conn.commit()
+        return True
+
+    def _evict(self):
+        if self._total_size <= self.max_size_bytes:
+            return
+        evicted_keys = []
+        for key, size in self._conn.execute("SELECT key, size FROM translations ORDER BY last_used ASC"):
+            if self._total_size <= self.max_size_bytes:
+                break
+            evicted_keys.append((key,))
+            self._total_size -= size
+        self._conn.executemany("DELETE FROM translations WHERE key = ?", evicted_keys)
+
+    def stats(self):
+        """Hit/miss counters and current size of the cache."""
+        entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": self._total_size}
+
+    def close(self):
+        self._conn.close()
@@ -1,38 +1,345 @@
 # File: translator.py
 
-def translate_single_chunk(text_to_translate, target_language_name, target_language_code, model):
+import hashlib
+import re
+from dataclasses import dataclass
+
+import text_processor
+
+# Bump this whenever the prompt wording changes so cached translations are not re-used
+PROMPT_TEMPLATE_VERSION = "2"
+
+# Delimiters used when several small segments share one request
+PACKED_SEGMENT_MARKER = "<<<SEGMENT {number}>>>"
+PACKED_END_MARKER = "<<<END>>>"
+
+# Every prompt is a static prefix shared by the whole job followed by a per-chunk suffix
+# that starts with this line, so the prefix can be served from the API's context cache.
+PROMPT_SUFFIX_HEADER = "--- Task ---"
+
+def build_prompt_prefix(target_language_name, target_language_code, glossary=None, style_notes=""):
     """
-    Translates a single chunk of text synchronously using the provided Gemini model.
+    Builds the static part of every prompt of a job: the instructions plus book-level
+    context, i.e. a glossary ({source term: translation}) and free-form style notes.
     """
-    if not model:
-        print("    ❌ ERROR: Gemini model not provided to the translation function.")
-        return f"[TRANSLATION FAILED: MODEL NOT FOUND - {text_to_translate[:50]}]"
-
-    prompt = (
-        f"You are an expert literary translator. Your task is to translate the following segment of a book into {target_language_name} ({target_language_code}).\n"
+    prefix = (
+        f"You are an expert literary translator. Your task is to translate segments of a book into {target_language_name} ({target_language_code}).\n"
         f"Preserve the original meaning, tone, style, and any structural elements like chapter headings (lines starting with '##') or paragraph breaks.\n"
-        f"Translate naturally and fluently. Output only the translated text for the segment below, without any extra commentary.\n\n"
+        f"Translate naturally and fluently, without any extra commentary.\n"
+    )
+    if glossary:
+        terms = "\n".join(f"- {term}: {translation}" for term, translation in glossary.items())
+        prefix += f"\nUse these translations of names and terms consistently:\n{terms}\n"
+    if style_notes:
+        prefix += f"\nStyle notes for this book:\n{style_notes.strip()}\n"
+    return prefix
+
+def build_chunk_prompt_suffix(text_to_translate, target_language_name):
+    """Builds the per-chunk part of a prompt for a single chunk."""
+    return (
+        f"\n{PROMPT_SUFFIX_HEADER}\n"
+        f"Output only the translated text for the segment below.\n\n"
         f"--- Text Segment to Translate ---\n"
         f"{text_to_translate}\n"
         f"--- End of Text Segment ---\n\n"
         f"Translated segment in {target_language_name}:"
     )
 
+def build_packed_prompt_suffix(texts_to_translate, target_language_name):
+    """Builds the per-request part of a prompt asking for several numbered segments at once."""
+    numbered_segments = "\n".join(
+        f"{PACKED_SEGMENT_MARKER.format(number=number)}\n{text}"
+        for number, text in enumerate(texts_to_translate, start=1)
+    )
+    return (
+        f"\n{PROMPT_SUFFIX_HEADER}\n"
+        f"Translate the following {len(texts_to_translate)} numbered segments separately and keep every marker line such as '{PACKED_SEGMENT_MARKER.format(number=1)}' exactly as it is, followed by that segment's translation. "
+        f"Finish with the line '{PACKED_END_MARKER}'. Output nothing else.\n\n"
+        f"{numbered_segments}\n"
+        f"{PACKED_END_MARKER}\n\n"
+        f"Translated segments in {target_language_name}:"
+    )
+
+def build_translation_prompt(text_to_translate, target_language_name, target_language_code):
+    """Builds the instruction prompt sent to the model for a single chunk."""
+    return build_prompt_prefix(target_language_name, target_language_code) + build_chunk_prompt_suffix(text_to_translate, target_language_name)
+
+def create_prefix_cache(model, prefix, ttl_seconds=3600):
+    """
+    Registers a prompt prefix with the model API's context cache.
+    Returns (model bound to the cached prefix, cache handle), or None where context
+    caching is unsupported or refused (e.g. a prefix below the API's minimum size).
+    """
     try:
-        response = model.generate_content(prompt)
-        # Check for safety ratings and blockages
-        if response.prompt_feedback.block_reason:
-            reason = response.prompt_feedback.block_reason
-            print(f"        ⚠️ Blocked by API: {reason}")
-            return f"[CHUNK BLOCKED: {reason} - {text_to_translate[:50]}]"
+        if hasattr(model, "create_cached_content"):  # fake_gemini and other local stand-ins
+            return model.create_cached_content(prefix, ttl_seconds)
+        import datetime
+        import google.generativeai as genai
+        from google.generativeai import caching
+        cached_content = caching.CachedContent.create(
+            model=model.model_name, system_instruction=prefix, ttl=datetime.timedelta(seconds=ttl_seconds)
+        )
+        return genai.GenerativeModel.from_cached_content(cached_content=cached_content), cached_content
+    except Exception as e:
+        print(f"    ⚠️ Context caching unavailable ({type(e).__name__}: {e}); the prompt prefix will be sent with every request.")
+        return None
+
+class PromptContext:
+    """
+    The static prompt prefix of one job (instructions, glossary, style notes) and the
+    token accounting for it. After register(), requests reference the prefix through the
+    API's context cache and send only their per-chunk suffix; otherwise the prefix is
+    sent inline with every request.
+    """
+
+    def __init__(self, target_language_name, target_language_code, glossary=None, style_notes=""):
+        self.target_language_name = target_language_name
+        self.prefix = build_prompt_prefix(target_language_name, target_language_code, glossary, style_notes)
+        self.has_book_context = bool(glossary or style_notes)
+        self.prefix_tokens = text_processor.estimate_tokens(self.prefix)
+        self.cached_model = None
+        self.cache_handle = None
+        self.requests = 0
+        self.cached_requests = 0
+        self.suffix_tokens = 0
+        self.reported_prompt_tokens = 0  # Usage the API reported, next to the estimates above
+        self.reported_cached_tokens = 0
+
+    @property
+    def prompt_version(self):
+        """Cache-key version: translations made with a glossary or style notes are kept apart."""
+        if not self.has_book_context:
+            return PROMPT_TEMPLATE_VERSION
+        return f"{PROMPT_TEMPLATE_VERSION}:{hashlib.sha256(self.prefix.encode('utf-8')).hexdigest()[:16]}"
+
+    def register(self, model, ttl_seconds=3600, min_prefix_tokens=0):
+        """Registers the prefix with the API's context cache once per job. Returns True if it is cached."""
+        if self.prefix_tokens < min_prefix_tokens:
+            print(f"    Prompt prefix is {self.prefix_tokens} tokens, below the {min_prefix_tokens}-token context cache minimum; sending it inline.")
+            return False
+        created = create_prefix_cache(model, self.prefix, ttl_seconds)
+        if not created:
+            return False
+        self.cached_model, self.cache_handle = created
+        print(f"    🗂️ Prompt prefix ({self.prefix_tokens} tokens) registered with the context cache.")
+        return True
+
+    def prompt_and_model(self, suffix, model):
+        """Returns the prompt to send for `suffix` and the model to send it to."""
+        self.requests += 1
+        self.suffix_tokens += text_processor.estimate_tokens(suffix)
+        if self.cached_model is not None:
+            self.cached_requests += 1
+            return suffix, self.cached_model
+        return self.prefix + suffix, model
+
+    def record_usage(self, result):
+        """Adds the prompt token usage the API reported for one request (a TranslationResult)."""
+        self.reported_prompt_tokens += result.prompt_tokens
+        self.reported_cached_tokens += result.cached_tokens
+
+    def token_report(self):
+        """Estimated prefix and suffix tokens of this job's requests, and the API-reported usage."""
+        return {
+            "requests": self.requests,
+            "prefix_tokens": self.prefix_tokens,
+            "inline_prefix_tokens": (self.requests - self.cached_requests) * self.prefix_tokens,
+            "cached_prefix_tokens": self.cached_requests * self.prefix_tokens,
+            "suffix_tokens": self.suffix_tokens,
+            "reported_prompt_tokens": self.reported_prompt_tokens,
+            "reported_cached_tokens": self.reported_cached_tokens,
+        }
+
+    def release(self):
+        """Deletes the context cache entry, if one was created."""
+        if self.cache_handle is not None:
+            try:
+                self.cache_handle.delete()
+            except Exception as e:
+                print(f"    ⚠️ Could not delete the context cache entry: {type(e).__name__} - {e}")
+            self.cache_handle = None
+            self.cached_model = None
+
+def split_packed_response(response_text, expected_count):
+    """
+    Splits a packed response back into per-segment translations.
+    Returns None if the markers are missing, out of order, or any segment is empty.
+    """
+    parts = re.split(r'<<<SEGMENT (\d+)>>>', response_text.split(PACKED_END_MARKER)[0])
+    numbers = [int(number) for number in parts[1::2]]
+    if numbers != list(range(1, expected_count + 1)):
+        return None
+    translations = [part.strip() for part in parts[2::2]]
+    if not all(translations):
+        return None
+    return translations
+
+def is_failed_translation(translated_text):
+    """Returns True if the text is one of our error markers rather than a translation."""
+    return translated_text.startswith("[CHUNK") or translated_text.startswith("[TRANSLATION FAILED")
+
+# --- Structured results ---
+
+STATUS_OK = "ok"
+STATUS_RATE_LIMITED = "rate_limited"  # 429 / quota exhausted: retry after a pause
+STATUS_TRANSIENT = "transient"  # 5xx, timeouts, empty responses: retry
+STATUS_BLOCKED = "blocked"  # Safety block: retrying the same text will not help
+STATUS_FATAL = "fatal"  # Bad request, auth errors, missing model: do not retry
+
+RETRYABLE_STATUSES = (STATUS_RATE_LIMITED, STATUS_TRANSIENT)
+
+# A packed response that cannot be split back into one translation per segment
+SEGMENT_COUNT_MISMATCH_ERROR = "SEGMENT COUNT MISMATCH"
+
+@dataclass
+class TranslationResult:
+    """Outcome of one translation request."""
+    status: str
+    text: str = ""
+    error: str = ""
+    retry_after: float = None  # Seconds the API asked us to wait, if it said
+    attempts: int = 1
+    segments: list = None  # Per-segment translations of a packed request
+    latency: float = 0.0  # Seconds spent waiting on the API, over all attempts
+    source: str = "api"  # "api", "cache", "journal" or "batch"
+    prompt_tokens: int = 0  # Usage reported by the API, including any cached prefix
+    cached_tokens: int = 0
 
+    @property
+    def ok(self):
+        return self.status == STATUS_OK
+
+    @property
+    def retryable(self):
+        return self.status in RETRYABLE_STATUSES
+
+    def output_text(self, source_text=""):
+        """The translation, or the error marker written in place of a chunk that failed for good."""
+        if self.ok:
+            return self.text
+        if self.status == STATUS_BLOCKED:
+            return f"[CHUNK BLOCKED: {self.error} - {source_text[:50]}]"
+        return f"[CHUNK FAILED: {self.status.upper()} {self.error} - {source_text[:50]}]"
+
+_BLOCKED_ERRORS = ("BlockedPromptException", "StopCandidateException")
+_RATE_LIMIT_ERRORS = ("ResourceExhausted", "TooManyRequests")
+_TRANSIENT_ERRORS = ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+                     "Aborted", "Unknown", "TimeoutError", "ConnectionError", "ServerDisconnectedError")
+
+def _retry_after_from_exception(e):
+    """Reads a retry hint from the exception, e.g. 'retry_delay { seconds: 37 }' in a 429."""
+    retry_after = getattr(e, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+    match = re.search(r'retry[_ ]?(?:delay|in|after)\D{0,20}?(\d+(?:\.\d+)?)', str(e), flags=re.IGNORECASE)
+    return float(match.group(1)) if match else None
+
+def classify_exception(e):
+    """Maps an exception from the API client to a TranslationResult status."""
+    names = {cls.__name__ for cls in type(e).__mro__}
+    code = getattr(e, "code", None)
+    if names & set(_BLOCKED_ERRORS):
+        return STATUS_BLOCKED
+    if names & set(_RATE_LIMIT_ERRORS) or code == 429:
+        return STATUS_RATE_LIMITED
+    if names & set(_TRANSIENT_ERRORS) or (isinstance(code, int) and code >= 500):
+        return STATUS_TRANSIENT
+    return STATUS_FATAL
+
+def _result_from_exception(e):
+    return TranslationResult(classify_exception(e), error=f"EXCEPTION {type(e).__name__}", retry_after=_retry_after_from_exception(e))
+
+def _result_from_response(response):
+    """Turns a generate_content response into a TranslationResult."""
+    # Check for safety ratings and blockages
+    if response.prompt_feedback.block_reason:
+        return TranslationResult(STATUS_BLOCKED, error=str(response.prompt_feedback.block_reason))
+    try:
         translated_text = response.text.strip()
-        if not translated_text:
-             print(f"        ⚠️ Empty translation from API.")
-             return f"[CHUNK FAILED: EMPTY RESPONSE - {text_to_translate[:50]}]"
-        
-        return translated_text
+    except ValueError as e:
+        # .text raises when the candidate was stopped, e.g. by a safety filter on the output
+        return TranslationResult(STATUS_BLOCKED, error=f"NO TEXT ({e})")
+    if not translated_text:
+        return TranslationResult(STATUS_TRANSIENT, error="EMPTY RESPONSE")
+    usage = getattr(response, "usage_metadata", None)
+    return TranslationResult(
+        STATUS_OK,
+        text=translated_text,
+        prompt_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+        cached_tokens=getattr(usage, "cached_content_token_count", 0) or 0,
+    )
+
+def _prompt_and_model(suffix, target_language_name, target_language_code, model, prompt_context):
+    if prompt_context:
+        return prompt_context.prompt_and_model(suffix, model)
+    return build_prompt_prefix(target_language_name, target_language_code) + suffix, model
+
+def _report(result):
+    if result.status == STATUS_BLOCKED:
+        print(f"        ⚠️ Blocked by API: {result.error}")
+    elif not result.ok:
+        print(f"    ❌ Translation failed ({result.status}): {result.error}")
+
+def translate_single_chunk(text_to_translate, target_language_name, target_language_code, model, prompt_context=None):
+    """
+    Translates a single chunk of text synchronously using the provided Gemini model.
+    With a PromptContext, its (possibly cached) prefix replaces the default instructions.
+    """
+    if not model:
+        print("    ❌ ERROR: Gemini model not provided to the translation function.")
+        return f"[TRANSLATION FAILED: MODEL NOT FOUND - {text_to_translate[:50]}]"
+
+    suffix = build_chunk_prompt_suffix(text_to_translate, target_language_name)
+    prompt, model = _prompt_and_model(suffix, target_language_name, target_language_code, model, prompt_context)
 
+    try:
+        result = _result_from_response(model.generate_content(prompt))
+    except Exception as e:
+        result = _result_from_exception(e)
+    _report(result)
+    return result.output_text(text_to_translate)
+
+async def translate_chunk_async(text_to_translate, target_language_name, target_language_code, model, prompt_context=None):
+    """
+    Translates a single chunk of text with the model's async generate call and returns a
+    TranslationResult whose status says whether (and how) a failed request may be retried.
+    """
+    if not model:
+        print("    ❌ ERROR: Gemini model not provided to the translation function.")
+        return TranslationResult(STATUS_FATAL, error="MODEL NOT FOUND")
+
+    suffix = build_chunk_prompt_suffix(text_to_translate, target_language_name)
+    prompt, model = _prompt_and_model(suffix, target_language_name, target_language_code, model, prompt_context)
+
+    try:
+        result = _result_from_response(await model.generate_content_async(prompt))
+    except Exception as e:
+        result = _result_from_exception(e)
+    _report(result)
+    return result
+
+async def translate_packed_chunks_async(texts_to_translate, target_language_name, target_language_code, model, prompt_context=None):
+    """
+    Translates several small chunks in one request with the model's async generate call.
+    Returns a TranslationResult whose `segments` hold the translations in order. A response
+    that cannot be split back into exactly one translation per chunk is a transient failure.
+    """
+    if not model:
+        print("    ❌ ERROR: Gemini model not provided to the translation function.")
+        return TranslationResult(STATUS_FATAL, error="MODEL NOT FOUND")
+
+    suffix = build_packed_prompt_suffix(texts_to_translate, target_language_name)
+    prompt, model = _prompt_and_model(suffix, target_language_name, target_language_code, model, prompt_context)
+
+    try:
+        result = _result_from_response(await model.generate_content_async(prompt))
     except Exception as e:
-        print(f"    ❌ EXCEPTION during translation: {type(e).__name__} - {e}")
-        return f"[CHUNK FAILED: EXCEPTION {type(e).__name__} - {text_to_translate[:50]}]"
\ No newline at end of file
+        result = _result_from_exception(e)
+    if result.ok:
+        result.segments = split_packed_response(result.text, len(texts_to_translate))
+        if result.segments is None:
+            print(f"        ⚠️ Packed response did not contain {len(texts_to_translate)} segments.")
+            result = TranslationResult(STATUS_TRANSIENT, error=SEGMENT_COUNT_MISMATCH_ERROR)
+    else:
+        _report(result)
+    return result
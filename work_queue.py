@@ -0,0 +1,320 @@
+# File: work_queue.py
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+import scheduler
+import translator
+
+# A shared queue of chunks for horizontal scaling. A coordinator writes a book's chunks
+# into one SQLite file; any number of worker processes, on this machine or on others that
+# mount the same file system, lease batches of chunks from it, translate them and write
+# the results back. A worker keeps its leases alive with heartbeats; chunks whose lease
+# runs out (a crashed or stopped worker) go back to the queue for someone else.
+# Once every chunk is done the coordinator assembles the output in chunk order.
+# SQLite's file locking must work on the shared file system (local disks do; many network
+# file systems do not), and the hosts' clocks must agree to well within a lease.
+
+STATE_PENDING = "pending"
+STATE_LEASED = "leased"
+STATE_DONE = "done"
+
+def make_worker_id():
+    """Unique name of one worker process, e.g. 'host-a:4182:9f3c'."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:4]}"
+
+class WorkQueue:
+    """
+    SQLite-backed queue of one translation job's chunks with leases and heartbeats.
+    The job settings the coordinator stores with it (language, model, prompt context)
+    are what every worker translates with, so all workers agree on the job.
+    """
+
+    def __init__(self, db_path, busy_timeout_seconds=60):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        # Autocommit mode: multi-statement updates take an explicit write lock (BEGIN IMMEDIATE)
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout_seconds, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " idx INTEGER PRIMARY KEY,"
+            " text TEXT NOT NULL,"
+            " state TEXT NOT NULL,"
+            " owner TEXT,"
+            " lease_expires REAL,"
+            " rounds INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT,"
+            " translation TEXT,"
+            " error TEXT,"
+            " source TEXT,"
+            " fingerprint TEXT)"  # Job fingerprint of the worker that leased the chunk last
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "fingerprint" not in columns:  # A queue file from before leases carried the job
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN fingerprint TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_state ON chunks (state, idx)")
+
+    def _get(self, key):
+        row = self._conn.execute("SELECT value FROM job WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO job (key, value) VALUES (?, ?)", (key, json.dumps(value, ensure_ascii=False)))
+
+    @property
+    def fingerprint(self):
+        return self._get("fingerprint")
+
+    @property
+    def settings(self):
+        """The job settings stored by the coordinator, or None before it has set up the queue."""
+        return self._get("settings")
+
+    @property
+    def enqueue_complete(self):
+        """True once the coordinator has written every chunk of the book."""
+        return self._get("total_chunks") is not None
+
+    @property
+    def aborted(self):
+        """True if the coordinator gave up on the job (e.g. extraction failed); workers stop."""
+        return bool(self._get("aborted"))
+
+    def start_job(self, fingerprint, settings):
+        """Empties the queue and sets it up for a new job."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        self._conn.execute("DELETE FROM chunks")
+        self._conn.execute("DELETE FROM job")
+        self._set("fingerprint", fingerprint)
+        self._set("settings", settings)
+        self._conn.execute("COMMIT")
+
+    def resume_job(self, fingerprint):
+        """
+        Re-opens the queue for the same job: chunks that failed for good go back to the
+        queue and an abort is lifted. Returns False if the queue belongs to a different job.
+        """
+        if self.fingerprint != fingerprint:
+            return False
+        self._conn.execute("DELETE FROM job WHERE key = ?", ("aborted",))
+        self._conn.execute(
+            "UPDATE chunks SET state = ?, owner = NULL, lease_expires = NULL, rounds = 0 WHERE state = ? AND status != ?",
+            (STATE_PENDING, STATE_DONE, translator.STATUS_OK)
+        )
+        return True
+
+    def add_chunks(self, chunks, batch_size=500):
+        """
+        Writes a (possibly lazy) iterable of chunks to the queue in batches, so workers can
+        start on the first ones while the rest of the book is still being chunked.
+        Chunks already in the queue (from an interrupted enqueue) are kept as they are.
+        Returns the number of chunks.
+        """
+        batch = []
+        total = 0
+        for index, chunk in enumerate(chunks):
+            batch.append((index, chunk, STATE_PENDING))
+            total += 1
+            if len(batch) >= batch_size:
+                self._conn.executemany("INSERT OR IGNORE INTO chunks (idx, text, state) VALUES (?, ?, ?)", batch)
+                batch = []
+        self._conn.executemany("INSERT OR IGNORE INTO chunks (idx, text, state) VALUES (?, ?, ?)", batch)
+        self._set("total_chunks", total)
+        return total
+
+    def abort_job(self):
+        """Tells the workers to stop; the chunks done so far are kept for a resume."""
+        self._set("aborted", True)
+
+    def lease(self, owner, max_chunks, lease_seconds, fingerprint):
+        """
+        Leases up to `max_chunks` pending or expired chunks to `owner`, a worker set up for
+        the job `fingerprint`; returns [(index, text)]. Nothing is leased once the queue
+        holds a different job (a coordinator restarted with other settings).
+        """
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._get("fingerprint") != fingerprint:
+                self._conn.execute("COMMIT")
+                return []
+            rows = self._conn.execute(
+                "SELECT idx, text FROM chunks WHERE state = ? OR (state = ? AND lease_expires < ?) ORDER BY idx LIMIT ?",
+                (STATE_PENDING, STATE_LEASED, now, max_chunks)
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE chunks SET state = ?, owner = ?, lease_expires = ?, fingerprint = ? WHERE idx = ?",
+                [(STATE_LEASED, owner, now + lease_seconds, fingerprint, index) for index, _ in rows]
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def heartbeat(self, owner, lease_seconds):
+        """Extends every lease `owner` holds; returns how many it still holds."""
+        return self._conn.execute(
+            "UPDATE chunks SET lease_expires = ? WHERE state = ? AND owner = ?",
+            (time.time() + lease_seconds, STATE_LEASED, owner)
+        ).rowcount
+
+    def complete(self, owner, index, chunk, result, max_rounds, fingerprint):
+        """
+        Stores a chunk's TranslationResult, translated for the job `fingerprint`. A retryable
+        failure goes back to the queue (for another worker or key) up to `max_rounds` times,
+        after which it is final, like every other result. Returns False if the result was not
+        needed, e.g. because the lease expired and another worker finished the chunk first,
+        or the queue was restarted for a different job.
+        """
+        if result.retryable:
+            updated = self._conn.execute(
+                "UPDATE chunks SET state = ?, owner = NULL, lease_expires = NULL, rounds = rounds + 1, status = ?, error = ?"
+                " WHERE idx = ? AND text = ? AND fingerprint = ? AND state = ? AND owner = ? AND rounds < ?",
+                (STATE_PENDING, result.status, result.error, index, chunk, fingerprint, STATE_LEASED, owner, max_rounds)
+            ).rowcount
+            if updated:
+                return True
+            # Out of rounds: the failure is final, but only on a lease this worker still holds
+            condition, params = "state = ? AND owner = ?", (STATE_LEASED, owner)
+        else:
+            # A late success is still used, unless another worker has already stored a result
+            condition, params = "state != ?", (STATE_DONE,)
+        return self._conn.execute(
+            "UPDATE chunks SET state = ?, owner = ?, lease_expires = NULL, rounds = rounds + 1, status = ?, translation = ?, error = ?, source = ?"
+            f" WHERE idx = ? AND text = ? AND fingerprint = ? AND {condition}",
+            (STATE_DONE, owner, result.status, result.text if result.ok else None, result.error, result.source, index, chunk, fingerprint) + params
+        ).rowcount > 0
+
+    def release(self, owner):
+        """Returns the chunks `owner` still holds to the queue, e.g. when a worker stops."""
+        return self._conn.execute(
+            "UPDATE chunks SET state = ?, owner = NULL, lease_expires = NULL WHERE state = ? AND owner = ?",
+            (STATE_PENDING, STATE_LEASED, owner)
+        ).rowcount
+
+    def counts(self):
+        """Chunk counts by state, the number of workers holding leases, and failed chunks."""
+        counts = {STATE_PENDING: 0, STATE_LEASED: 0, STATE_DONE: 0}
+        for state, count in self._conn.execute("SELECT state, COUNT(*) FROM chunks GROUP BY state"):
+            counts[state] = count
+        counts["workers"] = self._conn.execute("SELECT COUNT(DISTINCT owner) FROM chunks WHERE state = ?", (STATE_LEASED,)).fetchone()[0]
+        counts["failed"] = self._conn.execute("SELECT COUNT(*) FROM chunks WHERE state = ? AND status != ?", (STATE_DONE, translator.STATUS_OK)).fetchone()[0]
+        return counts
+
+    def is_finished(self):
+        """True once the whole book is enqueued and every chunk is done."""
+        counts = self.counts()
+        return self.enqueue_complete and not counts[STATE_PENDING] and not counts[STATE_LEASED]
+
+    def iter_results(self):
+        """Yields (index, chunk text, TranslationResult) for every chunk in order."""
+        last_index = -1
+        while True:
+            rows = self._conn.execute(
+                "SELECT idx, text, status, translation, error, source FROM chunks WHERE idx > ? ORDER BY idx LIMIT 500",
+                (last_index,)
+            ).fetchall()
+            if not rows:
+                return
+            for index, text, status, translation, error, source in rows:
+                yield index, text, translator.TranslationResult(status or translator.STATUS_TRANSIENT, text=translation or "", error=error or "", source=source or "api")
+            last_index = rows[-1][0]
+
+    def close(self):
+        self._conn.close()
+
+def wait_for_job_settings(queue, poll_seconds):
+    """Blocks until a coordinator has set up the queue and returns its job settings."""
+    while queue.settings is None:
+        print(f"  ⏳ Waiting for a coordinator to set up {os.path.basename(queue.db_path)}...")
+        time.sleep(poll_seconds)
+    return queue.settings
+
+class QueueWorker:
+    """
+    Pulls leased batches of chunks from a WorkQueue and translates them with a
+    TranslationEngine on an ApiKeyPool, until every chunk of the job is done.
+    The queue's job settings must be in place (see wait_for_job_settings).
+    `config` uses the keys of main.py's CONFIG: the engine settings, plus
+    "queue_lease_chunks", "queue_lease_seconds", "queue_poll_seconds" and
+    "queue_max_rounds_per_chunk".
+    """
+
+    def __init__(self, queue, key_pool, config, cache=None, worker_id=None):
+        self.queue = queue
+        self.key_pool = key_pool
+        self.config = config
+        self.cache = cache
+        self.worker_id = worker_id or make_worker_id()
+        self.chunks_done = 0
+        self.engine = None
+
+    async def _keep_leases_alive(self):
+        lease_seconds = self.config["queue_lease_seconds"]
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            self.queue.heartbeat(self.worker_id, lease_seconds)
+
+    async def run(self):
+        """
+        Works until the queue is finished, aborted or taken over by a different job;
+        returns the number of chunks this worker translated.
+        """
+        fingerprint = self.queue.fingerprint
+        settings = self.queue.settings
+        prompt_context = translator.PromptContext(settings["target_language_name"], settings["target_language_code"],
+                                                  settings.get("glossary"), settings.get("style_notes", ""))
+        self.engine = scheduler.TranslationEngine(
+            None,
+            settings["target_language_name"],
+            settings["target_language_code"],
+            None,
+            max_concurrency=self.config["max_concurrent_requests"],
+            cache=self.cache,
+            model_name=settings["model"],
+            pack_chunk_tokens=self.config["pack_small_chunks_below_tokens"],
+            max_pack_tokens=self.config["max_tokens_per_packed_request"],
+            max_output_tokens=self.config["max_output_tokens_per_chunk"],
+            max_attempts=self.config["max_attempts_per_chunk"],
+            verbose=self.config.get("verbose_chunk_logs", False),
+            prompt_context=prompt_context,
+            deduplicate_chunks=self.config.get("deduplicate_paragraphs", True),
+            key_pool=self.key_pool
+        )
+        print(f"👷 Worker {self.worker_id} translating into {settings['target_language_name']} with {len(self.key_pool.keys)} API key(s).")
+        heartbeat = asyncio.create_task(self._keep_leases_alive())
+        try:
+            while True:
+                if self.queue.aborted:
+                    print(f"  🛑 The coordinator aborted the job; worker {self.worker_id} stops.")
+                    break
+                if self.queue.fingerprint != fingerprint:
+                    print(f"  🛑 The queue was restarted for a different job; worker {self.worker_id} stops (start it again to join the new job).")
+                    break
+                leased = self.queue.lease(self.worker_id, self.config["queue_lease_chunks"], self.config["queue_lease_seconds"], fingerprint)
+                if not leased:
+                    if self.queue.is_finished():
+                        break
+                    # Chunks are still being enqueued, or leased by workers that may yet drop them
+                    await asyncio.sleep(self.config["queue_poll_seconds"])
+                    continue
+                indexes = [index for index, _ in leased]
+                print(f"  📥 Leased chunks {indexes[0]+1}-{indexes[-1]+1} ({len(leased)} chunk(s)).")
+                async for position, result in self.engine.translate_stream([text for _, text in leased], max_buffered_chunks=len(leased)):
+                    index, chunk = leased[position]
+                    if self.queue.complete(self.worker_id, index, chunk, result, self.config["queue_max_rounds_per_chunk"], fingerprint) and result.ok:
+                        self.chunks_done += 1
+        finally:
+            heartbeat.cancel()
+            self.queue.release(self.worker_id)
+        return self.chunks_done